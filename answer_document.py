@@ -0,0 +1,164 @@
+"""
+answer_document.py - Разбор ответа CoinMarketCap AI за один проход
+
+Ответ разбирается один раз, дальше все форматтеры (Telegram, тред,
+одиночный твит) работают с готовой структурой, а не делят текст заново:
+
+- parse_answer(answer): секции ответа (TLDR / Deep Dive) без строк
+  "Researched for ..."
+- parse_document(text): документ TLDR (dict):
+    text       - текст (обрезан до max_length)
+    lines      - непустые строки: {"kind", "text", "clean", "start", "partial"}
+                 kind: "price" | "bullet" | "heading" | "paragraph"
+    paragraphs - тексты обычных строк
+    bullets    - пункты списка и строки с ценами (без маркера, длиннее 10 символов)
+    prices     - строки с ценами
+    sentences  - предложения: [(start, end), ...] - смещения в text
+    intro      - первое предложение (sentences[0], если оно заканчивается
+                 на .!?) или None
+    truncated  - текст обрезан по max_length посреди строки: последняя
+                 строка и предложение - обрывок (строка помечена "partial"
+                 и в bullets / prices не попадает)
+"""
+
+import re
+
+# ========================================
+# НАСТРОЙКИ
+# ========================================
+
+TLDR_MARKER = 'TLDR'
+DEEP_DIVE_MARKER = 'Deep Dive'
+RESEARCHED_PREFIX = 'Researched for'
+
+# Заголовок: короткая строка, которая заканчивается двоеточием или тире
+HEADING_ENDINGS = (':', '–', '—')
+HEADING_MAX_LENGTH = 50
+
+# Пункт списка короче этого не попадает в bullets
+MIN_BULLET_LENGTH = 10
+
+CRYPTO_PRICE_PATTERN = re.compile(r'^[A-Z]{2,10}\s*\([+-]?\d')
+LIST_ITEM_PATTERN = re.compile(r'^[\-•\*]\s+|^\d+\.\s+')
+LINE_PATTERN = re.compile(r'[^\n]+')
+# Конец предложения: .!? и пробел после (3.5% и BTC.D не режутся)
+SENTENCE_BREAK_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+# ========================================
+# СЕКЦИИ ОТВЕТА
+# ========================================
+
+def parse_answer(answer):
+    """
+    Секции ответа за один проход по строкам
+    Returns: {"text": ответ без "Researched for", "tldr": str | None, "deep_dive": str | None}
+    tldr - текст после первого TLDR до Deep Dive (None если TLDR нет)
+    """
+    kept = []
+    offset = 0
+    tldr_start = deep_dive_start = -1
+
+    for line in (answer or "").split('\n'):
+        if line.strip().startswith(RESEARCHED_PREFIX):
+            continue
+
+        if tldr_start == -1:
+            position = line.find(TLDR_MARKER)
+            if position != -1:
+                tldr_start = offset + position
+        if deep_dive_start == -1:
+            position = line.find(DEEP_DIVE_MARKER)
+            if position != -1:
+                deep_dive_start = offset + position
+
+        kept.append(line)
+        offset += len(line) + 1
+
+    text = '\n'.join(kept)
+
+    tldr = deep_dive = None
+    if tldr_start != -1:
+        end = deep_dive_start if deep_dive_start != -1 else len(text)
+        tldr = text[tldr_start:end].strip().replace(TLDR_MARKER, '', 1).strip()
+    if deep_dive_start != -1:
+        deep_dive = text[deep_dive_start:].strip().replace(DEEP_DIVE_MARKER, '', 1).strip()
+
+    return {"text": text, "tldr": tldr, "deep_dive": deep_dive}
+
+# ========================================
+# ДОКУМЕНТ TLDR
+# ========================================
+
+def classify_line(line):
+    """Тип строки (line уже без пробелов по краям)"""
+    if CRYPTO_PRICE_PATTERN.match(line):
+        return "price"
+    if LIST_ITEM_PATTERN.match(line):
+        return "bullet"
+    if line.endswith(HEADING_ENDINGS) and len(line) < HEADING_MAX_LENGTH:
+        return "heading"
+    return "paragraph"
+
+
+def parse_document(text, max_length=None):
+    """Документ TLDR (см. описание модуля)"""
+    text = str(text or "").strip()
+    truncated = False
+    if max_length and len(text) > max_length:
+        truncated = text[max_length] != '\n'
+        text = text[:max_length]
+
+    lines = []
+    paragraphs = []
+    bullets = []
+    prices = []
+
+    for match in LINE_PATTERN.finditer(text):
+        line = match.group(0).strip()
+        if not line:
+            continue
+
+        kind = classify_line(line)
+        clean = LIST_ITEM_PATTERN.sub('', line, count=1).strip() if kind in ("price", "bullet") else line
+        partial = truncated and match.end() == len(text)
+        lines.append({"kind": kind, "text": line, "clean": clean, "start": match.start(), "partial": partial})
+
+        if kind == "paragraph":
+            paragraphs.append(line)
+        if partial:
+            continue
+        if kind in ("price", "bullet") and len(clean) > MIN_BULLET_LENGTH:
+            bullets.append(clean)
+        if kind == "price":
+            prices.append(line)
+
+    sentences = []
+    start = 0
+    for match in SENTENCE_BREAK_PATTERN.finditer(text):
+        sentences.append((start, match.start()))
+        start = match.end()
+    if start < len(text):
+        sentences.append((start, len(text)))
+
+    # Первое предложение по тем же границам (3.5% не обрывает intro);
+    # единственное предложение обрезанного текста - обрывок
+    intro = text[:sentences[0][1]].strip() if sentences and not (truncated and len(sentences) == 1) else None
+    if intro and intro[-1] not in '.!?':
+        intro = None
+
+    return {
+        "text": text,
+        "lines": lines,
+        "paragraphs": paragraphs,
+        "bullets": bullets,
+        "prices": prices,
+        "sentences": sentences,
+        "intro": intro,
+        "truncated": truncated,
+    }
+
+
+def document_sentences(doc):
+    """Тексты предложений документа"""
+    text = doc["text"]
+    return [text[start:end].strip() for start, end in doc["sentences"]]
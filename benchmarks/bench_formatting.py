@@ -0,0 +1,174 @@
+"""
+benchmarks/bench_formatting.py - Производительность форматирования
+
+Прогоняет записанные ответы CMC AI (benchmarks/corpus.json: все группы
+вопросов + крайние случаи: TLDR на MAX_TEXT_LENGTH, много emoji, длинные
+списки, ответ без TLDR) через каждую стадию форматирования и выводит:
+- ops/sec (один op = один ответ корпуса, медиана по --runs замерам)
+- выделения памяти на op (tracemalloc, отдельный проход): пик временных
+  выделений и сколько осталось занято после op (рост кэшей / утечки)
+
+Кэш рендера очищается перед каждым op render_post - замеряется холодный рендер.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_formatting.py
+    python benchmarks/bench_formatting.py --runs 7 --min-time 0.5
+    python benchmarks/bench_formatting.py --save bench.json              # записать результат
+    python benchmarks/bench_formatting.py --compare bench.json --max-slowdown 0.25
+
+Код возврата 1, если при --compare какая-то операция медленнее базовой
+больше чем на --max-slowdown.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_FILE = os.path.join(REPO_ROOT, "benchmarks", "corpus.json")
+
+DEFAULT_RUNS = 5
+DEFAULT_MIN_TIME = 0.2  # секунды на один замер
+DEFAULT_MAX_SLOWDOWN = 0.25
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["answers"]
+
+
+def build_operations(corpus):
+    """
+    Операции для замера: [(имя, функция(entry))]
+    Входы (TLDR, документ, конфиг) готовятся заранее - каждая операция
+    замеряет только свою стадию
+    """
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("TWITTER_ENABLED", "false")
+
+    import parser
+    import formatting
+    import answer_document
+
+    config = parser.QUESTION_DISPLAY_CONFIG
+    default = {"title": "Crypto Update", "hashtags": "#Crypto #Bitcoin"}
+
+    for entry in corpus:
+        entry["raw_tldr"] = parser.extract_tldr_from_answer(entry["answer"])
+        entry["tldr"] = parser.clean_question_specific_text(entry["question"], entry["raw_tldr"])
+        entry["doc"] = answer_document.parse_document(entry["tldr"], formatting.MAX_TEXT_LENGTH)
+        entry["title"] = config.get(entry["question"], default)["title"]
+        entry["hashtags"] = config.get(entry["question"], default)["hashtags"]
+        entry["telegram"] = formatting.format_telegram_improved(entry["title"], entry["tldr"],
+                                                                entry["hashtags"], entry["doc"])
+
+    def render_post_cold(e):
+        formatting.clear_render_cache()
+        return formatting.render_post(e["question"], e["answer"], parser.extract_tldr_from_answer,
+                                      parser.clean_question_specific_text, config)
+
+    return [
+        ("extract_tldr_from_answer", lambda e: parser.extract_tldr_from_answer(e["answer"])),
+        ("clean_question_specific_text", lambda e: parser.clean_question_specific_text(e["question"], e["raw_tldr"])),
+        ("parse_document", lambda e: answer_document.parse_document(e["tldr"], formatting.MAX_TEXT_LENGTH)),
+        ("format_telegram_improved", lambda e: formatting.format_telegram_improved(e["title"], e["tldr"], e["hashtags"])),
+        ("format_twitter_thread", lambda e: formatting.format_twitter_thread(e["title"], e["tldr"], e["hashtags"])),
+        ("format_twitter_single", lambda e: formatting.format_twitter_single(e["title"], e["tldr"], e["hashtags"])),
+        ("split_telegram_message", lambda e: formatting.split_telegram_message(e["telegram"], 1024)),
+        ("truncate_for_twitter", lambda e: formatting.truncate_for_twitter(e["tldr"], 200)),
+        ("extract_short_text_safe", lambda e: formatting.extract_short_text_safe(e["tldr"], 200)),
+        ("get_twitter_length", lambda e: formatting.get_twitter_length(e["tldr"])),
+        ("render_post (без кэша)", render_post_cold),
+    ]
+
+
+def time_operation(fn, corpus, min_time):
+    """ops/sec за один замер: весь корпус повторяется, пока не пройдет min_time"""
+    ops = 0
+    start = time.perf_counter()
+    while True:
+        for entry in corpus:
+            fn(entry)
+        ops += len(corpus)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return ops / elapsed
+
+
+def measure_allocations(fn, corpus):
+    """Выделения на op в байтах: (средний пик, в среднем осталось занято) - проход под tracemalloc"""
+    fn(corpus[0])  # прогрев: ленивые импорты и кэши модулей не считаются
+    peak_total = 0
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for entry in corpus:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            fn(entry)
+            peak_total += tracemalloc.get_traced_memory()[1] - base
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    return peak_total / len(corpus), max(0, retained) / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк форматирования на записанном корпусе")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME)
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    parser.add_argument("--save", help="записать результат в JSON (базовая линия)")
+    parser.add_argument("--compare", help="сравнить с базовой линией из JSON")
+    parser.add_argument("--max-slowdown", type=float, default=DEFAULT_MAX_SLOWDOWN)
+    args = parser.parse_args()
+
+    # Форматтеры пишут в лог на каждый вызов - в замер это не входит
+    logging.disable(logging.WARNING)
+
+    corpus = load_corpus(args.corpus)
+    operations = build_operations(corpus)
+
+    groups = sorted({entry["group"] for entry in corpus})
+    print(f"⏱️  Форматирование: {len(corpus)} ответов ({', '.join(groups)}), {args.runs} замеров (медиана)")
+    print(f"  {'операция':<30} {'ops/sec':>10} {'пик KB/op':>10} {'осталось KB/op':>15}")
+
+    results = {}
+    for name, fn in operations:
+        rate = statistics.median(time_operation(fn, corpus, args.min_time) for _ in range(max(1, args.runs)))
+        peak, retained = measure_allocations(fn, corpus)
+        results[name] = {"ops_per_sec": rate, "alloc_peak_bytes": peak, "alloc_retained_bytes": retained}
+        print(f"  {name:<30} {rate:>10.0f} {peak / 1024:>10.1f} {retained / 1024:>15.2f}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"corpus": len(corpus), "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Результат записан: {args.save}")
+
+    ok = True
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+
+        print(f"\n📊 Сравнение с {args.compare} (допуск {args.max_slowdown:.0%}):")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            ratio = result["ops_per_sec"] / baseline[name]["ops_per_sec"]
+            slower = ratio < 1 - args.max_slowdown
+            ok = ok and not slower
+            print(f"  {'✗' if slower else '✓'} {name:<30} {ratio:>6.2f}x")
+
+        print("\n✓ Регрессий нет" if ok else "\n✗ Есть регрессии производительности")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+benchmarks/startup.py - Бюджет времени старта парсера
+
+Импортирует parser.py в чистом процессе (python -X importtime) несколько раз
+и выводит:
+- время импорта каждого модуля проекта и тяжелых зависимостей
+- общее время импорта parser и RSS процесса до начала реальной работы
+- какие тяжелые зависимости (playwright, bs4, tweepy, requests) попали в импорт
+
+Запуск из корня репозитория:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --max-import-ms 200 --max-rss-mb 40
+    python benchmarks/startup.py --deps   # дополнительно: стоимость самих зависимостей
+
+Код возврата 1, если бюджет превышен или тяжелая зависимость импортируется при старте.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROJECT_MODULES = ["parser", "formatting", "answer_document", "outbox", "pipeline", "twitter_budget", "profiles", "similarity"]
+HEAVY_MODULES = ["playwright", "bs4", "tweepy", "requests"]
+
+DEFAULT_RUNS = 5
+DEFAULT_MAX_IMPORT_MS = 150
+DEFAULT_MAX_RSS_MB = 50
+
+# Выполняется в дочернем процессе: импорт + замер RSS до любой работы
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import parser
+elapsed = time.perf_counter() - start
+
+rss_kb = None
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024
+
+print(json.dumps({"import_s": elapsed, "rss_kb": rss_kb, "modules": sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """Разбирает вывод -X importtime: {модуль верхнего уровня: cumulative мкс}"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cum, name = line[len("import time:"):].split("|")
+            cum_us = int(cum.strip())
+        except ValueError:
+            continue  # строка заголовка
+        module = name.strip()
+        cumulative[module] = max(cumulative.get(module, 0), cum_us)
+    return cumulative
+
+
+def run_probe(probe=PROBE):
+    """Один холодный старт в отдельном процессе"""
+    env = dict(os.environ)
+    env.setdefault("TWITTER_ENABLED", "false")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Импорт упал:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["importtime"] = parse_importtime(proc.stderr)
+    return result
+
+
+def measure_dependency(module):
+    """Стоимость импорта одной зависимости (мс) или None если не установлена"""
+    probe = f"import time; s = time.perf_counter(); import {module}; print(time.perf_counter() - s)"
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=REPO_ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return float(proc.stdout.strip()) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет времени старта parser.py")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--max-import-ms", type=float, default=DEFAULT_MAX_IMPORT_MS)
+    parser.add_argument("--max-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB)
+    parser.add_argument("--deps", action="store_true", help="замерить импорт тяжелых зависимостей")
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(max(1, args.runs))]
+
+    import_ms = statistics.median(r["import_s"] * 1000 for r in runs)
+    rss_mb = statistics.median(r["rss_kb"] / 1024 for r in runs)
+
+    print(f"⏱️  Старт parser.py: {len(runs)} запусков (медиана)")
+    print(f"  {'модуль':<16} {'импорт, мс':>11}")
+    for module in PROJECT_MODULES + HEAVY_MODULES:
+        values = [r["importtime"].get(module) for r in runs]
+        values = [v for v in values if v is not None]
+        if values:
+            print(f"  {module:<16} {statistics.median(values) / 1000:>11.1f}")
+
+    print(f"\n  Импорт parser: {import_ms:.1f} мс (бюджет {args.max_import_ms:.0f} мс)")
+    print(f"  RSS после импорта: {rss_mb:.1f} MB (бюджет {args.max_rss_mb:.0f} MB)")
+
+    loaded_heavy = sorted({m for r in runs for m in HEAVY_MODULES if m in r["modules"]})
+
+    if args.deps:
+        print("\n📦 Стоимость зависимостей (импортируются лениво):")
+        for module in HEAVY_MODULES:
+            cost = measure_dependency(module)
+            print(f"  {module:<16} {'не установлен' if cost is None else f'{cost:.1f} мс':>11}")
+
+    ok = True
+    if loaded_heavy:
+        print(f"\n✗ При импорте загружены тяжелые зависимости: {', '.join(loaded_heavy)}")
+        ok = False
+    if import_ms > args.max_import_ms:
+        print(f"✗ Превышен бюджет времени импорта: {import_ms:.1f} > {args.max_import_ms:.0f} мс")
+        ok = False
+    if rss_mb > args.max_rss_mb:
+        print(f"✗ Превышен бюджет памяти: {rss_mb:.1f} > {args.max_rss_mb:.0f} MB")
+        ok = False
+
+    print("\n✓ Бюджет старта соблюден" if ok else "\n✗ Бюджет старта превышен")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
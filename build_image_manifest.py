@@ -0,0 +1,154 @@
+"""
+build_image_manifest.py - Сборка манифеста картинок для публикаций
+
+Сканирует Images1/ и записывает images_manifest.json: имя файла,
+sha256 содержимого, размеры (ширина x высота) и размер в байтах.
+Парсер выбирает картинки только из манифеста - без сетевых проверок
+при запуске. Размеры читаются из заголовка JPEG (SOFn) / PNG (IHDR)
+без сторонних библиотек.
+
+Запуск из корня репозитория:
+    python build_image_manifest.py          # пересобрать манифест
+    python build_image_manifest.py --check  # проверить, что манифест актуален (код 1 если нет)
+"""
+
+import os
+import sys
+import json
+import struct
+import hashlib
+import argparse
+
+IMAGES_DIR = 'Images1'
+MANIFEST_FILE = 'images_manifest.json'
+MANIFEST_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Маркеры SOF (Start Of Frame) - в них лежат размеры JPEG
+# (C4 - DHT, C8 - JPG, CC - DAC: это не SOF)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def jpeg_dimensions(data):
+    """Размеры JPEG из первого SOF сегмента: (width, height) или None"""
+    if data[:2] != b'\xff\xd8':
+        return None
+
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        pos += 2
+
+        # Заполняющие 0xFF и маркеры без длины
+        if marker == 0xFF:
+            pos -= 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue
+
+        (length,) = struct.unpack('>H', data[pos:pos + 2])
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 7 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 3:pos + 7])
+            return width, height
+        pos += length
+
+    return None
+
+
+def png_dimensions(data):
+    """Размеры PNG из заголовка IHDR: (width, height) или None"""
+    if data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', data[16:24])
+
+
+def describe_image(path):
+    """Запись манифеста для одного файла"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    dimensions = jpeg_dimensions(data) or png_dimensions(data)
+    if not dimensions:
+        raise ValueError(f"не удалось прочитать размеры {path}")
+
+    return {
+        "file": os.path.basename(path),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "width": dimensions[0],
+        "height": dimensions[1],
+        "bytes": len(data)
+    }
+
+
+def _sort_key(name):
+    """10.jpg, 11.jpg, ..., 100.jpg - числовой порядок, остальные по имени"""
+    stem = os.path.splitext(name)[0]
+    return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+
+
+def build_manifest(images_dir=IMAGES_DIR):
+    """Сканирует папку и возвращает манифест (dict)"""
+    names = sorted(
+        (n for n in os.listdir(images_dir) if n.lower().endswith(IMAGE_EXTENSIONS)),
+        key=_sort_key
+    )
+
+    images = []
+    for name in names:
+        try:
+            images.append(describe_image(os.path.join(images_dir, name)))
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️ {name} пропущен: {e}")
+
+    return {"version": MANIFEST_VERSION, "directory": images_dir, "images": images}
+
+
+def load_manifest(path=MANIFEST_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(manifest, path=MANIFEST_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Манифест картинок для публикаций")
+    parser.add_argument('--check', action='store_true',
+                        help="не записывать, а проверить что манифест соответствует папке")
+    parser.add_argument('--images-dir', default=IMAGES_DIR)
+    parser.add_argument('--output', default=MANIFEST_FILE)
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.images_dir)
+    total_mb = sum(img["bytes"] for img in manifest["images"]) / 1024 / 1024
+
+    if args.check:
+        if load_manifest(args.output) != manifest:
+            print(f"✗ {args.output} устарел - запустите: python build_image_manifest.py")
+            return 1
+        print(f"✓ {args.output} актуален: {len(manifest['images'])} картинок")
+        return 0
+
+    write_manifest(manifest, args.output)
+    print(f"✓ {args.output}: {len(manifest['images'])} картинок, {total_mb:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
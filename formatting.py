@@ -1,8 +1,38 @@
 """
 formatting.py - Модуль улучшенного форматирования для Telegram и Twitter
-Version: 3.1.1
+Version: 3.3.0
 Senior QA Approved - Production Ready
 
+ОБНОВЛЕНО В v3.3.0:
+- TweetLength: длина твита по правилам twitter-text (веса символов,
+  emoji-последовательности, ссылки = 23); ASCII без ссылок - просто len,
+  префиксные суммы строятся только для обрезки
+- Обрезка за один проход, без разрезания emoji и ссылок (truncate_for_twitter)
+- answer_document: ответ разбирается один раз (строки, пункты, цены,
+  предложения), все форматтеры работают с готовым документом
+- Контекстные эмодзи: паттерны компилируются один раз в одну регулярку,
+  ищутся только целые слова ("ai" больше не находится в "against")
+- Кэш рендера (LRU по хэшу текста, заголовка, хэштегов, платформы и версии):
+  повторы и рассылка по профилям не форматируют текст заново
+- Тред: pack_thread раскладывает пункты по MAX_THREAD_TWEETS твитам в
+  порядке чтения (самый длинный влезающий префикс), хэштеги - в последний
+  твит, если влезают; твитов из одних хэштегов и обрывков строк больше нет
+- format_batch: форматирование пакета ответов без отправки (опционально
+  в нескольких процессах)
+- RenderSpec: конфиг отображения компилируется один раз в неизменяемые спеки
+  (эмодзи, заголовки, длины, сокращенные хэштеги, фразы для очистки);
+  вариация вопроса получает общие для своей группы заголовок и хэштеги
+- Модуль только форматирует: send_improved удален, публикация - через
+  outbox в parser.py
+
+ОБНОВЛЕНО В v3.2.0:
+- Telegram и Twitter публикуются параллельно (без фиксированной паузы)
+- Независимые таймауты для каждой платформы
+- render_post: форматирование отделено от отправки (для outbox)
+- render_post всегда готовит одиночный твит (запасной вариант для треда)
+- split_telegram_message: разбивка по UTF-16 с сохранением HTML тегов
+- extract_clean_tldr / render_tldr: отдельные шаги для конвейера
+
 ОБНОВЛЕНО В v3.1.1:
 - Оптимизация для Twitter Free tier
 - Мини-треды: максимум 3 твита
@@ -23,8 +53,18 @@ Senior QA Approved - Production Ready
 """
 
 import re
+import html
 import time
 import logging
+import hashlib
+import threading
+import unicodedata
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+
+from answer_document import parse_document, CRYPTO_PRICE_PATTERN
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +72,7 @@ logger = logging.getLogger(__name__)
 # ВЕРСИЯ И НАСТРОЙКИ
 # ========================================
 
-__version__ = "3.1.1"
+__version__ = "3.3.0"
 
 # НАСТРОЙКА РЕЖИМА TWITTER
 TWITTER_MODE = "thread"  # "thread" или "single"
@@ -49,11 +89,18 @@ EMOJI_DETECTION_TEXT_LIMIT = 2000
 MIN_TWITTER_SPACE = 50
 MAX_TWITTER_LENGTH = 280
 MAX_TELEGRAM_LENGTH = 4000
+MAX_TELEGRAM_MESSAGE_UNITS = 4096  # лимит Telegram: UTF-16 единиц после разбора HTML
 MAX_THREAD_TWEETS = 3  # Оптимизировано для Free tier (было 8)
 
 # Пауза между твитами (увеличена для Free tier rate limits)
 TWEET_DELAY = 15  # секунды (было 2)
 
+# Пакетное форматирование: процессы имеют смысл только для больших пакетов
+FORMAT_BATCH_MIN_PER_WORKER = 16
+
+# Кэш отрендеренных публикаций (записей, самые старые вытесняются)
+RENDER_CACHE_SIZE = 256
+
 # Эмодзи для заголовков
 TITLE_EMOJI_MAP = {
     "Crypto Insights": "💡",
@@ -65,6 +112,13 @@ TITLE_EMOJI_MAP = {
     "Altcoin Performance": "⚡"
 }
 
+# Конфиг по умолчанию (вопрос не найден в конфиге отображения)
+DEFAULT_DISPLAY_CONFIG = {"title": "Crypto Update", "hashtags": "#Crypto #Bitcoin"}
+DEFAULT_TITLE_EMOJI = "📰"
+
+# Сокращенные варианты хэштегов (первые N), если полные не помещаются
+HASHTAG_FALLBACK_COUNTS = (5, 3, 2)
+
 # Контекстные паттерны
 CONTEXT_PATTERNS = [
     ("bullish|rally|surge|pump|moon", "🚀", 1),
@@ -78,9 +132,54 @@ CONTEXT_PATTERNS = [
     ("defi|decentralized finance", "✨", 3),
 ]
 
-# Compiled regex
-CRYPTO_PRICE_PATTERN = re.compile(r'^[A-Z]{2,10}\s*\([+-]?\d')
-LIST_ITEM_PATTERN = re.compile(r'^[\-•\*]\s+|^\d+\.\s+')
+# Compiled regex (CRYPTO_PRICE_PATTERN - в answer_document)
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+')
+
+# Токены Telegram сообщения: тег, HTML entity, перенос строки, пробел, слово, одиночный < или &
+TELEGRAM_TOKEN_PATTERN = re.compile(
+    r'<[^<>]*>|&(?:#\d+|#[xX][0-9a-fA-F]+|[a-zA-Z]+);|\n|[^\S\n]|[^<&\s]+|[<&]'
+)
+HTML_TAG_NAME_PATTERN = re.compile(r'^</?\s*([a-zA-Z][a-zA-Z0-9-]*)')
+HTML_TAG_PATTERN = re.compile(r'<[^<>]*>')
+
+# Взвешенная длина твита (конфигурация twitter-text v3):
+# символы из диапазонов ниже весят 1, остальные 2, emoji-последовательность 2, ссылка 23
+TWITTER_LIGHT_RANGES = [(0, 4351), (8192, 8205), (8208, 8223), (8242, 8247)]
+TWITTER_DEFAULT_WEIGHT = 2
+TWITTER_EMOJI_WEIGHT = 2
+TWITTER_URL_LENGTH = 23
+
+# Таблица весов для кодовых точек до конца легких диапазонов (дальше всегда 2)
+_TWITTER_WEIGHT_TABLE = bytearray([TWITTER_DEFAULT_WEIGHT]) * (TWITTER_LIGHT_RANGES[-1][1] + 1)
+for _start, _end in TWITTER_LIGHT_RANGES:
+    _TWITTER_WEIGHT_TABLE[_start:_end + 1] = b'\x01' * (_end - _start + 1)
+_TWITTER_WEIGHT_TABLE = bytes(_TWITTER_WEIGHT_TABLE)
+
+# Символы веса 2 (все вне легких диапазонов): длина = len + их количество
+_TWITTER_HEAVY_PATTERN = re.compile('[^' + ''.join(
+    f'\\U{start:08x}-\\U{end:08x}' for start, end in TWITTER_LIGHT_RANGES) + ']')
+
+# Emoji-последовательность: флаг или emoji (+ вариант/тон кожи) через ZWJ.
+# Шаблон начинается с класса символов - re ищет кандидатов по нему, не пробуя
+# каждую позицию; флаг (два regional indicator) - ветка после первого символа.
+# Keycap начинается с цифры, поэтому ищется отдельно и только при наличии U+20E3
+_EMOJI_BASE = (
+    '[\u00A9\u00AE\u203C\u2049\u2122\u2139\u2194-\u2199\u21A9\u21AA\u231A-\u23FF'
+    '\u24C2\u25AA-\u27BF\u2934\u2935\u2B05-\u2B55\u3030\u303D\u3297\u3299'
+    '\U0001F000-\U0001FAFF]'
+)
+_EMOJI_MODIFIER = '(?:\uFE0F|[\U0001F3FB-\U0001F3FF])*'
+_REGIONAL_INDICATOR = '[\U0001F1E6-\U0001F1FF]'
+TWITTER_EMOJI_PATTERN = re.compile(
+    f'{_EMOJI_BASE}(?:(?<={_REGIONAL_INDICATOR}){_REGIONAL_INDICATOR}'
+    f'|{_EMOJI_MODIFIER}(?:\u200D{_EMOJI_BASE}{_EMOJI_MODIFIER})*)'
+)
+TWITTER_KEYCAP_PATTERN = re.compile('[#*0-9]\uFE0F?\u20E3')
+
+# Ссылка (Twitter сокращает любую до t.co - 23 символа); финальная пунктуация не входит
+TWITTER_URL_PATTERN = re.compile(
+    r'(?:https?://|www\.)[^\s<>"]*[^\s<>".,:;!?)\]\'»]', re.IGNORECASE
+)
 
 # ========================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
@@ -99,42 +198,168 @@ def safe_str(value, default="", max_length=None):
     return result
 
 
+# ========================================
+# ДЛИНА ТВИТА (twitter-text)
+# ========================================
+
+class TweetLength:
+    """
+    Взвешенная длина текста по правилам twitter-text.
+    total считается без посимвольного списка: len + тяжелые символы с
+    поправками на emoji и ссылки (ASCII без ссылок - просто len).
+    Префиксные суммы строятся лениво, только для обрезки (length / fit):
+    дальше длина любого отрезка и точка обрезки - O(1) / O(log n).
+    Emoji-последовательности и ссылки неделимы: обрезка их не разрезает.
+    Индексы относятся к self.text (текст в NFC, как считает Twitter)
+    """
+
+    def __init__(self, text):
+        text = text or ""
+        if not text.isascii() and not unicodedata.is_normalized('NFC', text):
+            text = unicodedata.normalize('NFC', text)
+        self.text = text
+        self._prefix = None
+        self._inside = None
+        self._spans = None
+        self.total = self._weighted_total()
+
+    def _special_spans(self):
+        """Неделимые отрезки [(start, end, вес)]: ссылки, затем emoji вне ссылок"""
+        if self._spans is None:
+            text = self.text
+            spans = []
+            if _has_url_hint(text):
+                spans = [(*m.span(), TWITTER_URL_LENGTH) for m in TWITTER_URL_PATTERN.finditer(text)]
+            if not text.isascii():
+                emoji = [(*m.span(), TWITTER_EMOJI_WEIGHT) for m in TWITTER_EMOJI_PATTERN.finditer(text)]
+                if '\u20e3' in text:
+                    emoji += [(*m.span(), TWITTER_EMOJI_WEIGHT) for m in TWITTER_KEYCAP_PATTERN.finditer(text)]
+                if spans:
+                    emoji = [(start, end, weight) for start, end, weight in emoji
+                             if not any(u_start < end and start < u_end for u_start, u_end, _ in spans)]
+                spans += emoji
+            self._spans = spans
+        return self._spans
+
+    def _weighted_total(self):
+        text = self.text
+        if text.isascii() and not _has_url_hint(text):
+            return len(text)
+
+        total = len(text) if text.isascii() else len(text) + len(_TWITTER_HEAVY_PATTERN.findall(text))
+        for start, end, weight in self._special_spans():
+            # Одиночный символ вне таблицы уже весит 2 - как emoji
+            if end - start > 1 or weight != TWITTER_DEFAULT_WEIGHT or ord(text[start]) < len(_TWITTER_WEIGHT_TABLE):
+                total += weight - _plain_weight(text[start:end])
+        return total
+
+    @property
+    def prefix(self):
+        """Префиксные суммы весов (строятся при первом обращении)"""
+        if self._prefix is None:
+            table = _TWITTER_WEIGHT_TABLE
+            limit = len(table)
+            weights = [table[o] if o < limit else TWITTER_DEFAULT_WEIGHT for o in map(ord, self.text)]
+            self._inside = bytearray(len(self.text) + 1)
+            for start, end, weight in self._special_spans():
+                weights[start] = weight
+                weights[start + 1:end] = [0] * (end - start - 1)
+                self._inside[start + 1:end] = b'\x01' * (end - start - 1)
+            self._prefix = list(accumulate(weights, initial=0))
+        return self._prefix
+
+    def length(self, start=0, end=None):
+        """Взвешенная длина self.text[start:end]"""
+        if start == 0 and end is None:
+            return self.total
+        end = len(self.text) if end is None else end
+        return self.prefix[end] - self.prefix[start]
+
+    def fit(self, max_length, start=0):
+        """Наибольший end: self.text[start:end] весит не больше max_length и не режет emoji/ссылку"""
+        prefix = self.prefix
+        end = bisect_right(prefix, prefix[start] + max(0, max_length)) - 1
+        end = max(start, min(end, len(self.text)))
+        while end > start and self._inside[end]:
+            end -= 1
+        return end
+
+
+def _has_url_hint(text):
+    """Быстрая проверка перед регуляркой ссылок"""
+    return '://' in text or 'www.' in text or 'WWW.' in text or 'Www.' in text
+
+
+def _plain_weight(text):
+    """Вес по таблице символов (без правил emoji и ссылок)"""
+    table = _TWITTER_WEIGHT_TABLE
+    limit = len(table)
+    return sum(table[o] if o < limit else TWITTER_DEFAULT_WEIGHT for o in map(ord, text))
+
+
 def get_twitter_length(text):
-    """Вычисляет длину текста для Twitter (emoji = 2 символа)"""
+    """Вычисляет длину текста для Twitter (правила twitter-text: вес символов, emoji, ссылки)"""
     if not text:
         return 0
-    emoji_pattern = re.compile("["
-        "\U0001F600-\U0001F64F"
-        "\U0001F300-\U0001F5FF"
-        "\U0001F680-\U0001F6FF"
-        "\U0001F1E0-\U0001F1FF"
-        "\U00002702-\U000027B0"
-        "\U000024C2-\U0001F251"
-        "]+", flags=re.UNICODE)
-    emoji_count = len(emoji_pattern.findall(text))
-    return len(text) + emoji_count
+    if text.isascii() and not _has_url_hint(text):
+        return len(text)
+    return TweetLength(text).total
+
+
+def truncate_for_twitter(text, max_length, ellipsis="..."):
+    """
+    Обрезает текст до взвешенной длины max_length (с многоточием), не разрезая
+    emoji и ссылки. text - строка или уже посчитанный TweetLength (без повторного разбора)
+    """
+    measure = text if isinstance(text, TweetLength) else TweetLength(text)
+    if measure.total <= max_length:
+        return measure.text
+    cut = measure.fit(max_length - get_twitter_length(ellipsis))
+    return measure.text[:cut] + ellipsis
+
+
+def compile_context_patterns(patterns):
+    """
+    Компилирует CONTEXT_PATTERNS один раз: одна регулярка по всем словам
+    (только целые слова - "ai" не находится в "against", "sol" в "solid")
+    Returns: (regex, {слово: индекс паттерна}, индексы паттернов по приоритету)
+    """
+    keyword_index = {}
+    for index, (pattern, _, _) in enumerate(patterns):
+        for word in pattern.split("|"):
+            keyword_index.setdefault(word.strip().lower(), index)
+    
+    # Длинные слова раньше: "whales" не должно остановиться на "whale"
+    words = sorted(keyword_index, key=len, reverse=True)
+    regex = re.compile(r'\b(?:' + '|'.join(re.escape(w) for w in words) + r')\b')
+    order = sorted(range(len(patterns)), key=lambda i: patterns[i][2])
+    return regex, keyword_index, order
+
+
+_CONTEXT_MATCHER = compile_context_patterns(CONTEXT_PATTERNS)
 
 
 def get_context_emojis(text, max_count=MAX_EMOJI_COUNT):
-    """Определяет контекстные эмодзи"""
+    """
+    Определяет контекстные эмодзи: все слова находятся за один проход,
+    порядок - по приоритету паттерна (как в CONTEXT_PATTERNS)
+    """
     if not text:
         return []
     
+    regex, keyword_index, order = _CONTEXT_MATCHER
     text_lower = text[:EMOJI_DETECTION_TEXT_LIMIT].lower()
-    found = []
+    matched = {keyword_index[m.group(0)] for m in regex.finditer(text_lower)}
     
-    for pattern, emoji, priority in sorted(CONTEXT_PATTERNS, key=lambda x: x[2]):
-        if emoji in [e for e, p in found]:
-            continue
-        
-        words = pattern.split("|")
-        if any(word in text_lower for word in words):
-            found.append((emoji, priority))
-            
+    found = []
+    for index in order:
+        emoji = CONTEXT_PATTERNS[index][1]
+        if index in matched and emoji not in found:
+            found.append(emoji)
             if len(found) >= max_count:
                 break
     
-    return [emoji for emoji, _ in found]
+    return found
 
 
 def detect_price_change_emoji(line):
@@ -146,51 +371,182 @@ def detect_price_change_emoji(line):
     return "•"
 
 
+# ========================================
+# СПЕКИ ОТОБРАЖЕНИЯ
+# ========================================
+
+# Скомпилированный конфиг одного вопроса (неизменяемый)
+RenderSpec = namedtuple("RenderSpec", [
+    "question", "group", "title", "hashtags", "emoji",
+    "telegram_header",        # "📊 <b>Title</b>"
+    "twitter_header",         # "📊 Title" (заголовок обрезан как в форматтерах Twitter)
+    "twitter_header_length",  # взвешенная длина twitter_header
+    "hashtags_length",        # взвешенная длина hashtags
+    "hashtag_variants",       # ((N, хэштеги, длина), ...) для HASHTAG_FALLBACK_COUNTS
+    "cleaners",               # скомпилированные фразы, которые убираются из текста ответа
+])
+
+# Все спеки конфига: по вопросу, по группе вопросов и спека по умолчанию
+# (словари не изменяются после compile_render_specs; RenderSpecs передается в процессы format_batch)
+RenderSpecs = namedtuple("RenderSpecs", ["by_question", "by_group", "default", "group_fn"])
+
+
+def make_render_spec(question, group, config, cleaners=()):
+    """Спека одного вопроса: все, что форматтеры раньше считали на каждый вызов"""
+    title = config.get("title", DEFAULT_DISPLAY_CONFIG["title"])
+    hashtags = config.get("hashtags", "#Crypto")
+    emoji = TITLE_EMOJI_MAP.get(title, DEFAULT_TITLE_EMOJI)
+    twitter_header = f"{emoji} {safe_str(title, 'Update', 50)}"
+    
+    tags = hashtags.split()
+    variants = tuple(
+        (count, " ".join(tags[:count]), get_twitter_length(" ".join(tags[:count])))
+        for count in HASHTAG_FALLBACK_COUNTS
+    )
+    
+    return RenderSpec(
+        question=question,
+        group=group,
+        title=title,
+        hashtags=hashtags,
+        emoji=emoji,
+        telegram_header=f"{emoji} <b>{safe_str(title, 'Crypto Update', 100)}</b>",
+        twitter_header=twitter_header,
+        twitter_header_length=get_twitter_length(twitter_header),
+        hashtags_length=get_twitter_length(hashtags),
+        hashtag_variants=variants,
+        cleaners=tuple(re.compile(re.escape(phrase)) for phrase in cleaners),
+    )
+
+
+def make_group_spec(group, specs):
+    """
+    Спека для вариации формулировки вопроса группы: только то, что общее у
+    всех вопросов группы. Вопросы market_direction (up / down) различаются
+    хэштегами (#BullRun / #Correction) - вариация получает нейтральные общие
+    """
+    if len(specs) == 1:
+        return specs[0]
+    
+    titles = {spec.title for spec in specs}
+    title = titles.pop() if len(titles) == 1 else DEFAULT_DISPLAY_CONFIG["title"]
+    
+    common = set.intersection(*(set(spec.hashtags.split()) for spec in specs))
+    hashtags = " ".join(tag for tag in specs[0].hashtags.split() if tag in common)
+    
+    cleaners = []
+    for spec in specs:
+        for pattern in spec.cleaners:
+            if pattern.pattern not in cleaners:
+                cleaners.append(pattern.pattern)
+    
+    spec = make_render_spec(None, group, {"title": title,
+                                          "hashtags": hashtags or DEFAULT_DISPLAY_CONFIG["hashtags"]})
+    # Фразы уже экранированы - компилируются как есть
+    return spec._replace(cleaners=tuple(re.compile(pattern) for pattern in cleaners))
+
+
+def compile_render_specs(config_dict, group_fn=None, cleaners=()):
+    """
+    Компилирует конфиг отображения один раз (при старте / загрузке профиля)
+    
+    config_dict: {вопрос: {"title", "hashtags"}}
+    group_fn: вопрос -> группа (для вопросов, которых нет в конфиге дословно)
+    cleaners: [(часть вопроса, фраза для удаления из ответа), ...]
+    """
+    by_question = {}
+    members = {}
+    for question, config in config_dict.items():
+        group = group_fn(question) if group_fn else None
+        phrases = [phrase for pattern, phrase in cleaners if pattern in question]
+        spec = make_render_spec(question, group, config, phrases)
+        by_question[question] = spec
+        members.setdefault(group, []).append(spec)
+    
+    by_group = {group: make_group_spec(group, specs) for group, specs in members.items()}
+    
+    return RenderSpecs(
+        by_question=by_question,
+        by_group=by_group,
+        default=make_render_spec(None, None, DEFAULT_DISPLAY_CONFIG),
+        group_fn=group_fn,
+    )
+
+
+def get_render_spec(specs, question):
+    """
+    Спека вопроса: дословное совпадение, иначе спека его группы (общие для
+    группы заголовок и хэштеги - make_group_spec), иначе спека по умолчанию.
+    specs может быть и обычным конфигом (dict) - тогда спека собирается на лету
+    """
+    if not isinstance(specs, RenderSpecs):
+        config = specs.get(question)
+        return make_render_spec(question, None, config if config is not None else DEFAULT_DISPLAY_CONFIG)
+    
+    spec = specs.by_question.get(question)
+    if spec:
+        return spec
+    if specs.group_fn and question:
+        spec = specs.by_group.get(specs.group_fn(question))
+        if spec:
+            return spec
+    return specs.default
+
+
+def get_hashtag_variant(spec, max_tags):
+    """Первые max_tags хэштегов спеки: (хэштеги, взвешенная длина)"""
+    for count, hashtags, length in spec.hashtag_variants:
+        if count == max_tags:
+            return hashtags, length
+    hashtags = " ".join(spec.hashtags.split()[:max_tags])
+    return hashtags, get_twitter_length(hashtags)
+
+
 # ========================================
 # ФОРМАТИРОВАНИЕ TELEGRAM
 # ========================================
 
-def format_telegram_improved(title, text, hashtags):
-    """Улучшенное форматирование для Telegram"""
+def format_telegram_improved(title, text, hashtags, doc=None, spec=None):
+    """
+    Улучшенное форматирование для Telegram
+    doc - уже разобранный текст (parse_document), иначе текст разбирается здесь
+    spec - скомпилированный конфиг вопроса (RenderSpec) с готовым заголовком
+    """
     start_time = time.time()
     
     try:
         title = safe_str(title, "Crypto Update", 100)
-        text = safe_str(text, "", MAX_TEXT_LENGTH)
+        doc = doc or parse_document(text, MAX_TEXT_LENGTH)
+        text = doc["text"]
         hashtags = safe_str(hashtags, "", 200)
         
         if not text:
             logger.warning("⚠️ Пустой текст после санитизации")
             return f"<b>{title}</b>\n\n{hashtags}"
         
-        emoji = TITLE_EMOJI_MAP.get(title, "📰")
-        header = f"{emoji} <b>{title}</b>"
+        if spec:
+            header = spec.telegram_header
+        else:
+            emoji = TITLE_EMOJI_MAP.get(title, DEFAULT_TITLE_EMOJI)
+            header = f"{emoji} <b>{title}</b>"
         
-        lines = text.split('\n')
-        processed = []
-        line_count = 0
+        lines = doc["lines"]
+        if len(lines) > MAX_LINE_COUNT:
+            logger.warning(f"⚠️ Достигнут лимит строк ({MAX_LINE_COUNT})")
+            lines = lines[:MAX_LINE_COUNT]
         
+        processed = []
         for line in lines:
-            if line_count >= MAX_LINE_COUNT:
-                logger.warning(f"⚠️ Достигнут лимит строк ({MAX_LINE_COUNT})")
-                break
-            
-            line = line.strip()
-            if not line:
-                continue
-            
-            line_count += 1
-            
-            if CRYPTO_PRICE_PATTERN.match(line):
-                price_emoji = detect_price_change_emoji(line)
-                processed.append(f"{price_emoji} {line}")
-            elif LIST_ITEM_PATTERN.match(line):
-                clean = LIST_ITEM_PATTERN.sub('', line)
-                processed.append(f"• {clean}")
-            elif line.endswith((':','–','—')) and len(line) < 50:
-                processed.append(f"<b>{line}</b>")
+            kind = line["kind"]
+            if kind == "price":
+                price_emoji = detect_price_change_emoji(line["text"])
+                processed.append(f"{price_emoji} {line['text']}")
+            elif kind == "bullet":
+                processed.append(f"• {line['clean']}")
+            elif kind == "heading":
+                processed.append(f"<b>{line['text']}</b>")
             else:
-                processed.append(line)
+                processed.append(line["text"])
         
         formatted = '\n\n'.join(processed)
         message = f"{header}\n\n{formatted}"
@@ -214,61 +570,254 @@ def format_telegram_improved(title, text, hashtags):
 
 
 # ========================================
-# ФОРМАТИРОВАНИЕ TWITTER
+# РАЗБИВКА СООБЩЕНИЙ TELEGRAM
 # ========================================
 
-def extract_bullet_points(text):
-    """Извлекает пункты списка из текста"""
-    points = []
-    lines = text.split('\n')
+def utf16_length(text):
+    """Длина текста в UTF-16 единицах (так считает Telegram)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _tokenize_telegram(text, parse_html):
+    """Разбивает сообщение на токены (text, kind, units, tag_name)"""
+    tokens = []
+    for match in TELEGRAM_TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        
+        if parse_html and len(token) > 1 and token[0] == '<':
+            name_match = HTML_TAG_NAME_PATTERN.match(token)
+            if name_match:
+                kind = 'close' if token.startswith('</') else 'open'
+                tokens.append((token, kind, 0, name_match.group(1).lower()))
+                continue
+        
+        if parse_html and len(token) > 1 and token[0] == '&':
+            tokens.append((token, 'entity', utf16_length(html.unescape(token)), None))
+        elif token == '\n':
+            tokens.append((token, 'newline', 1, None))
+        elif token.isspace():
+            tokens.append((token, 'space', utf16_length(token), None))
+        else:
+            tokens.append((token, 'text', utf16_length(token), None))
+    
+    return tokens
+
+
+def _split_text_token(token, budget):
+    """Делит слово на префикс не длиннее budget UTF-16 единиц и остаток"""
+    used = 0
+    for index, char in enumerate(token):
+        size = 2 if ord(char) > 0xFFFF else 1
+        if used + size > budget:
+            return token[:index], token[index:]
+        used += size
+    return token, ""
+
+
+def split_telegram_message(text, max_units=MAX_TELEGRAM_MESSAGE_UNITS, parse_html=True):
+    """
+    Делит сообщение на минимальное число частей для Telegram
+    
+    - длина считается в UTF-16 единицах по видимому тексту (теги не считаются,
+      entity считается как один символ)
+    - разрез никогда не попадает внутрь тега или entity
+    - открытые теги закрываются в конце части и открываются заново в следующей
+    - часть заполняется до предела и режется по последнему переносу строки
+      или пробелу (жадно - это минимум частей при разрезе по границам слов),
+      а если их нет - посреди слова
+    
+    Работает за линейное время от длины текста
+    """
+    if not text:
+        return []
     
-    for line in lines:
-        line = line.strip()
-        if not line:
+    tokens = _tokenize_telegram(text, parse_html)
+    if sum(token[2] for token in tokens) <= max_units:
+        return [text]
+    
+    parts = []
+    stack = []            # открытые теги: (name, открывающий тег)
+    part = []             # тексты токенов текущей части
+    units = 0
+    last_break = None     # последний перенос/пробел: (индекс в part, индекс токена, стек тегов)
+    
+    def close_tags(tags):
+        return ''.join(f"</{name}>" for name, _ in reversed(tags))
+    
+    def emit(chunks, tags):
+        body = ''.join(chunks).strip()
+        visible = HTML_TAG_PATTERN.sub('', body) if parse_html else body
+        if visible.strip():
+            parts.append(body + close_tags(tags))
+    
+    i = 0
+    while i < len(tokens):
+        token, kind, size, name = tokens[i]
+        
+        if kind == 'open':
+            stack.append((name, token))
+            part.append(token)
+            i += 1
+            continue
+        
+        if kind == 'close':
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth][0] == name:
+                    del stack[depth:]
+                    break
+            part.append(token)
+            i += 1
             continue
         
-        if LIST_ITEM_PATTERN.match(line) or CRYPTO_PRICE_PATTERN.match(line):
-            clean = LIST_ITEM_PATTERN.sub('', line).strip()
-            if clean and len(clean) > 10:
-                points.append(clean)
+        # Пробелы в начале части не нужны
+        if units == 0 and kind in ('newline', 'space'):
+            i += 1
+            continue
+        
+        if units + size <= max_units:
+            if kind in ('newline', 'space'):
+                last_break = (len(part), i, list(stack))
+            part.append(token)
+            units += size
+            i += 1
+            continue
+        
+        # Часть заполнена - режем по последнему переносу/пробелу
+        if last_break:
+            part_len, token_index, tags = last_break
+            emit(part[:part_len], tags)
+            stack = list(tags)
+            i = token_index + 1
+        else:
+            # Нет пробелов - режем слово (entity и теги не режутся)
+            if kind == 'text' and units < max_units:
+                head, tail = _split_text_token(token, max_units - units)
+                part.append(head)
+                tokens[i] = (tail, kind, utf16_length(tail), None)
+            emit(part, stack)
+        
+        part = [tag for _, tag in stack]
+        units = 0
+        last_break = None
+    
+    if part:
+        emit(part, [])
     
-    return points
+    return parts
 
 
-def extract_intro_sentence(text):
+# ========================================
+# ФОРМАТИРОВАНИЕ TWITTER
+# ========================================
+
+def extract_bullet_points(text, doc=None):
+    """Извлекает пункты списка из текста (или из разобранного doc)"""
+    doc = doc or parse_document(text)
+    return list(doc["bullets"])
+
+
+def extract_intro_sentence(text, doc=None):
     """Извлекает первое предложение для intro"""
-    match = re.match(r'^([^.!?]+[.!?])', text)
-    if match:
-        intro = match.group(1).strip()
-        if get_twitter_length(intro) <= 200:
-            return intro
+    doc = doc or parse_document(text)
+    intro = doc["intro"]
+    if intro and get_twitter_length(intro) <= 200:
+        return intro
     
-    if len(text) > 200:
-        return text[:197] + "..."
-    return text
+    return truncate_for_twitter(doc["text"], 200)
+
+
+def pack_thread(units, max_tweets, tail="", max_length=MAX_TWITTER_LENGTH, separator="\n"):
+    """
+    Упаковывает пункты в не более чем max_tweets твитов (взвешенная длина
+    twitter-text), сохраняя порядок чтения: берется самый длинный префикс
+    пунктов, который помещается. Пункты по порядку дописываются в текущий
+    твит, пока влезают (для упорядоченной раскладки это минимум твитов).
+
+    Текст важнее хэштегов: tail дописывается к последнему твиту, если
+    влезает; если нет, а слот свободен - последний пункт переносится в
+    новый твит вместе с хэштегами. Твит из одних хэштегов не публикуется -
+    не влезли, значит без них.
+
+    Returns: (список твитов, индексы вошедших пунктов)
+    """
+    sep = get_twitter_length(separator)
+    fold = get_twitter_length("\n\n") + get_twitter_length(tail) if tail else 0
+
+    # Твиты: [индексы пунктов, заполнение]; каждый пункт измеряется один раз,
+    # обрезается только длиннее твита, после заполнения последнего твита - стоп
+    tweets = []
+    texts, weights = [], []
+    for index, unit in enumerate(units):
+        if len(tweets) == max_tweets and tweets[-1][1] + sep >= max_length:
+            break
+        measure = TweetLength(unit)
+        if measure.total > max_length:
+            unit = truncate_for_twitter(measure, max_length)
+            weight = get_twitter_length(unit)
+        else:
+            unit, weight = measure.text, measure.total
+        texts.append(unit)
+        weights.append(weight)
+
+        if tweets and tweets[-1][1] + sep + weight <= max_length:
+            tweets[-1][0].append(index)
+            tweets[-1][1] += sep + weight
+        elif len(tweets) < max_tweets:
+            tweets.append([[index], weight])
+        else:
+            break
+
+    if not tweets:
+        return [], []
+
+    if tail and tweets[-1][1] + fold > max_length and len(tweets) < max_tweets and len(tweets[-1][0]) > 1:
+        moved = tweets[-1][0][-1]
+        weight = weights[moved]
+        if weight + fold <= max_length:
+            tweets[-1][0].pop()
+            tweets[-1][1] -= sep + weight
+            tweets.append([[moved], weight])
+
+    packed = [separator.join(texts[index] for index in indices) for indices, _ in tweets]
+    if tail and tweets[-1][1] + fold <= max_length:
+        packed[-1] += "\n\n" + tail
+
+    return packed, [index for indices, _ in tweets for index in indices]
+
+
+def format_thread_point(point):
+    """Пункт треда: цена с цветным индикатором или обычный пункт списка"""
+    if CRYPTO_PRICE_PATTERN.match(point):
+        return f"{detect_price_change_emoji(point)} {point}"
+    return f"• {point}"
 
 
-def format_twitter_thread(title, text, hashtags):
+def format_twitter_thread(title, text, hashtags, doc=None, spec=None):
     """
     Создаёт мини-тред для Twitter (оптимизировано для Free tier)
+    Твит 1 - intro, дальше пункты по порядку в оставшиеся MAX_THREAD_TWEETS - 1
+    твитов (pack_thread), хэштеги дописываются к последнему, если влезают.
+    Обрывок, оставшийся от обрезки по MAX_TEXT_LENGTH, не публикуется
+    doc - уже разобранный текст (parse_document), spec - RenderSpec вопроса
     Возвращает: list of str или None
     """
     try:
         tweets = []
         
         title = safe_str(title, "Update", 50)
-        text = safe_str(text, "", MAX_TEXT_LENGTH)
+        doc = doc or parse_document(text, MAX_TEXT_LENGTH)
+        text = doc["text"]
         hashtags = safe_str(hashtags, "", 150)
         
         if not text:
             logger.warning("⚠️ Пустой текст для треда")
             return None
         
-        emoji = TITLE_EMOJI_MAP.get(title, "📰")
+        emoji = spec.emoji if spec else TITLE_EMOJI_MAP.get(title, DEFAULT_TITLE_EMOJI)
         context_emojis = get_context_emojis(text, max_count=2)
         
         # Твит 1: INTRO
-        intro = extract_intro_sentence(text)
+        intro = extract_intro_sentence(text, doc)
         context_str = " ".join(context_emojis) if context_emojis else ""
         
         tweet1 = f"{emoji} {title}"
@@ -278,7 +827,7 @@ def format_twitter_thread(title, text, hashtags):
         
         if get_twitter_length(tweet1) > MAX_TWITTER_LENGTH:
             max_intro = MAX_TWITTER_LENGTH - get_twitter_length(f"{emoji} {title} {context_str}\n\n\n\n🧵👇") - 5
-            intro = text[:max_intro-3] + "..."
+            intro = truncate_for_twitter(text, max_intro)
             tweet1 = f"{emoji} {title}"
             if context_str:
                 tweet1 += f" {context_str}"
@@ -286,40 +835,29 @@ def format_twitter_thread(title, text, hashtags):
         
         tweets.append(tweet1)
         
-        # Твит 2: ГЛАВНЫЙ ПУНКТ (для мини-треда берём только самый важный)
-        points = extract_bullet_points(text)
-        
-        if not points:
-            sentences = re.split(r'(?<=[.!?])\s+', text)
-            points = [s.strip() for s in sentences if len(s.strip()) > 20][:2]
+        # Твиты 2..N: пункты списка, а если их нет - предложения после intro
+        # (intro - первое предложение или его начало, обрезанное с многоточием)
+        points = extract_bullet_points(text, doc)
+        if points:
+            units = [format_thread_point(point) for point in points]
+            separator = "\n"
+        else:
+            sentences = doc["sentences"][:-1] if doc.get("truncated") else doc["sentences"]
+            units = [text[start:end].strip() for start, end in sentences[1:]]
+            separator = " "
         
-        if not points or len(points) < 1:
+        if not units:
             logger.warning("⚠️ Недостаточно контента для треда, используем одиночный твит")
             return None
         
-        # Берём только ПЕРВЫЙ пункт (самый важный)
-        main_point = points[0]
-        
-        if CRYPTO_PRICE_PATTERN.match(main_point):
-            price_emoji = detect_price_change_emoji(main_point)
-            tweet2 = f"{price_emoji} {main_point}"
-        else:
-            tweet2 = f"• {main_point}"
-        
-        if get_twitter_length(tweet2) > MAX_TWITTER_LENGTH:
-            tweet2 = tweet2[:MAX_TWITTER_LENGTH-3] + "..."
-        
-        tweets.append(tweet2)
-        
-        # Твит 3: ХЭШТЕГИ
-        if hashtags:
-            tweets.append(hashtags)
-        
-        if len(tweets) < 2:
+        packed, used = pack_thread(units, MAX_THREAD_TWEETS - 1, hashtags, separator=separator)
+        if not packed:
             logger.warning("⚠️ Тред слишком короткий")
             return None
         
-        logger.info(f"✓ Создан тред из {len(tweets)} твитов")
+        tweets.extend(packed)
+        
+        logger.info(f"✓ Создан тред из {len(tweets)} твитов ({len(used)}/{len(units)} пунктов)")
         return tweets
         
     except Exception as e:
@@ -327,40 +865,39 @@ def format_twitter_thread(title, text, hashtags):
         return None
 
 
-def format_twitter_single(title, text, hashtags, max_len=270):
-    """Одиночный сокращенный твит"""
+def format_twitter_single(title, text, hashtags, max_len=270, doc=None, spec=None):
+    """
+    Одиночный сокращенный твит
+    doc - уже разобранный текст, spec - RenderSpec вопроса (готовые длины заголовка и хэштегов)
+    """
     try:
         title = safe_str(title, "Update", 50)
-        text = safe_str(text, "", 2000)
+        text = doc["text"][:2000] if doc else safe_str(text, "", 2000)
         hashtags = safe_str(hashtags, "", 150)
         
         if not text:
             return f"{title}\n\n{hashtags}"
         
-        emoji = TITLE_EMOJI_MAP.get(title, "📰")
+        spec = spec or make_render_spec(None, None, {"title": title, "hashtags": hashtags})
         context_emojis = get_context_emojis(text, max_count=1)
         
+        header = spec.twitter_header
+        header_length = spec.twitter_header_length
         if context_emojis:
-            header = f"{emoji} {title} {context_emojis[0]}"
-        else:
-            header = f"{emoji} {title}"
+            header = f"{header} {context_emojis[0]}"
+            header_length += 1 + get_twitter_length(context_emojis[0])
         
-        reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 6
-        available = max_len - reserved
+        hashtags_length = get_twitter_length(hashtags) if hashtags != spec.hashtags else spec.hashtags_length
+        available = max_len - (header_length + hashtags_length + 6)
         
         if available < MIN_TWITTER_SPACE:
-            tags_list = hashtags.split()[:2]
-            hashtags = " ".join(tags_list) if tags_list else ""
-            reserved = get_twitter_length(header) + get_twitter_length(hashtags) + 6
-            available = max_len - reserved
+            hashtags, hashtags_length = get_hashtag_variant(spec, 2)
+            available = max_len - (header_length + hashtags_length + 6)
         
         short_text = extract_short_text_safe(text, available)
         tweet = f"{header}\n\n{short_text}\n\n{hashtags}"
         
-        if get_twitter_length(tweet) > MAX_TWITTER_LENGTH:
-            tweet = tweet[:277] + "..."
-        
-        return tweet
+        return truncate_for_twitter(tweet, MAX_TWITTER_LENGTH)
         
     except Exception as e:
         logger.error(f"✗ Ошибка в format_twitter_single: {e}")
@@ -368,160 +905,262 @@ def format_twitter_single(title, text, hashtags, max_len=270):
 
 
 def extract_short_text_safe(text, max_length):
-    """Безопасное извлечение короткого текста"""
+    """
+    Безопасное извлечение короткого текста: до 3 целых предложений,
+    которые вместе помещаются в max_length, иначе обрезка с многоточием.
+    Один проход: длины предложений берутся из префиксных сумм
+    """
     if not text or max_length < 10:
         return ""
     
-    text = text.strip()
-    if get_twitter_length(text) <= max_length:
+    measure = TweetLength(text.strip())
+    text = measure.text
+    if measure.total <= max_length:
         return text
     
     result = []
-    current = ""
-    char_count = 0
+    total = 0
+    start = 0
     max_chars = min(len(text), max_length * 2)
     
-    for char in text[:max_chars]:
-        current += char
-        char_count += 1
+    for match in SENTENCE_END_PATTERN.finditer(text, 0, max_chars):
+        end = match.end()
+        if end <= 20:
+            continue
         
-        if char in '.!?' and char_count > 20:
-            if get_twitter_length(current) <= max_length:
-                result.append(current.strip())
-                current = ""
-            else:
-                break
+        piece = text[start:end]
+        lead = len(piece) - len(piece.lstrip())
+        piece_start, piece_end = start + lead, start + len(piece.rstrip())
+        start = end
+        
+        # Предложения склеиваются через пробел
+        piece_length = measure.length(piece_start, piece_end) + (1 if result else 0)
+        if total + piece_length > max_length:
+            break
+        
+        result.append(text[piece_start:piece_end])
+        total += piece_length
         
         if len(result) >= 3:
             break
     
     if result:
-        final = " ".join(result)
-        if get_twitter_length(final) <= max_length:
-            return final
+        return " ".join(result)
     
-    return text[:max_length-3] + "..."
+    return truncate_for_twitter(measure, max_length)
 
 
 # ========================================
-# ГЛАВНАЯ ФУНКЦИЯ
+# КЭШ РЕНДЕРА
 # ========================================
 
-def send_improved(question, answer, 
-                 extract_tldr_fn, clean_text_fn, config_dict,
-                 get_image_fn, send_tg_photo_fn, send_tg_msg_fn,
-                 send_twitter_thread_fn, twitter_enabled, twitter_keys):
+# ключ -> результат форматтера (LRU: последний использованный в конце)
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+_render_cache_stats = {"hits": 0, "misses": 0}
+
+
+def render_cache_key(platform, title, text, hashtags):
+    """Ключ кэша: хэш содержимого + платформа + версия форматирования"""
+    payload = "\x1f".join((__version__, platform, title or "", text or "", hashtags or ""))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cached_render(platform, title, text, hashtags, render_fn):
     """
-    Главная функция для отправки контента
+    Результат render_fn() из кэша или свежий рендер.
+    Повторы, рассылка по нескольким профилям и повторная публикация того же
+    ответа не форматируют текст заново. Ошибка рендера не кэшируется
+    """
+    key = render_cache_key(platform, title, text, hashtags)
+    
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            _render_cache_stats["hits"] += 1
+            result = _render_cache[key]
+            return list(result) if isinstance(result, tuple) else result
+        _render_cache_stats["misses"] += 1
+    
+    result = render_fn()
+    
+    # Списки (тред) хранятся как tuple: вызывающий не испортит кэш
+    with _render_cache_lock:
+        _render_cache[key] = tuple(result) if isinstance(result, list) else result
+        _render_cache.move_to_end(key)
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
     
-    v3.1.1: Оптимизация для Twitter Free tier
+    return result
+
+
+def get_render_cache_stats():
+    """Статистика кэша рендера: hits, misses, size"""
+    with _render_cache_lock:
+        return dict(_render_cache_stats, size=len(_render_cache))
+
+
+def clear_render_cache():
+    with _render_cache_lock:
+        _render_cache.clear()
+        _render_cache_stats.update(hits=0, misses=0)
+
+
+# ========================================
+# ПОДГОТОВКА ПУБЛИКАЦИИ
+# ========================================
+
+def extract_clean_tldr(question, answer, extract_tldr_fn, clean_text_fn):
+    """Извлекает и очищает TLDR; возвращает текст или None"""
+    tldr_text = extract_tldr_fn(answer)
+    if not tldr_text:
+        logger.error("✗ Пустой TLDR")
+        return None
+    
+    tldr_text = clean_text_fn(question, tldr_text)
+    if not tldr_text:
+        logger.error("✗ Пустой текст после очистки")
+        return None
+    
+    return tldr_text
+
+
+def render_post(question, answer, extract_tldr_fn, clean_text_fn, config_dict):
+    """
+    Готовит публикацию для всех платформ без отправки
+    
+    Returns:
+        dict с ключами question, title, hashtags, tldr,
+        telegram (str) и twitter (dict: mode, tweets, tweet - для outbox) или None
+    """
+    logger.info(f"\n📝 Форматирование v{__version__}")
+    
+    # 1-2. Извлекаем и очищаем
+    tldr_text = extract_clean_tldr(question, answer, extract_tldr_fn, clean_text_fn)
+    if not tldr_text:
+        return None
+    
+    return render_tldr(question, tldr_text, config_dict)
+
+
+def render_tldr(question, tldr_text, config_dict, doc=None):
     """
-    total_start = time.time()
+    Форматирует уже извлеченный TLDR для всех платформ (см. render_post)
+    config_dict - RenderSpecs (compile_render_specs) или обычный конфиг отображения
+    doc - разобранный TLDR (parse_document): один разбор на все платформы и профили
+    """
+    logger.info(f"🐦 Twitter режим: {TWITTER_MODE}")
+    
+    # 3. Конфигурация (скомпилированная спека вопроса или обычный dict конфига)
+    spec = get_render_spec(config_dict, question)
+    title = spec.title
+    hashtags = spec.hashtags
     
+    logger.info(f"  Заголовок: {title}")
+    logger.info(f"  Длина: {len(tldr_text)}")
+    
+    # Текст разбирается один раз для всех форматтеров (и только если что-то не в кэше)
+    parsed = {"doc": doc}
+    
+    def document():
+        if parsed["doc"] is None:
+            parsed["doc"] = parse_document(tldr_text, MAX_TEXT_LENGTH)
+        return parsed["doc"]
+    
+    # 4. Форматируем Telegram
     try:
-        logger.info(f"\n📝 Форматирование v{__version__}")
-        logger.info(f"🐦 Twitter режим: {TWITTER_MODE}")
-        
-        # 1-2. Извлекаем и очищаем
-        tldr_text = extract_tldr_fn(answer)
-        if not tldr_text:
-            logger.error("✗ Пустой TLDR")
-            return False
-        
-        tldr_text = clean_text_fn(question, tldr_text)
-        if not tldr_text:
-            logger.error("✗ Пустой текст после очистки")
-            return False
-        
-        # 3. Конфигурация
-        config = config_dict.get(question, {
-            "title": "Crypto Update",
-            "hashtags": "#Crypto #Bitcoin"
-        })
-        
-        title = config.get("title", "Crypto Update")
-        hashtags = config.get("hashtags", "#Crypto")
-        
-        logger.info(f"  Заголовок: {title}")
-        logger.info(f"  Длина: {len(tldr_text)}")
-        
-        # 4. Форматируем Telegram
-        try:
-            tg_message = format_telegram_improved(title, tldr_text, hashtags)
-            logger.info(f"  ✓ Telegram: {len(tg_message)} символов")
-        except Exception as e:
-            logger.error(f"  ✗ Ошибка TG: {e}")
-            tg_message = f"<b>{title}</b>\n\n{tldr_text[:500]}\n\n{hashtags}"
+        tg_message = cached_render("telegram", title, tldr_text, hashtags,
+                                   lambda: format_telegram_improved(title, tldr_text, hashtags, document(), spec))
+        logger.info(f"  ✓ Telegram: {len(tg_message)} символов")
+    except Exception as e:
+        logger.error(f"  ✗ Ошибка TG: {e}")
+        tg_message = f"<b>{title}</b>\n\n{tldr_text[:500]}\n\n{hashtags}"
+    
+    # 5. Форматируем Twitter
+    twitter_content = {
+        "title": title,
+        "text": tldr_text,
+        "hashtags": hashtags,
+        "mode": TWITTER_MODE
+    }
+    
+    def render_single():
+        return cached_render("twitter_single", title, tldr_text, hashtags,
+                             lambda: format_twitter_single(title, tldr_text, hashtags, doc=document(), spec=spec))
+    
+    if TWITTER_MODE == "thread":
+        tweets = cached_render("twitter_thread", title, tldr_text, hashtags,
+                               lambda: format_twitter_thread(title, tldr_text, hashtags, document(), spec))
         
-        # 5. Картинка
-        image_url = None
+        if tweets and len(tweets) >= 2:
+            twitter_content["tweets"] = tweets
+            # Одиночный твит - запасной вариант, если тред не помещается в лимиты
+            twitter_content["tweet"] = render_single()
+            logger.info(f"  ✓ Twitter тред: {len(tweets)} твитов")
+        else:
+            logger.warning("  ⚠️ Fallback на одиночный твит")
+            twitter_content["mode"] = "single"
+            twitter_content["tweet"] = render_single()
+    else:
+        twitter_content["tweet"] = render_single()
+        logger.info(f"  ✓ Twitter: {get_twitter_length(twitter_content['tweet'])} символов")
+    
+    return {
+        "question": question,
+        "title": title,
+        "hashtags": hashtags,
+        "tldr": tldr_text,
+        "telegram": tg_message,
+        "twitter": twitter_content
+    }
+
+
+# ========================================
+# ПАКЕТНОЕ ФОРМАТИРОВАНИЕ
+# ========================================
+
+def _format_chunk(pairs, extract_tldr_fn, clean_text_fn, config_dict):
+    """Форматирует часть пакета в текущем процессе (render_post для каждой пары)"""
+    results = []
+    for question, answer in pairs:
         try:
-            image_url = get_image_fn()
+            results.append(render_post(question, answer, extract_tldr_fn, clean_text_fn, config_dict))
         except Exception as e:
-            logger.warning(f"  ⚠️ Нет картинки: {e}")
-        
-        # 6. Отправляем Telegram
-        logger.info("\n📤 Отправка Telegram...")
-        tg_success = False
-        
-        try:
-            if image_url:
-                tg_success = send_tg_photo_fn(image_url, tg_message)
-            else:
-                tg_success = send_tg_msg_fn(tg_message)
-        except Exception as e:
-            logger.error(f"  ✗ Ошибка: {e}")
-        
-        time.sleep(2)
-        
-        # 7. Twitter
-        tw_status = "Отключен"
-        
-        if twitter_enabled and all(twitter_keys):
-            try:
-                logger.info("\n🐦 Подготовка Twitter...")
-                
-                twitter_content = {
-                    "title": title,
-                    "text": tldr_text,
-                    "hashtags": hashtags,
-                    "mode": TWITTER_MODE
-                }
-                
-                if TWITTER_MODE == "thread":
-                    tweets = format_twitter_thread(title, tldr_text, hashtags)
-                    
-                    if tweets and len(tweets) >= 2:
-                        twitter_content["tweets"] = tweets
-                        logger.info(f"  ✓ Twitter тред: {len(tweets)} твитов")
-                    else:
-                        logger.warning("  ⚠️ Fallback на одиночный твит")
-                        twitter_content["mode"] = "single"
-                        twitter_content["tweet"] = format_twitter_single(title, tldr_text, hashtags)
-                else:
-                    twitter_content["tweet"] = format_twitter_single(title, tldr_text, hashtags)
-                    logger.info(f"  ✓ Twitter: {get_twitter_length(twitter_content['tweet'])} символов")
-                
-                tw_success = send_twitter_thread_fn(twitter_content, image_url)
-                tw_status = f"✓ Успешно ({twitter_content['mode']})" if tw_success else "✗ Ошибка"
-                
-            except Exception as e:
-                logger.error(f"  ✗ Twitter: {e}")
-                import traceback
-                traceback.print_exc()
-                tw_status = "✗ Ошибка"
-        
-        # 8. Итоги
-        total_duration = time.time() - total_start
-        logger.info(f"\n📊 РЕЗУЛЬТАТЫ:")
-        logger.info(f"  Telegram: {'✓' if tg_success else '✗'}")
-        logger.info(f"  Twitter: {tw_status}")
-        logger.info(f"  Время: {total_duration:.2f}s\n")
-        
-        return tg_success
-        
-    except Exception as e:
-        logger.error(f"\n❌ КРИТИЧЕСКАЯ ОШИБКА: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return False
+            logger.error(f"✗ Ошибка форматирования '{question}': {e}")
+            results.append(None)
+    return results
+
+
+def format_batch(pairs, extract_tldr_fn, clean_text_fn, config_dict, workers=None):
+    """
+    Форматирует много ответов сразу без публикации (превью, бэкфилл, несколько каналов)
+    
+    pairs: [(question, answer), ...]
+    workers: число процессов; None/1 - в текущем процессе. Процессы
+        используются, только если на каждый приходится хотя бы
+        FORMAT_BATCH_MIN_PER_WORKER ответов. extract_tldr_fn и clean_text_fn
+        тогда должны быть функциями уровня модуля (pickle)
+    
+    Returns: список результатов render_post (dict или None) в порядке pairs
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    
+    # Конфиг компилируется один раз на пакет (если еще не RenderSpecs);
+    # в процессы уходит только нужная часть
+    if not isinstance(config_dict, RenderSpecs):
+        config_dict = compile_render_specs({q: config_dict[q] for q, _ in pairs if q in config_dict})
+    
+    workers = min(workers or 1, len(pairs) // FORMAT_BATCH_MIN_PER_WORKER)
+    if workers <= 1:
+        return _format_chunk(pairs, extract_tldr_fn, clean_text_fn, config_dict)
+    
+    chunk_size = -(-len(pairs) // workers)
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    
+    logger.info(f"📦 Пакетное форматирование: {len(pairs)} ответов, {len(chunks)} процессов")
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        futures = [executor.submit(_format_chunk, chunk, extract_tldr_fn, clean_text_fn, config_dict)
+                   for chunk in chunks]
+        return [post for future in futures for post in future.result()]
@@ -0,0 +1,500 @@
+"""
+outbox.py - Надежная очередь публикаций (outbox)
+
+Каждый отформатированный пост кладется в очередь отдельно для каждой
+платформы с ключом идемпотентности. Воркер (drain_outbox) публикует
+записи с повторными попытками и экспоненциальной паузой.
+Очередь хранится в JSON файле рядом с publication_history.json
+и переживает перезапуски: недоставленные записи будут отправлены
+при следующем запуске.
+
+Многошаговые публикации (Twitter треды) выполняются по шагам:
+обработчик сохраняет прогресс в entry["state"], назначает время
+следующего шага и возвращает IN_PROGRESS. Один на процесс OutboxScheduler
+(start_scheduler) в фоне выполняет шаги по мере наступления их времени,
+не блокируя основной запуск. Если платформа временно недоступна по лимитам,
+обработчик возвращает DEFERRED - запись ждет без расхода попыток.
+
+Перед вызовом обработчика запись забирается в работу (in-flight) под
+_outbox_lock: параллельные проходы (основной запуск и планировщик) не
+публикуют одну запись дважды. Перед выходом процесса wait_workers
+дожидается всех воркеров, чтобы результат успел сохраниться в outbox.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# НАСТРОЙКИ
+# ========================================
+
+OUTBOX_FILE = 'publish_outbox.json'
+
+MAX_PUBLISH_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30      # секунды, удваивается с каждой попыткой
+RETRY_MAX_DELAY = 3600     # секунды
+DONE_RETENTION_HOURS = 72  # сколько хранить доставленные записи (для идемпотентности)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Результаты обработчика (кроме True/False):
+# шаг выполнен, продолжение в entry["next_attempt_at"]
+IN_PROGRESS = "in_progress"
+# отправка отложена до entry["next_attempt_at"] (например лимит API), попытка не засчитывается
+DEFERRED = "deferred"
+
+_outbox_lock = threading.RLock()
+
+# Ключи записей, которые сейчас публикуются (под _outbox_lock)
+_in_flight = set()
+
+# Пулы drain_outbox, не дождавшиеся своих воркеров (таймаут) - ждем их в wait_workers
+_detached_executors = []
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# ========================================
+# ХРАНЕНИЕ
+# ========================================
+
+def make_idempotency_key(platform, question, content):
+    """Ключ идемпотентности: одинаковый контент для платформы = одна запись"""
+    raw = f"{platform}\n{question}\n{content}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def load_outbox(path=OUTBOX_FILE):
+    """Загружает очередь из JSON файла"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                outbox = json.load(f)
+                outbox.setdefault("entries", [])
+                return outbox
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка загрузки outbox: {e}")
+    return {"entries": []}
+
+
+def save_outbox(outbox, path=OUTBOX_FILE):
+    """Атомарно сохраняет очередь (временный файл + os.replace)"""
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.outbox-', suffix='.json', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(outbox, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logger.error(f"✗ Ошибка сохранения outbox: {e}")
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        return False
+
+
+def prune_outbox(outbox, now=None):
+    """Удаляет доставленные записи старше DONE_RETENTION_HOURS"""
+    now = now or time.time()
+    cutoff = now - DONE_RETENTION_HOURS * 3600
+    before = len(outbox["entries"])
+    outbox["entries"] = [
+        e for e in outbox["entries"]
+        if e.get("status") == STATUS_PENDING or e.get("updated_at", now) >= cutoff
+    ]
+    return before - len(outbox["entries"])
+
+# ========================================
+# ОЧЕРЕДЬ
+# ========================================
+
+def enqueue(platform, key, payload, path=OUTBOX_FILE):
+    """
+    Добавляет публикацию в очередь
+    Возвращает True если запись новая, False если ключ уже есть (дубликат)
+    """
+    with _outbox_lock:
+        outbox = load_outbox(path)
+
+        for entry in outbox["entries"]:
+            if entry.get("key") == key:
+                logger.info(f"ℹ️  {platform}: запись уже в outbox ({entry.get('status')}), пропускаю")
+                return False
+
+        now = time.time()
+        outbox["entries"].append({
+            "key": key,
+            "platform": platform,
+            "payload": payload,
+            "state": {},
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "last_error": ""
+        })
+        prune_outbox(outbox, now)
+
+        if not save_outbox(outbox, path):
+            return False
+
+        logger.info(f"📥 {platform}: публикация добавлена в outbox ({key[:8]})")
+        return True
+
+
+def pending_count(path=OUTBOX_FILE):
+    """Количество недоставленных записей"""
+    with _outbox_lock:
+        outbox = load_outbox(path)
+        return sum(1 for e in outbox["entries"] if e.get("status") == STATUS_PENDING)
+
+
+def entry_statuses(keys, path=OUTBOX_FILE):
+    """Статусы записей по ключам: {key: status} (ключей без записи в ответе нет)"""
+    keys = set(keys)
+    with _outbox_lock:
+        outbox = load_outbox(path)
+    return {e["key"]: e.get("status") for e in outbox["entries"] if e.get("key") in keys}
+
+
+def next_due_time(platforms, path=OUTBOX_FILE):
+    """
+    Время ближайшей ожидающей записи для указанных платформ (или None)
+    Записи в работе (in-flight) не учитываются: их время обновит воркер
+    """
+    with _outbox_lock:
+        outbox = load_outbox(path)
+        in_flight = set(_in_flight)
+    times = [
+        e.get("next_attempt_at", 0) for e in outbox["entries"]
+        if e.get("status") == STATUS_PENDING and e.get("platform") in platforms
+        and e.get("key") not in in_flight
+    ]
+    return min(times) if times else None
+
+
+def _update_entry(entry, path):
+    """Сохраняет изменения одной записи"""
+    with _outbox_lock:
+        outbox = load_outbox(path)
+        for i, stored in enumerate(outbox["entries"]):
+            if stored.get("key") == entry["key"]:
+                outbox["entries"][i] = entry
+                break
+        else:
+            outbox["entries"].append(entry)
+        save_outbox(outbox, path)
+
+
+def _retry_delay(attempts):
+    """Экспоненциальная пауза между попытками"""
+    return min(RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+
+
+def _claim_entry(key, path):
+    """
+    Забирает запись в работу: свежая копия из outbox или None, если запись
+    уже публикуется другим воркером, доставлена или ее время еще не пришло
+    """
+    with _outbox_lock:
+        if key in _in_flight:
+            return None
+        for stored in load_outbox(path)["entries"]:
+            if stored.get("key") != key:
+                continue
+            if stored.get("status") != STATUS_PENDING or stored.get("next_attempt_at", 0) > time.time():
+                return None
+            _in_flight.add(key)
+            return stored
+    return None
+
+
+def _process_entry(entry, handler, path):
+    """
+    Публикует одну запись и сохраняет результат
+    Возвращает статус или None, если запись забрал другой воркер
+    """
+    entry = _claim_entry(entry["key"], path)
+    if entry is None:
+        return None
+
+    try:
+        return _publish_entry(entry, handler, path)
+    finally:
+        with _outbox_lock:
+            _in_flight.discard(entry["key"])
+        # Планировщик мог ждать эту запись - у нее новое время
+        scheduler = _scheduler
+        if scheduler:
+            scheduler._wake.set()
+
+
+def _publish_entry(entry, handler, path):
+    """Вызывает обработчик для забранной записи и сохраняет результат"""
+    platform = entry["platform"]
+    entry["attempts"] += 1
+
+    try:
+        result = handler(entry)
+        error = "" if result else "handler returned False"
+    except Exception as e:
+        result = False
+        error = str(e)
+        logger.error(f"✗ {platform}: ошибка публикации из outbox: {e}")
+
+    now = time.time()
+    entry["updated_at"] = now
+
+    if result == IN_PROGRESS:
+        # Прогресс есть - счетчик неудачных попыток начинается заново
+        entry["attempts"] = 0
+        entry["last_error"] = ""
+        entry.setdefault("next_attempt_at", now)
+        wait_for = max(0, entry["next_attempt_at"] - now)
+        logger.info(f"⏳ {platform}: шаг выполнен ({entry['key'][:8]}), следующий через {wait_for:.0f}s")
+    elif result == DEFERRED:
+        entry["attempts"] -= 1
+        entry.setdefault("next_attempt_at", now)
+        wait_for = max(0, entry["next_attempt_at"] - now)
+        logger.info(f"⏸️  {platform}: отложено на {wait_for:.0f}s ({entry['key'][:8]})")
+    elif result:
+        entry["status"] = STATUS_DONE
+        entry["delivered_at"] = datetime.now(timezone.utc).isoformat()
+        entry["last_error"] = ""
+        logger.info(f"✓ {platform}: доставлено ({entry['key'][:8]}, попытка {entry['attempts']})")
+    elif entry["attempts"] >= MAX_PUBLISH_ATTEMPTS:
+        entry["status"] = STATUS_FAILED
+        entry["last_error"] = error
+        logger.error(f"✗ {platform}: исчерпаны попытки ({entry['attempts']}), запись помечена failed")
+    else:
+        delay = _retry_delay(entry["attempts"])
+        entry["next_attempt_at"] = now + delay
+        entry["last_error"] = error
+        logger.warning(f"⚠️ {platform}: не доставлено, повтор через {delay}s (попытка {entry['attempts']}/{MAX_PUBLISH_ATTEMPTS})")
+
+    _update_entry(entry, path)
+    return entry["status"]
+
+
+def _drain_platform(entries, handler, path, deadline):
+    """Публикует записи одной платформы по порядку"""
+    statuses = []
+    for entry in entries:
+        if deadline and time.time() >= deadline:
+            logger.warning(f"⚠️ {entry['platform']}: дедлайн outbox, остаток будет отправлен позже")
+            break
+        status = _process_entry(entry, handler, path)
+        if status is not None:
+            statuses.append(status)
+    return statuses
+
+
+def drain_outbox(handlers, path=OUTBOX_FILE, timeout=None):
+    """
+    Публикует все записи, у которых наступило время попытки
+
+    Args:
+        handlers: dict {platform: handler(entry) -> bool}
+        timeout: общий лимит времени (секунды); остаток остается в очереди
+
+    Returns:
+        dict {platform: [status, ...]} по обработанным записям
+    """
+    deadline = time.time() + timeout if timeout else None
+
+    with _outbox_lock:
+        outbox = load_outbox(path)
+
+    now = time.time()
+    due = {}
+    for entry in outbox["entries"]:
+        if entry.get("status") != STATUS_PENDING:
+            continue
+        if entry.get("next_attempt_at", 0) > now:
+            continue
+        if entry.get("platform") not in handlers:
+            continue
+        due.setdefault(entry["platform"], []).append(entry)
+
+    if not due:
+        logger.info("📭 Outbox: нет записей к отправке")
+        return {}
+
+    logger.info(f"📬 Outbox: к отправке {sum(len(v) for v in due.values())} записей ({', '.join(due)})")
+
+    # Платформы обрабатываются параллельно, записи одной платформы - по порядку
+    results = {}
+    executor = ThreadPoolExecutor(max_workers=len(due), thread_name_prefix="outbox")
+    try:
+        futures = {
+            executor.submit(_drain_platform, entries, handlers[platform], path, deadline): platform
+            for platform, entries in due.items()
+        }
+        remaining = max(0, deadline - time.time()) if deadline else None
+        done, not_done = wait_futures(futures, timeout=remaining)
+
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                logger.error(f"✗ Outbox {futures[future]}: {e}")
+                results[futures[future]] = []
+
+        for future in not_done:
+            logger.warning(f"⚠️ Outbox {futures[future]}: таймаут, запись останется в очереди")
+            results[futures[future]] = []
+    finally:
+        executor.shutdown(wait=False)
+        if any(not future.done() for future in futures):
+            # Воркер еще публикует - дождемся его перед выходом (wait_workers)
+            with _outbox_lock:
+                _detached_executors.append(executor)
+
+    return results
+
+
+# ========================================
+# ФОНОВЫЙ ПЛАНИРОВЩИК
+# ========================================
+
+class OutboxScheduler:
+    """
+    Фоновый воркер outbox: выполняет записи (и шаги тредов) по мере
+    наступления их времени, пока есть ожидающие записи и не истек timeout.
+    Прогресс хранится в outbox, поэтому после перезапуска работа продолжается
+    с того же места. Запускается через start_scheduler (один на процесс)
+    """
+
+    def __init__(self, handlers, path=OUTBOX_FILE, timeout=None):
+        self.handlers = handlers
+        self.path = path
+        self.deadline = time.time() + timeout if timeout else None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._exiting = False
+        self._thread = None
+
+    def start(self):
+        # Не daemon: процесс не завершится посреди публикации
+        self._thread = threading.Thread(target=self._run, name="outbox-scheduler")
+        self._thread.start()
+        logger.info("🗓️  Планировщик outbox запущен")
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                # Решение о выходе - под _scheduler_lock, чтобы wake() не потерялся
+                with _scheduler_lock:
+                    self._wake.clear()
+                    # Под _outbox_lock: запись не освободится между проверками
+                    with _outbox_lock:
+                        due_at = next_due_time(self.handlers, self.path)
+                        busy = bool(_in_flight)
+
+                    if due_at is None and not busy:
+                        self._exiting = True
+                        break
+
+                    if self.deadline and (due_at or time.time()) >= self.deadline:
+                        logger.info("🗓️  Следующий шаг outbox позже дедлайна - продолжим в следующий запуск")
+                        self._exiting = True
+                        break
+
+                if due_at is None:
+                    # Остались только записи в работе у другого воркера: ждем их освобождения
+                    self._wake.wait(self.deadline - time.time() if self.deadline else None)
+                    continue
+
+                self._wake.wait(max(0, due_at - time.time()))
+                if self._stop.is_set():
+                    break
+                if due_at > time.time():
+                    continue  # разбужен: в outbox новые записи или освободилась запись
+
+                remaining = self.deadline - time.time() if self.deadline else None
+                drain_outbox(self.handlers, self.path, timeout=remaining)
+        except Exception as e:
+            logger.error(f"✗ Ошибка планировщика outbox: {e}")
+        finally:
+            self._exiting = True
+
+    def wake(self, timeout=None):
+        """
+        Будит работающий планировщик (в outbox новые записи) и продлевает
+        дедлайн. Вызывается под _scheduler_lock
+        Возвращает False, если планировщик уже завершается
+        """
+        if self._exiting or not self.is_running():
+            return False
+        if self.deadline:
+            self.deadline = max(self.deadline, time.time() + timeout) if timeout else None
+        self._wake.set()
+        return True
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def join(self, timeout=None):
+        """Ждет завершения планировщика; возвращает True если он завершился"""
+        if self._thread:
+            self._thread.join(timeout)
+        return not self.is_running()
+
+
+def start_scheduler(handlers, path=OUTBOX_FILE, timeout=None):
+    """
+    Общий планировщик процесса: будит уже работающий или запускает новый
+    (второй планировщик публиковал бы те же шаги тредов параллельно)
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler and _scheduler.wake(timeout):
+            return _scheduler
+        _scheduler = OutboxScheduler(handlers, path, timeout).start()
+        return _scheduler
+
+
+def wait_workers(timeout=None):
+    """
+    Дожидается планировщика и воркеров drain_outbox перед выходом процесса
+    Планировщик, не успевший за timeout, останавливается после текущей записи
+    Возвращает True если планировщик завершился сам
+    """
+    finished = True
+    scheduler = _scheduler
+
+    if scheduler and scheduler.is_running():
+        finished = scheduler.join(timeout)
+        if not finished:
+            scheduler.stop()
+            scheduler.join()
+
+    with _outbox_lock:
+        executors = list(_detached_executors)
+        _detached_executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+    return finished
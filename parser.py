@@ -9,22 +9,23 @@
 """
 
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import time
 import json
 import traceback
 from datetime import datetime, timezone
-import requests
 import os
 import sys
 import random
 import logging
-import tweepy
 from io import BytesIO
 import tempfile
 import platform
 import re
+import threading
+import html
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from functools import lru_cache
 
 # Пытаемся импортировать fcntl (только Unix) - FIX BUG #15
 try:
@@ -34,20 +35,34 @@ except ImportError:
     HAS_FCNTL = False
     # На Windows fcntl недоступен - используем альтернативный механизм
 
+# playwright, bs4, tweepy и requests импортируются лениво - в функциях,
+# которым они нужны: импорт parser.py не тянет тяжелые зависимости
+
 # Импорт модуля улучшенного форматирования
-from formatting import send_improved, __version__ as formatting_version
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('parser.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from formatting import (render_tldr, extract_clean_tldr, format_batch,
+                        compile_render_specs, get_render_spec,
+                        split_telegram_message, utf16_length, MAX_TEXT_LENGTH,
+                        TWEET_DELAY)
+import outbox
+from pipeline import Pipeline, Stage
+import twitter_budget
+import profiles
+import answer_document
+import similarity
+
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """Настройка логирования (вызывается из main, а не при импорте модуля)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('parser.log', encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
 # Глобальные настройки
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', '2'))
 
@@ -57,6 +72,18 @@ import os
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+# Несколько чатов для рассылки (опционально, иначе только TELEGRAM_CHAT_ID):
+#   TELEGRAM_CHATS="-1001111,-1002222"  или JSON:
+#   TELEGRAM_CHATS='[{"chat_id": "-1001111"}, {"chat_id": "@channel", "image": false, "parse_mode": ""}]'
+#   parse_mode: "HTML" (по умолчанию) или "" - обычный текст (теги убираются)
+TELEGRAM_CHATS = os.getenv('TELEGRAM_CHATS', '')
+
+# Лимиты Telegram: ~1 сообщение/сек в личный чат, 20/мин в группу/канал, 30/сек всего
+TELEGRAM_PRIVATE_CHAT_INTERVAL = 1.0
+TELEGRAM_GROUP_CHAT_INTERVAL = 3.0
+TELEGRAM_GLOBAL_INTERVAL = 1.0 / 30
+TELEGRAM_BROADCAST_WORKERS = int(os.getenv('TELEGRAM_BROADCAST_WORKERS', '8'))
+
 # Twitter API настройки (только из Secrets)
 TWITTER_API_KEY = os.getenv('TWITTER_API_KEY')
 TWITTER_API_SECRET = os.getenv('TWITTER_API_SECRET')
@@ -67,9 +94,35 @@ TWITTER_BEARER_TOKEN = os.getenv('TWITTER_BEARER_TOKEN')
 # Включить/выключить Twitter (для тестирования)
 TWITTER_ENABLED = os.getenv('TWITTER_ENABLED', 'true').lower() == 'true'
 
+# Лимит времени на отправку из outbox за один запуск (остаток - в следующий запуск)
+OUTBOX_DRAIN_TIMEOUT = int(os.getenv('OUTBOX_DRAIN_TIMEOUT', '240'))
+
+# Размер пула HTTP соединений (общий для Twitter клиента и загрузки медиа)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+# Общий лимит времени на стартовые проверки (выполняются параллельно)
+STARTUP_VALIDATION_TIMEOUT = int(os.getenv('STARTUP_VALIDATION_TIMEOUT', '15'))
+
+# Сколько доверять успешной проверке (секунды); результат хранится в publication_history.json
+VALIDATION_CACHE_TTL = int(os.getenv('VALIDATION_CACHE_TTL', str(6 * 3600)))
+
+# Снимок списка вопросов (publication_history.json) используется, если
+# список на странице не прочитался, но снимок не старше (секунды)
+QUESTION_SNAPSHOT_TTL = int(os.getenv('QUESTION_SNAPSHOT_TTL', str(24 * 3600)))
+
+# Почти одинаковый ответ (similarity.py) в окне DUPLICATE_WINDOW_HOURS:
+# "fallback" - вместо него публикуется самая старая группа профиля,
+# "skip" - публикация пропускается, "off" - проверка выключена
+DUPLICATE_ACTION = os.getenv('DUPLICATE_ACTION', 'fallback').lower()
+
 # GitHub настройки для картинок
 GITHUB_IMAGES_URL = "https://raw.githubusercontent.com/BRKME/coinmarketcap-parser/main/Images1/"
-IMAGE_FILES = [f"{i}.jpg" for i in range(10, 101)]  # 10.jpg до 100.jpg (91 картинка)
+
+# Манифест картинок (собирается build_image_manifest.py из Images1/)
+IMAGE_MANIFEST_FILE = 'images_manifest.json'
+
+# Лимит Twitter на картинку - большие файлы не выбираются
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
 
 # Расписание публикаций (час UTC : тип вопроса)
 SCHEDULE = {
@@ -149,8 +202,25 @@ QUESTION_DISPLAY_CONFIG = {
     }
 }
 
+# Фразы, которые убираются из ответа: (часть вопроса, фраза)
+QUESTION_TEXT_CLEANERS = [
+    ("What upcoming events may impact crypto?", 
+     "These are the upcoming crypto events that may impact crypto the most:"),
+    ("What cryptos are showing bullish momentum?", 
+     "Here are the trending cryptos based on CoinMarketCap's evolving momentum algorithm (news, social, price momentum)"),
+    ("What are the trending narratives?", 
+     "Here are the trending narratives based on CoinMarketCap's evolving narrative algorithm (price, news, social momentum):")
+]
+
+# Стандартные группы для запасного выбора, если вопроса нужной группы нет
+FALLBACK_GROUPS = ["kols", "sentiment", "events", "bullish", "narratives", "altcoins"]
+
+# Селектор кнопок-вопросов на странице CMC AI
+QUESTION_CHIP_SELECTOR = 'div.BaseChip_labelWrapper__pQXPT'
+
+@lru_cache(maxsize=1024)
 def get_question_group(question_text):
-    """Определяет к какой группе относится вопрос"""
+    """Определяет к какой группе относится вопрос (результат запоминается)"""
     if not question_text:
         return "dynamic"
     
@@ -265,109 +335,87 @@ def release_lock(lock_file, lock_path):
     except Exception as e:
         logger.warning(f"⚠️ Не удалось удалить lock-файл: {e}")
 
-def get_twitter_length(text):
-    """
-    Вычисляет длину текста как Twitter (emoji = 2 символа) - FIX BUG #23
-    """
-    if not text:
-        return 0
-    
-    # Паттерн для emoji
-    emoji_pattern = re.compile("["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map
-        "\U0001F1E0-\U0001F1FF"  # flags
-        "\U00002702-\U000027B0"  # dingbats
-        "\U000024C2-\U0001F251"  # enclosed characters
-        "]+", flags=re.UNICODE)
-    
-    emoji_count = len(emoji_pattern.findall(text))
-    return len(text) + emoji_count  # Каждый emoji добавляет +1
-
-def validate_telegram_credentials():
+def validate_telegram_credentials(token=None, chats=None, profile_name=None):
     """Проверяет что Telegram токены валидные - FIX BUG #20"""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        logger.warning("⚠️ Telegram credentials не установлены")
+    if profile_name is None:
+        token, chats = TELEGRAM_BOT_TOKEN, get_telegram_chats()
+    label = f" ({profile_name})" if profile_name else ""
+    
+    if not token or not chats:
+        logger.warning(f"⚠️ Telegram credentials не установлены{label}")
         return False
     
     try:
         # Тестовый запрос getMe
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe"
-        response = requests.get(url, timeout=5)
+        url = f"https://api.telegram.org/bot{token}/getMe"
+        response = get_http_session().get(url, timeout=5)
         
         if response.status_code != 200:
-            logger.error(f"✗ Telegram токен невалидный: {response.status_code}")
+            logger.error(f"✗ Telegram токен невалидный{label}: {response.status_code}")
             return False
         
         bot_info = response.json()
         if not bot_info.get('ok'):
-            logger.error("✗ Telegram токен невалидный")
+            logger.error(f"✗ Telegram токен невалидный{label}")
             return False
         
         bot_username = bot_info.get('result', {}).get('username', 'unknown')
-        logger.info(f"✓ Telegram бот: @{bot_username}")
+        logger.info(f"✓ Telegram бот{label}: @{bot_username}")
         return True
         
     except Exception as e:
-        logger.error(f"✗ Ошибка проверки Telegram credentials: {e}")
+        logger.error(f"✗ Ошибка проверки Telegram credentials{label}: {e}")
         return False
 
-def validate_image_availability(sample_size=3):
-    """Проверяет что картинки доступны (выборочно) - FIX BUG #21, #25"""
-    if not IMAGE_FILES:
-        logger.warning("⚠️ Список картинок пуст")
+def validate_profiles_telegram():
+    """Проверяет Telegram credentials всех профилей (каждый бот - один getMe)"""
+    checked = {}
+    ok = True
+    for profile in get_profiles():
+        tg = profile["telegram"]
+        if not tg["bot_token"] or not tg["chats"]:
+            logger.error(f"✗ У профиля '{profile['name']}' нет Telegram бота или чатов")
+            ok = False
+            continue
+        if tg["bot_token"] not in checked:
+            checked[tg["bot_token"]] = validate_telegram_credentials(
+                tg["bot_token"], tg["chats"], profile_name=profile["name"]
+            )
+        ok = ok and checked[tg["bot_token"]]
+    return ok
+
+def validate_image_manifest():
+    """
+    Проверяет манифест картинок (без сетевых запросов) - FIX BUG #21, #25
+    Картинки в манифесте лежат в репозитории, поэтому доступны по GITHUB_IMAGES_URL
+    """
+    images = get_manifest_images()
+    if not images:
+        logger.warning("⚠️ Манифест картинок пуст или не найден")
+        logger.warning("   Соберите его: python build_image_manifest.py")
         logger.warning("   Публикация будет без картинок (только текст)")
-        return True  # Не критично, можно продолжать без картинок
-    
-    logger.info(f"🔍 Проверка доступности картинок ({sample_size} из {len(IMAGE_FILES)})...")
-    
-    # Проверяем случайные картинки
-    sample = random.sample(IMAGE_FILES, min(sample_size, len(IMAGE_FILES)))
-    
-    if not sample:
-        logger.warning("⚠️ Нечего проверять")
-        return True
+        return False  # Не блокирует выполнение
     
-    failed = 0
-    for img in sample:
-        url = GITHUB_IMAGES_URL + img
-        try:
-            response = requests.head(url, timeout=5)
-            if response.status_code == 200:
-                logger.info(f"  ✓ {img}")
-            else:
-                logger.warning(f"  ⚠️ {img} - статус {response.status_code}")
-                failed += 1
-        except Exception as e:
-            logger.warning(f"  ✗ {img} - ошибка: {e}")
-            failed += 1
-    
-    if failed == len(sample):
-        logger.error("✗ Все проверенные картинки недоступны!")
-        logger.error(f"   Проверьте URL: {GITHUB_IMAGES_URL}")
-        logger.warning("   Продолжаем без картинок (только текст)")
-        return True  # Не блокируем выполнение
-    elif failed > 0:
-        logger.warning(f"⚠️ {failed}/{len(sample)} картинок недоступны (продолжаем)")
-        return True
-    else:
-        logger.info(f"✓ Картинки доступны")
-        return True
+    logger.info(f"✓ Картинки: {len(images)} в манифесте")
+    return True
 
-def validate_display_config():
+def validate_display_config(display_config=None, specs=None):
     """
     Валидирует конфигурацию отображения (FIX BUG #7, #9, #10)
-    Проверяет что заголовки и хэштеги не слишком длинные
+    Проверяет что заголовки и хэштеги не слишком длинные.
+    Проверяются скомпилированные спеки - те же, по которым идет форматирование
     """
     logger.info("🔍 Валидация конфигурации отображения...")
     
     warnings_count = 0
     errors_count = 0
     
-    for question, config in QUESTION_DISPLAY_CONFIG.items():
-        title = config.get("title", "")
-        hashtags = config.get("hashtags", "")
+    if specs is None:
+        specs = compile_render_specs(display_config or QUESTION_DISPLAY_CONFIG,
+                                     get_question_group, QUESTION_TEXT_CLEANERS)
+    
+    for question, spec in specs.by_question.items():
+        title = spec.title
         
         # Проверка длины заголовка
         if len(title) > 50:
@@ -377,19 +425,19 @@ def validate_display_config():
             logger.warning(f"⚠️ Длинный заголовок для '{question[:30]}...': {len(title)} символов (рекомендуется < 40)")
             warnings_count += 1
         
-        # Проверка длины хэштегов (FIX BUG #10)
-        if len(hashtags) > 120:
-            logger.error(f"✗ Критически длинные хэштеги для '{question[:30]}...': {len(hashtags)} символов (максимум 120)")
+        # Проверка длины хэштегов (FIX BUG #10) - взвешенная длина Twitter
+        if spec.hashtags_length > 120:
+            logger.error(f"✗ Критически длинные хэштеги для '{question[:30]}...': {spec.hashtags_length} символов (максимум 120)")
             errors_count += 1
-        elif len(hashtags) > 80:
-            logger.warning(f"⚠️ Длинные хэштеги для '{question[:30]}...': {len(hashtags)} символов (рекомендуется < 80)")
+        elif spec.hashtags_length > 80:
+            logger.warning(f"⚠️ Длинные хэштеги для '{question[:30]}...': {spec.hashtags_length} символов (рекомендуется < 80)")
             warnings_count += 1
         
         # Проверка места для текста (минимум 100 символов!)
-        min_text_space = 270 - len(title) - len(hashtags) - 6
+        min_text_space = 270 - spec.twitter_header_length - spec.hashtags_length - 6
         if min_text_space < 100:
             logger.error(f"✗ Недостаточно места для текста в '{question[:30]}...': {min_text_space} символов (минимум 100)")
-            logger.error(f"   Заголовок: {len(title)} + Хэштеги: {len(hashtags)} = слишком много!")
+            logger.error(f"   Заголовок: {spec.twitter_header_length} + Хэштеги: {spec.hashtags_length} = слишком много!")
             errors_count += 1
     
     if errors_count > 0:
@@ -402,6 +450,114 @@ def validate_display_config():
     
     return errors_count == 0
 
+def validate_profiles_display_config():
+    """Валидирует конфигурацию отображения всех профилей"""
+    ok = True
+    all_profiles = get_profiles()
+    for profile in all_profiles:
+        if len(all_profiles) > 1:
+            logger.info(f"👤 Профиль '{profile['name']}'")
+        ok = validate_display_config(specs=get_render_specs(profile["name"])) and ok
+    return ok
+
+# ========================================
+# СТАРТОВЫЕ ПРОВЕРКИ (параллельно + кеш)
+# ========================================
+
+def _fingerprint(*parts):
+    """Короткий хэш входных данных проверки (секреты в историю не попадают)"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def get_startup_validations():
+    """
+    Стартовые проверки: (имя, функция, критичная, отпечаток входных данных)
+    Если входные данные изменились (новый токен, конфиг, список картинок),
+    отпечаток меняется и кеш не используется.
+    """
+    all_profiles = get_profiles()
+    return [
+        ("telegram", validate_profiles_telegram, True,
+         _fingerprint([(p["telegram"]["bot_token"], p["telegram"]["chats"]) for p in all_profiles])),
+        ("display_config", validate_profiles_display_config, True,
+         _fingerprint([p["display_config"] for p in all_profiles])),
+        ("images", validate_image_manifest, False,
+         _fingerprint(GITHUB_IMAGES_URL, [img["sha256"] for img in get_manifest_images()])),
+    ]
+
+def is_validation_cached(cache, name, fingerprint, now=None):
+    """Проверка недавно прошла успешно с теми же входными данными"""
+    entry = cache.get(name)
+    if not entry or entry.get("fingerprint") != fingerprint:
+        return False
+    now = now or time.time()
+    return now - entry.get("checked_at", 0) < VALIDATION_CACHE_TTL
+
+def run_startup_validations(history, timeout=STARTUP_VALIDATION_TIMEOUT):
+    """
+    Выполняет стартовые проверки параллельно с общим дедлайном
+    Успешные результаты кешируются в history["validation_cache"] на VALIDATION_CACHE_TTL
+    
+    Returns:
+        (ok, results): ok=False если провалилась критичная проверка;
+        results - dict {имя: True/False}
+    """
+    cache = history.setdefault("validation_cache", {})
+    now = time.time()
+    results = {}
+    pending = []
+    validations = get_startup_validations()
+    
+    for name, check, critical, fingerprint in validations:
+        if is_validation_cached(cache, name, fingerprint, now):
+            age_min = (now - cache[name]["checked_at"]) / 60
+            logger.info(f"✓ Проверка '{name}' пройдена {age_min:.0f} мин назад (кеш)")
+            results[name] = True
+        else:
+            pending.append((name, check, critical, fingerprint))
+    
+    if pending:
+        logger.info(f"🔍 Стартовые проверки: {', '.join(p[0] for p in pending)} (лимит {timeout}s)")
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="validation")
+        try:
+            futures = {executor.submit(check): (name, fingerprint)
+                       for name, check, critical, fingerprint in pending}
+            done, not_done = wait_futures(futures, timeout=timeout)
+            
+            for future in done:
+                name, fingerprint = futures[future]
+                try:
+                    results[name] = bool(future.result())
+                except Exception as e:
+                    logger.error(f"✗ Проверка '{name}' упала: {e}")
+                    results[name] = False
+                
+                if results[name]:
+                    cache[name] = {"fingerprint": fingerprint, "checked_at": time.time()}
+                else:
+                    cache.pop(name, None)
+            
+            for future in not_done:
+                name, _ = futures[future]
+                logger.error(f"✗ Проверка '{name}' не уложилась в {timeout}s")
+                results[name] = False
+                cache.pop(name, None)
+        finally:
+            executor.shutdown(wait=False)
+        
+        logger.info(f"⏱️  Стартовые проверки заняли {time.time() - start:.1f}s")
+        save_publication_history(history)
+    
+    ok = True
+    for name, check, critical, fingerprint in validations:
+        if critical and not results.get(name):
+            ok = False
+        elif not results.get(name):
+            logger.warning(f"⚠️ Некритичная проверка '{name}' не пройдена (продолжаем)")
+    
+    return ok, results
+
 def load_publication_history():
     """Загружает историю публикаций из JSON файла"""
     try:
@@ -463,118 +619,371 @@ def get_oldest_question_group(history):
     logger.info(f"📊 Самая старая группа: {oldest_group} (опубликована {oldest_time})")
     return oldest_group if oldest_group else "kols"
 
+def build_question_catalog(questions_list):
+    """
+    Каталог вопросов: каждый вопрос классифицируется один раз на список,
+    дальше поиск по группе - обращение к словарю
+    
+    Returns:
+        dict: questions (в порядке страницы), groups {группа: [вопросы]},
+              dynamic (динамические вопросы), fingerprint (отпечаток списка)
+    """
+    groups = {}
+    for q in questions_list:
+        groups.setdefault(get_question_group(q), []).append(q)
+    
+    return {
+        "questions": list(questions_list),
+        "groups": groups,
+        "dynamic": groups.get("dynamic", []),
+        "fingerprint": _fingerprint(list(questions_list))
+    }
+
+def as_question_catalog(questions):
+    """Каталог из списка вопросов (готовый каталог возвращается как есть)"""
+    if isinstance(questions, dict):
+        return questions
+    return build_question_catalog(questions or [])
+
 def find_question_by_group(questions_list, group_name):
-    """Находит вопрос из списка по группе"""
-    if not questions_list:
+    """Находит вопрос по группе (questions_list - список или каталог)"""
+    catalog = as_question_catalog(questions_list)
+    if not catalog["questions"]:
         logger.warning("⚠️ Пустой список вопросов")
         return None
     
-    for q in questions_list:
-        if get_question_group(q) == group_name:
-            logger.info(f"✓ Найден вопрос для группы '{group_name}': {q}")
-            return q
+    matches = catalog["groups"].get(group_name)
+    if matches:
+        logger.info(f"✓ Найден вопрос для группы '{group_name}': {matches[0]}")
+        return matches[0]
     
     logger.warning(f"⚠️ Не найден вопрос для группы '{group_name}'")
     return None
 
-def send_telegram_message(message, parse_mode='HTML'):
+def update_question_snapshot(history, questions_list, now=None):
+    """Запоминает список вопросов в истории (для следующих запусков)"""
+    fingerprint = _fingerprint(list(questions_list))
+    previous = history.get("question_snapshot") or {}
+    
+    if previous.get("fingerprint") == fingerprint:
+        logger.info("ℹ️  Список вопросов не изменился с прошлого запуска")
+    elif previous:
+        logger.info("📋 Список вопросов изменился с прошлого запуска")
+    
+    history["question_snapshot"] = {
+        "questions": list(questions_list),
+        "fingerprint": fingerprint,
+        "fetched_at": (now or datetime.now(timezone.utc)).isoformat()
+    }
+
+def get_question_snapshot(history, now=None):
+    """Список вопросов из снимка, если он не старше QUESTION_SNAPSHOT_TTL, иначе []"""
+    snapshot = history.get("question_snapshot") or {}
+    try:
+        fetched_at = datetime.fromisoformat(snapshot["fetched_at"])
+    except (KeyError, TypeError, ValueError):
+        return []
+    
+    age = ((now or datetime.now(timezone.utc)) - fetched_at).total_seconds()
+    if age > QUESTION_SNAPSHOT_TTL:
+        logger.warning(f"⚠️ Снимок списка вопросов устарел ({age / 3600:.1f} ч)")
+        return []
+    return list(snapshot.get("questions", []))
+
+def get_telegram_chats():
+    """
+    Возвращает список чатов для рассылки с опциями (профиль default)
+    [{"chat_id": str, "parse_mode": "HTML" | "", "image": bool}, ...]
+    """
+    return profiles.parse_telegram_chats(TELEGRAM_CHATS, TELEGRAM_CHAT_ID)
+
+# ========================================
+# ПРОФИЛИ КАНАЛОВ
+# ========================================
+
+_profiles = None
+
+def get_default_profile():
+    """Профиль default из глобальных настроек"""
+    keys = {
+        "api_key": TWITTER_API_KEY,
+        "api_secret": TWITTER_API_SECRET,
+        "access_token": TWITTER_ACCESS_TOKEN,
+        "access_token_secret": TWITTER_ACCESS_TOKEN_SECRET,
+        "bearer_token": TWITTER_BEARER_TOKEN,
+    }
+    return profiles.make_profile(
+        profiles.DEFAULT_PROFILE, SCHEDULE, QUESTION_DISPLAY_CONFIG,
+        TELEGRAM_BOT_TOKEN, get_telegram_chats(),
+        profiles.twitter_config(keys, profiles.DEFAULT_PROFILE, enabled=TWITTER_ENABLED)
+    )
+
+def get_profiles():
+    """Все профили каналов (default + profiles.json), загружаются один раз"""
+    global _profiles
+    if _profiles is None:
+        _profiles = profiles.load_profiles(get_default_profile(), twitter_enabled=TWITTER_ENABLED)
+        if len(_profiles) > 1:
+            logger.info(f"👥 Профили: {', '.join(p['name'] for p in _profiles)}")
+    return _profiles
+
+def get_profile(name=None):
+    """Профиль по имени (None или неизвестное имя - default)"""
+    name = name or profiles.DEFAULT_PROFILE
+    for profile in get_profiles():
+        if profile["name"] == name:
+            return profile
+    if name != profiles.DEFAULT_PROFILE:
+        logger.warning(f"⚠️ Профиль '{name}' не найден, использую default")
+    return get_default_profile()
+
+# Скомпилированные конфиги отображения по профилям (RenderSpecs)
+_render_specs = {}
+
+def get_render_specs(profile_name=None):
+    """
+    Конфиг отображения профиля, скомпилированный один раз за процесс:
+    эмодзи, заголовки, длины, сокращенные хэштеги, фразы для очистки
+    """
+    name = profile_name or profiles.DEFAULT_PROFILE
+    if name not in _render_specs:
+        _render_specs[name] = compile_render_specs(
+            get_profile(name)["display_config"], get_question_group, QUESTION_TEXT_CLEANERS
+        )
+    return _render_specs[name]
+
+def get_twitter_keys(account=None):
+    """Ключи Twitter аккаунта (по профилям) или None"""
+    account = account or profiles.DEFAULT_PROFILE
+    for profile in get_profiles():
+        if profile["twitter"] and profile["twitter"]["account"] == account:
+            return profile["twitter"]["keys"]
+    return None
+
+def get_twitter_accounts():
+    """Twitter аккаунты всех профилей (без повторов)"""
+    accounts = []
+    for profile in get_profiles():
+        if profile["twitter"] and profile["twitter"]["account"] not in accounts:
+            accounts.append(profile["twitter"]["account"])
+    return accounts
+
+class TelegramRateLimiter:
+    """Соблюдает лимиты Telegram: интервал на каждый чат и общий интервал бота"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chat_next = {}
+        self._global_next = 0.0
+    
+    @staticmethod
+    def chat_interval(chat_id):
+        # Группы и каналы (отрицательный id или @username) - 20 сообщений в минуту
+        chat_id = str(chat_id)
+        if chat_id.startswith('-') or chat_id.startswith('@'):
+            return TELEGRAM_GROUP_CHAT_INTERVAL
+        return TELEGRAM_PRIVATE_CHAT_INTERVAL
+    
+    def acquire(self, chat_id):
+        """Резервирует слот отправки и ждет его (без удержания блокировки)"""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._chat_next.get(chat_id, 0.0), self._global_next)
+            self._chat_next[chat_id] = slot + self.chat_interval(chat_id)
+            self._global_next = slot + TELEGRAM_GLOBAL_INTERVAL
+        
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+_telegram_limiter = TelegramRateLimiter()
+
+def telegram_api_call(method, payload, timeout=10, token=None):
+    """
+    Вызов Telegram Bot API с учетом лимитов
+    При 429 ждет retry_after (до 30 секунд) и повторяет один раз
+    token - бот профиля (по умолчанию TELEGRAM_BOT_TOKEN)
+    """
+    url = f"https://api.telegram.org/bot{token or TELEGRAM_BOT_TOKEN}/{method}"
+    
+    for attempt in range(2):
+        _telegram_limiter.acquire(payload.get('chat_id'))
+        response = get_http_session().post(url, data=payload, timeout=timeout)
+        
+        if response.status_code != 429 or attempt > 0:
+            return response
+        
+        try:
+            retry_after = int(response.json().get('parameters', {}).get('retry_after', 1))
+        except Exception:
+            retry_after = 1
+        
+        if retry_after > 30:
+            return response
+        
+        logger.warning(f"⚠️ Telegram 429 для {payload.get('chat_id')}, жду {retry_after}s")
+        time.sleep(retry_after)
+    
+    return response
+
+def strip_html_tags(text):
+    """Превращает HTML сообщение в обычный текст (для чатов без parse_mode)"""
+    return html.unescape(re.sub(r'<[^>]+>', '', text))
+
+def send_telegram_message(message, parse_mode='HTML', chat_id=None, token=None):
     """Отправляет сообщение в Telegram с разбивкой на части при необходимости"""
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    token = token or TELEGRAM_BOT_TOKEN
     try:
         # Проверка на пустые значения
-        if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID or TELEGRAM_BOT_TOKEN.strip() == "" or TELEGRAM_CHAT_ID.strip() == "":
+        if not token or not chat_id or token.strip() == "" or str(chat_id).strip() == "":
             logger.error("✗ Не заданы TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID")
             return False
         
-        max_length = 4000
+        if not parse_mode:
+            message = strip_html_tags(message)
+        
+        # Разбивка по UTF-16 длине с сохранением HTML разметки
+        parts = split_telegram_message(message, parse_html=bool(parse_mode))
+        
+        if not parts:
+            logger.error("✗ Пустое сообщение для Telegram")
+            return False
+        
+        if len(parts) > 1:
+            logger.info(f"📨 Сообщение длинное ({utf16_length(message)} UTF-16), разбиваю на {len(parts)} части...")
         
-        if len(message) <= max_length:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+        # Интервал между частями обеспечивает TelegramRateLimiter
+        for i, part in enumerate(parts, 1):
             payload = {
-                'chat_id': TELEGRAM_CHAT_ID,
-                'text': message,
-                'parse_mode': parse_mode
+                'chat_id': chat_id,
+                'text': part
             }
-            response = requests.post(url, data=payload, timeout=10)
-            if response.status_code == 200:
-                logger.info("✓ Сообщение отправлено в Telegram")
-                return True
-            else:
-                logger.error(f"✗ Ошибка отправки в Telegram: {response.status_code} - {response.text}")
-                return False
-        else:
-            logger.info(f"📨 Сообщение длинное ({len(message)} chars), разбиваю на части...")
-            parts = []
-            current_part = ""
-            
-            for line in message.split('\n'):
-                if len(current_part) + len(line) + 1 > max_length:
-                    if current_part:
-                        parts.append(current_part)
-                        current_part = line
-                    else:
-                        for i in range(0, len(line), max_length - 100):
-                            parts.append(line[i:i + max_length - 100])
-                else:
-                    current_part = current_part + "\n" + line if current_part else line
+            if parse_mode:
+                payload['parse_mode'] = parse_mode
+            response = telegram_api_call('sendMessage', payload, timeout=10, token=token)
             
-            if current_part:
-                parts.append(current_part)
+            if response.status_code != 200:
+                logger.error(f"✗ Ошибка отправки в Telegram ({chat_id}): {response.status_code} - {response.text}")
+                return False
             
-            for i, part in enumerate(parts, 1):
-                url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                payload = {
-                    'chat_id': TELEGRAM_CHAT_ID,
-                    'text': part,
-                    'parse_mode': parse_mode
-                }
-                response = requests.post(url, data=payload, timeout=10)
+            if len(parts) > 1:
                 logger.info(f"  ✓ Часть {i}/{len(parts)} отправлена")
-                time.sleep(0.5)
-            
-            return True
+        
+        logger.info(f"✓ Сообщение отправлено в Telegram ({chat_id})")
+        return True
             
     except Exception as e:
         logger.error(f"✗ Ошибка при отправке в Telegram: {e}")
         traceback.print_exc()
         return False
 
-def send_telegram_photo_with_caption(photo_url, caption, parse_mode='HTML'):
+def send_telegram_photo_with_caption(photo_url, caption, parse_mode='HTML', chat_id=None, token=None):
     """Отправляет фото с подписью в Telegram"""
+    chat_id = chat_id or TELEGRAM_CHAT_ID
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-        
         logger.info(f"🔍 Попытка отправить фото: {photo_url}")
         logger.info(f"📏 Длина caption: {len(caption)} символов")
         
         payload = {
-            'chat_id': TELEGRAM_CHAT_ID,
+            'chat_id': chat_id,
             'photo': photo_url
         }
-        response = requests.post(url, data=payload, timeout=30)
+        response = telegram_api_call('sendPhoto', payload, timeout=30, token=token)
         
+        # Результат = доставлен ли текст (без него публикация не состоялась)
         if response.status_code == 200:
-            logger.info("✓ Фото отправлено в Telegram")
-            time.sleep(1)
-            send_telegram_message(caption, parse_mode)
-            return True
+            logger.info(f"✓ Фото отправлено в Telegram ({chat_id})")
+            return send_telegram_message(caption, parse_mode, chat_id=chat_id, token=token)
         else:
             logger.warning(f"⚠️ Ошибка отправки фото: {response.status_code} - {response.text}")
             logger.info("⚠️ Отправляю только текст без фото")
-            send_telegram_message(caption, parse_mode)
-            return False
+            return send_telegram_message(caption, parse_mode, chat_id=chat_id, token=token)
                 
     except Exception as e:
         logger.error(f"✗ Ошибка при отправке фото в Telegram: {e}")
         traceback.print_exc()
         logger.info("⚠️ Отправляю только текст без фото")
-        send_telegram_message(caption, parse_mode)
-        return False
+        return send_telegram_message(caption, parse_mode, chat_id=chat_id, token=token)
+
+def broadcast_telegram(message, image_url=None, chats=None, skip=(), token=None):
+    """
+    Отправляет один пост во все чаты параллельно (с соблюдением лимитов Telegram)
+    
+    Args:
+        message: HTML сообщение
+        image_url: картинка (отправляется в чаты с image=True)
+        chats: список чатов (по умолчанию get_telegram_chats())
+        skip: chat_id, куда уже доставлено (при повторной попытке)
+        token: бот профиля (по умолчанию TELEGRAM_BOT_TOKEN)
+    
+    Returns:
+        dict {chat_id: bool} - результат доставки по каждому чату
+    """
+    chats = [c for c in (chats or get_telegram_chats()) if c["chat_id"] not in skip]
+    if not chats:
+        return {}
+    
+    def deliver(chat):
+        parse_mode = chat.get("parse_mode", "HTML")
+        if image_url and chat.get("image", True):
+            return send_telegram_photo_with_caption(image_url, message, parse_mode,
+                                                    chat_id=chat["chat_id"], token=token)
+        return send_telegram_message(message, parse_mode, chat_id=chat["chat_id"], token=token)
+    
+    results = {}
+    workers = max(1, min(len(chats), TELEGRAM_BROADCAST_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tg-broadcast") as executor:
+        futures = {executor.submit(deliver, chat): chat["chat_id"] for chat in chats}
+        for future, chat_id in futures.items():
+            try:
+                results[chat_id] = bool(future.result())
+            except Exception as e:
+                logger.error(f"✗ Telegram {chat_id}: {e}")
+                results[chat_id] = False
+    
+    delivered = sum(results.values())
+    logger.info(f"📣 Рассылка Telegram: {delivered}/{len(results)} чатов")
+    for chat_id, ok in results.items():
+        logger.info(f"  {'✓' if ok else '✗'} {chat_id}")
+    
+    return results
+
+_image_manifest = None
+
+def get_manifest_images():
+    """
+    Картинки из манифеста (читается один раз на процесс)
+    Файлы без размеров и больше MAX_IMAGE_BYTES пропускаются
+    """
+    global _image_manifest
+    if _image_manifest is None:
+        images = []
+        try:
+            with open(IMAGE_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                images = json.load(f).get("images", [])
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка загрузки манифеста картинок: {e}")
+        
+        _image_manifest = [
+            img for img in images
+            if img.get("file") and img.get("width") and img.get("height")
+            and 0 < img.get("bytes", 0) <= MAX_IMAGE_BYTES
+        ]
+        if len(_image_manifest) < len(images):
+            logger.warning(f"⚠️ Пропущено картинок из манифеста: {len(images) - len(_image_manifest)}")
+    return _image_manifest
 
 def get_random_image_url():
-    """Возвращает случайный URL картинки из GitHub"""
-    random_image = random.choice(IMAGE_FILES)
-    url = GITHUB_IMAGES_URL + random_image
-    logger.info(f"🎨 Выбрана картинка: {random_image}")
+    """Возвращает случайный URL картинки из манифеста (None если картинок нет)"""
+    images = get_manifest_images()
+    if not images:
+        logger.warning("⚠️ Нет картинок в манифесте - публикация без картинки")
+        return None
+    
+    image = random.choice(images)
+    url = GITHUB_IMAGES_URL + image["file"]
+    logger.info(f"🎨 Выбрана картинка: {image['file']} ({image['width']}x{image['height']}, {image['bytes'] // 1024} KB)")
     return url
 
 def extract_tldr_from_answer(answer):
@@ -583,21 +992,12 @@ def extract_tldr_from_answer(answer):
         if not answer:
             return ""
         
-        # Убираем строку "Researched for Xs"
-        answer = '\n'.join([line for line in answer.split('\n') if not line.strip().startswith('Researched for')])
+        # Один проход: без строк "Researched for Xs", секции TLDR / Deep Dive
+        sections = answer_document.parse_answer(answer)
+        answer = sections["text"]
         
-        # Ищем TLDR секцию
-        if 'TLDR' in answer:
-            tldr_start = answer.find('TLDR')
-            deep_dive_start = answer.find('Deep Dive')
-            
-            if deep_dive_start != -1:
-                tldr_section = answer[tldr_start:deep_dive_start].strip()
-            else:
-                tldr_section = answer[tldr_start:].strip()
-            
-            tldr_section = tldr_section.replace('TLDR', '', 1).strip()
-            return tldr_section
+        if sections["tldr"] is not None:
+            return sections["tldr"]
         else:
             logger.warning("⚠️ TLDR не найден, возвращаю первые 500 символов")
             return answer[:500] + ("..." if len(answer) > 500 else "")
@@ -612,518 +1012,511 @@ def clean_question_specific_text(question, text):
         if not text:
             return text
         
-        cleaners = [
-            ("What upcoming events may impact crypto?", 
-             "These are the upcoming crypto events that may impact crypto the most:"),
-            ("What cryptos are showing bullish momentum?", 
-             "Here are the trending cryptos based on CoinMarketCap's evolving momentum algorithm (news, social, price momentum)"),
-            ("What are the trending narratives?", 
-             "Here are the trending narratives based on CoinMarketCap's evolving narrative algorithm (price, news, social momentum):")
-        ]
+        # Фразы скомпилированы в спеке вопроса (get_render_specs)
+        spec = get_render_spec(get_render_specs(), question)
+        if spec.question is None:
+            # Вопроса нет в конфиге - проверяем фразы по тексту вопроса
+            for question_pattern, text_to_remove in QUESTION_TEXT_CLEANERS:
+                if question_pattern in question:
+                    text = text.replace(text_to_remove, "").strip()
+            return text
         
-        for question_pattern, text_to_remove in cleaners:
-            if question_pattern in question:
-                text = text.replace(text_to_remove, "").strip()
+        for pattern in spec.cleaners:
+            text = pattern.sub("", text).strip()
         
         return text
     except Exception as e:
         logger.error(f"⚠️ Ошибка очистки текста: {e}")
         return text
 
-def smart_shorten_for_twitter(text, title, hashtags, max_total=270):
-    """
-    Умное сокращение текста для Twitter (макс 280 символов)
-    Сохраняет полные предложения и не обрезает слова
-    FIX BUG #23 - учитывает emoji как 2 символа
-    """
-    import re
-    
-    # Резервируем место под заголовок, хэштеги и форматирование
-    # Формат: "Title\n\n[text]\n\n#hashtags"
-    # Используем get_twitter_length для правильного подсчета с emoji
-    reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
-    available_for_text = max_total - reserved
-    
-    # Защита от слишком длинных заголовков/хэштегов (FIX BUG #8)
-    # Минимум 100 символов для контента (было 50 - слишком мало!)
-    if available_for_text < 100:
-        logger.error(f"✗ Недостаточно места для текста: {available_for_text} символов")
-        logger.error(f"   Заголовок: {get_twitter_length(title)} символов (Twitter length)")
-        logger.error(f"   Хэштеги: {get_twitter_length(hashtags)} символов (Twitter length)")
-        
-        # Экстренная мера: агрессивно сокращаем хэштеги
-        if get_twitter_length(hashtags) > 80:
-            logger.warning("   Сокращаю хэштеги до первых 3-х для освобождения места")
-            hashtags_list = hashtags.split()[:3]
-            hashtags = " ".join(hashtags_list)
-            logger.warning(f"   Хэштеги сокращены до: {hashtags}")
-            
-            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
-            available_for_text = max_total - reserved
-            logger.info(f"   Теперь доступно: {available_for_text} символов")
-        elif get_twitter_length(hashtags) > 50:
-            hashtags_list = hashtags.split()[:5]
-            hashtags = " ".join(hashtags_list)
-            reserved = get_twitter_length(title) + get_twitter_length(hashtags) + 6
-            available_for_text = max_total - reserved
-    
-    # Убираем избыточные пробелы, но сохраняем структуру (FIX BUG #5)
-    text = re.sub(r'\n\s*\n+', '\n\n', text)
-    text = re.sub(r' +', ' ', text)
-    text = text.strip()
-    
-    # Если текст влезает полностью
-    if get_twitter_length(text) <= available_for_text:
-        return text
-    
-    # Разбиваем на предложения
-    sentences = re.split(r'([.!?]+\s*)', text)
-    sentences = ["".join(sentences[i:i+2]).strip() 
-                 for i in range(0, len(sentences)-1, 2) if sentences[i].strip()]
-    
-    # Собираем предложения пока влезают
-    result = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        
-        sent_length = get_twitter_length(sentence)
-        
-        if current_length + sent_length + 1 <= available_for_text:
-            result.append(sentence)
-            current_length += sent_length + 1
-        else:
-            if not result:
-                # Обрезаем по последнему слову
-                words = sentence.split()
-                shortened = []
-                for word in words:
-                    test_text = " ".join(shortened + [word])
-                    if get_twitter_length(test_text) + 3 <= available_for_text:
-                        shortened.append(word)
-                    else:
-                        break
-                if shortened:
-                    return " ".join(shortened) + "..."
-                else:
-                    return sentence[:available_for_text-3] + "..."
-            break
-    
-    return " ".join(result)
+# Общие на весь процесс объекты (создаются лениво при первом обращении)
+# HTTP сессии и Twitter клиенты по аккаунтам (None = default)
+_http_sessions = {}
+_twitter_clients = {}
+_shared_clients_lock = threading.RLock()
 
-def init_twitter_client():
-    """Инициализирует Twitter API клиент"""
+def get_http_session(account=None):
+    """
+    Возвращает общую HTTP сессию с пулом соединений.
+    Создается один раз на процесс, соединения переиспользуются между запросами.
+    У каждого Twitter аккаунта своя сессия: хук лимитов пишет в бюджет этого аккаунта
+    """
+    import requests  # ленивый импорт: не нужен при импорте модуля
+    account = account or profiles.DEFAULT_PROFILE
+    with _shared_clients_lock:
+        if account not in _http_sessions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # Лимиты Twitter читаются из заголовков ответов на публикацию
+            session.hooks['response'].append(twitter_budget.get_budget(account).response_hook)
+            _http_sessions[account] = session
+        return _http_sessions[account]
+
+def init_twitter_client(account=None):
+    """Инициализирует Twitter API клиент аккаунта (используйте get_twitter_client)"""
+    import tweepy  # ленивый импорт: нужен только для публикации в Twitter
     try:
+        keys = get_twitter_keys(account)
+        if keys is None and not account:
+            keys = {"api_key": TWITTER_API_KEY, "api_secret": TWITTER_API_SECRET,
+                    "access_token": TWITTER_ACCESS_TOKEN, "access_token_secret": TWITTER_ACCESS_TOKEN_SECRET,
+                    "bearer_token": TWITTER_BEARER_TOKEN}
+        
         # Проверяем обязательные ключи (Bearer Token опциональный!)
-        if not all([TWITTER_API_KEY, TWITTER_API_SECRET, 
-                    TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET]):
-            logger.warning("⚠️ Twitter API ключи не установлены (нужны: API_KEY, API_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)")
+        if not keys or not all(keys.get(k) for k in profiles.TWITTER_REQUIRED_KEYS):
+            logger.warning(f"⚠️ Twitter API ключи не установлены для '{account or profiles.DEFAULT_PROFILE}' (нужны: API_KEY, API_SECRET, ACCESS_TOKEN, ACCESS_TOKEN_SECRET)")
             return None
         
         # Bearer Token опциональный - нужен только для read операций
-        if not TWITTER_BEARER_TOKEN:
+        if not keys.get("bearer_token"):
             logger.info("ℹ️  Bearer Token не установлен (опционально для постинга)")
         
+        session = get_http_session(account)
+        
         # Tweepy v2 Client для API v2
         client = tweepy.Client(
-            bearer_token=TWITTER_BEARER_TOKEN,  # Может быть None - это ОК для постинга
-            consumer_key=TWITTER_API_KEY,
-            consumer_secret=TWITTER_API_SECRET,
-            access_token=TWITTER_ACCESS_TOKEN,
-            access_token_secret=TWITTER_ACCESS_TOKEN_SECRET,
-            wait_on_rate_limit=True
+            bearer_token=keys.get("bearer_token"),  # Может быть None - это ОК для постинга
+            consumer_key=keys["api_key"],
+            consumer_secret=keys["api_secret"],
+            access_token=keys["access_token"],
+            access_token_secret=keys["access_token_secret"],
+            # Не спим до 15 минут на 429 - лимиты ведет twitter_budget
+            wait_on_rate_limit=False
         )
+        client.session = session
         
         # API v1.1 для загрузки медиа (картинок)
         auth = tweepy.OAuth1UserHandler(
-            TWITTER_API_KEY,
-            TWITTER_API_SECRET,
-            TWITTER_ACCESS_TOKEN,
-            TWITTER_ACCESS_TOKEN_SECRET
+            keys["api_key"],
+            keys["api_secret"],
+            keys["access_token"],
+            keys["access_token_secret"]
         )
         api = tweepy.API(auth)
+        api.session = session
         
-        logger.info("✓ Twitter API клиент инициализирован")
+        logger.info(f"✓ Twitter API клиент инициализирован ({account or profiles.DEFAULT_PROFILE})")
         return {"client": client, "api": api}
         
     except Exception as e:
         logger.error(f"✗ Ошибка инициализации Twitter API: {e}")
         return None
 
-def send_to_twitter(title, text, hashtags, image_url):
+def get_twitter_client(account=None):
+    """
+    Возвращает общий Twitter клиент аккаунта (создается лениво, один на процесс).
+    Используется одиночным твитом, тредом и загрузкой медиа.
+    При неудачной инициализации следующий вызов попробует снова
+    """
+    key = account or profiles.DEFAULT_PROFILE
+    with _shared_clients_lock:
+        if _twitter_clients.get(key) is None:
+            _twitter_clients[key] = init_twitter_client(account)
+        return _twitter_clients[key]
+
+def reset_twitter_client(account=None):
+    """Сбрасывает общий Twitter клиент (например после смены ключей)"""
+    with _shared_clients_lock:
+        _twitter_clients.pop(account or profiles.DEFAULT_PROFILE, None)
+
+# Запас до истечения media_id (Twitter хранит загруженное медиа ~24 часа)
+MEDIA_EXPIRY_MARGIN = 600  # секунды
+
+def upload_twitter_media_info(image_url, account=None):
     """
-    Отправляет твит с картинкой
-    Возвращает True если успешно
+    Скачивает картинку и загружает ее в Twitter через общий клиент аккаунта
+    Возвращает {"media_id": ..., "expires_at": unix time, "account": ...} или None
+    (media_id принадлежит аккаунту, загрузившему картинку)
     """
+    if not image_url:
+        return None
+    
+    twitter = get_twitter_client(account)
+    if not twitter:
+        return None
+    
     try:
-        if not TWITTER_ENABLED:
-            logger.info("ℹ️  Twitter отключен (TWITTER_ENABLED=false)")
-            return False
-        
-        logger.info("\n🐦 ОТПРАВКА В TWITTER")
-        
-        # Инициализируем клиент
-        twitter = init_twitter_client()
-        if not twitter:
-            logger.error("✗ Не удалось инициализировать Twitter клиент")
-            return False
-        
-        client = twitter["client"]
-        api = twitter["api"]
-        
-        # Умное сокращение текста для Twitter
-        shortened_text = smart_shorten_for_twitter(text, title, hashtags, max_total=270)
-        
-        # Формируем твит
-        tweet_text = f"{title}\n\n{shortened_text}\n\n{hashtags}"
-        
-        # Проверяем длину
-        if len(tweet_text) > 280:
-            logger.warning(f"⚠️ Твит слишком длинный ({len(tweet_text)} символов), дополнительное сокращение...")
-            # Экстренное сокращение
-            max_text_length = 270 - len(title) - len(hashtags) - 6
-            shortened_text = text[:max_text_length-3] + "..."
-            tweet_text = f"{title}\n\n{shortened_text}\n\n{hashtags}"
-        
-        logger.info(f"📏 Длина твита: {len(tweet_text)} символов")
+        logger.info(f"🖼️  Загрузка картинки: {image_url}")
+        response = get_http_session(account).get(image_url, timeout=30)
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Не удалось скачать картинку: {response.status_code}")
+            return None
         
-        # Загружаем картинку
-        media_id = None
+        media = twitter["api"].media_upload(filename="image.jpg", file=BytesIO(response.content))
+        expires_after = getattr(media, 'expires_after_secs', None) or 86400
+        logger.info(f"✓ Картинка загружена, media_id: {media.media_id}")
+        return {"media_id": media.media_id, "expires_at": time.time() + expires_after,
+                "account": account or profiles.DEFAULT_PROFILE}
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка загрузки картинки: {e}")
+        return None
+
+def upload_twitter_media(image_url, account=None):
+    """Загружает картинку в Twitter, возвращает media_id или None"""
+    info = upload_twitter_media_info(image_url, account)
+    return info["media_id"] if info else None
+
+def get_payload_media_id(payload):
+    """
+    media_id для публикации: заранее загруженный этим же аккаунтом
+    (если еще не истек) или загружается сейчас
+    """
+    account = payload.get("account") or profiles.DEFAULT_PROFILE
+    media = payload.get("media")
+    if (media and media.get("account", profiles.DEFAULT_PROFILE) == account
+            and media.get("expires_at", 0) > time.time() + MEDIA_EXPIRY_MARGIN):
+        logger.info(f"🖼️  Использую заранее загруженную картинку (media_id: {media['media_id']})")
+        return media["media_id"]
+    return upload_twitter_media(payload.get("image_url"), payload.get("account"))
+
+def warm_up_connections(accounts=()):
+    """Открывает TLS соединения с API заранее (они остаются в пуле общей сессии)"""
+    targets = [("https://api.telegram.org", None)]
+    targets += [("https://api.twitter.com", account) for account in accounts]
+    
+    for host, account in targets:
         try:
-            logger.info(f"🖼️  Загрузка картинки: {image_url}")
-            
-            # Скачиваем картинку
-            response = requests.get(image_url, timeout=30)
-            if response.status_code == 200:
-                # Загружаем в Twitter
-                media = api.media_upload(filename="image.jpg", file=BytesIO(response.content))
-                media_id = media.media_id
-                logger.info(f"✓ Картинка загружена, media_id: {media_id}")
-            else:
-                logger.warning(f"⚠️ Не удалось скачать картинку: {response.status_code}")
+            get_http_session(account).head(host, timeout=5)
         except Exception as e:
-            logger.warning(f"⚠️ Ошибка загрузки картинки: {e}")
-        
-        # Публикуем твит
-        try:
-            if media_id:
-                response = client.create_tweet(text=tweet_text, media_ids=[media_id])
-            else:
-                response = client.create_tweet(text=tweet_text)
-            
-            # Проверка response (FIX BUG #19, #24)
-            if not response or not hasattr(response, 'data'):
-                logger.error("✗ Получен пустой ответ от Twitter API")
-                return False
-            
-            # Универсальное получение ID (dict или объект)
-            tweet_id = None
-            try:
-                # Пробуем как dict
-                if hasattr(response.data, 'get'):
-                    tweet_id = response.data.get('id')
-                # Пробуем как объект
-                elif hasattr(response.data, 'id'):
-                    tweet_id = response.data.id
-                # Fallback - прямой доступ
-                else:
-                    tweet_id = response.data['id'] if 'id' in response.data else None
-            except Exception as e:
-                logger.error(f"✗ Ошибка получения ID твита: {e}")
-                return False
-            
-            if not tweet_id:
-                logger.error("✗ В ответе Twitter отсутствует ID твита")
-                logger.error(f"   Response data: {response.data}")
-                return False
-            
-            tweet_url = f"https://twitter.com/user/status/{tweet_id}"
-            
-            logger.info(f"✓ Твит опубликован: {tweet_url}")
-            logger.info(f"📊 ID твита: {tweet_id}")
-            
-            return True
-            
-        except tweepy.TweepyException as e:
-            error_str = str(e)
-            logger.error(f"✗ Ошибка публикации твита: {e}")
-            
-            # Rate limit - не критично (FIX BUG #13)
-            if "rate limit" in error_str.lower() or "429" in error_str or "code\":88" in error_str:
-                logger.warning("⚠️ Twitter API rate limit достигнут")
-                logger.warning("   Пропускаем публикацию в Twitter (Telegram опубликован)")
-                return True  # Считаем успехом - Telegram опубликован
-            
-            # Если дубликат - это не критично (уже опубликовано ранее) (FIX BUG #4)
-            if "duplicate" in error_str.lower() or "already" in error_str.lower() or "code\":187" in error_str:
-                logger.warning("⚠️ Твит был опубликован ранее (дубликат)")
-                return True  # Считаем успехом
-            
-            # Пробуем без картинки только при других ошибках
-            if media_id:
-                logger.info("🔄 Повторная попытка без картинки...")
-                try:
-                    response = client.create_tweet(text=tweet_text)
-                    
-                    # Проверка response
-                    if response and hasattr(response, 'data') and 'id' in response.data:
-                        tweet_id = response.data['id']
-                        logger.info(f"✓ Твит опубликован без картинки, ID: {tweet_id}")
-                        return True
-                    else:
-                        logger.error("✗ Получен некорректный ответ")
-                        return False
-                        
-                except Exception as e2:
-                    logger.error(f"✗ Не удалось опубликовать даже без картинки: {e2}")
-            
-            return False
+            logger.warning(f"⚠️ Прогрев соединения {host}: {e}")
+
+def prepare_publication_assets(accounts=None):
+    """
+    Готовит все, что не зависит от текста ответа: выбирает картинку,
+    заранее загружает ее в Twitter (в каждый аккаунт) и прогревает соединения.
+    Выполняется параллельно с генерацией ответа AI
+    Возвращает {"image_url": ..., "media": {account: {...}}}
+    """
+    start = time.time()
+    assets = {"image_url": None, "media": {}}
+    accounts = get_twitter_accounts() if accounts is None else accounts
     
+    try:
+        assets["image_url"] = get_random_image_url()
     except Exception as e:
-        logger.error(f"✗ Критическая ошибка отправки в Twitter: {e}")
-        traceback.print_exc()
-        return False
-def send_twitter_thread(twitter_content, image_url):
-    """
-    Отправляет Twitter контент (тред или одиночный твит)
+        logger.warning(f"⚠️ Нет картинки: {e}")
     
-    Args:
-        twitter_content: dict с ключами:
-            - mode: "thread" или "single"
-            - tweets: list (для thread)
-            - tweet: str (для single)
-        image_url: URL картинки
+    warm_up_connections(accounts)
     
-    Returns:
-        bool: True если успешно
+    for account in accounts:
+        if assets["image_url"] and twitter_budget.get_budget(account).available() > 0:
+            assets["media"][account] = upload_twitter_media_info(assets["image_url"], account)
+    
+    logger.info(f"✓ Публикация подготовлена заранее за {time.time() - start:.1f}s")
+    return assets
+
+def render_answers(pairs, profile_name=None, workers=None):
+    """
+    Форматирует пакет (question, answer) для профиля без публикации
+    (превью, бэкфилл). Возвращает список render_post результатов
+    """
+    return format_batch(
+        pairs,
+        extract_tldr_from_answer,
+        clean_question_specific_text,
+        get_render_specs(profile_name),
+        workers=workers
+    )
+
+def enqueue_post(post, assets=None, profile=None):
+    """
+    Кладет готовую публикацию (render_post / render_tldr) в outbox
+    для получателей профиля (по умолчанию default).
+    Секреты в outbox не пишутся - только имя профиля, аккаунта и хэши чатов
+    Возвращает ключи записей {platform: key} (новых или уже бывших в очереди)
+    или None при ошибке
     """
     try:
-        if not TWITTER_ENABLED:
-            logger.info("ℹ️  Twitter отключен")
-            return False
-        
-        twitter = init_twitter_client()
-        if not twitter:
-            logger.error("✗ Не удалось инициализировать Twitter клиент")
-            return False
-        
-        client = twitter["client"]
-        api = twitter["api"]
-        
-        # Загружаем картинку
-        media_id = None
-        if image_url:
+        profile = profile or get_profile()
+        name = profile["name"]
+        question = post["question"]
+        assets = assets or {}
+        image_url = assets.get("image_url")
+        if not image_url:
             try:
-                logger.info(f"🖼️  Загрузка картинки...")
-                response = requests.get(image_url, timeout=30)
-                if response.status_code == 200:
-                    media = api.media_upload(filename="image.jpg", file=BytesIO(response.content))
-                    media_id = media.media_id
-                    logger.info(f"✓ Картинка загружена")
+                image_url = get_random_image_url()
             except Exception as e:
-                logger.warning(f"⚠️ Ошибка загрузки картинки: {e}")
+                logger.warning(f"⚠️ Нет картинки: {e}")
+        
+        def key(platform):
+            scope = platform if name == profiles.DEFAULT_PROFILE else f"{platform}/{name}"
+            return outbox.make_idempotency_key(scope, question, post["tldr"])
+        
+        # Одна картинка на пост - повторные попытки отправляют ту же
+        keys = {"telegram": key("telegram")}
+        outbox.enqueue(
+            "telegram",
+            keys["telegram"],
+            {"question": question, "profile": name, "message": post["telegram"],
+             "image_url": image_url,
+             "chats": [telegram_chat_ref(chat["chat_id"]) for chat in profile["telegram"]["chats"]]}
+        )
         
-        mode = twitter_content.get("mode", "single")
+        if profile["twitter"]:
+            account = profile["twitter"]["account"]
+            media = (assets.get("media") or {}).get(account) if assets.get("image_url") == image_url else None
+            keys["twitter"] = key("twitter")
+            outbox.enqueue(
+                "twitter",
+                keys["twitter"],
+                {"question": question, "profile": name, "account": account,
+                 "content": post["twitter"], "image_url": image_url, "media": media}
+            )
         
-        # РЕЖИМ: ТРЕД
-        if mode == "thread" and "tweets" in twitter_content:
-            tweets = twitter_content["tweets"]
-            
-            if not tweets or len(tweets) < 2:
-                logger.warning("⚠️ Тред слишком короткий, переключаюсь на single")
-                mode = "single"
-            else:
-                logger.info(f"🧵 Публикация треда из {len(tweets)} твитов...")
-                
-                previous_tweet_id = None
-                published_count = 0
-                
-                for i, tweet_text in enumerate(tweets, 1):
-                    try:
-                        logger.info(f"  📤 Твит {i}/{len(tweets)}: {len(tweet_text)} символов")
-                        
-                        if i == 1 and media_id:
-                            response = client.create_tweet(text=tweet_text, media_ids=[media_id])
-                        elif previous_tweet_id:
-                            response = client.create_tweet(text=tweet_text, in_reply_to_tweet_id=previous_tweet_id)
-                        else:
-                            response = client.create_tweet(text=tweet_text)
-                        
-                        if response and hasattr(response, 'data'):
-                            try:
-                                if hasattr(response.data, 'get'):
-                                    tweet_id = response.data.get('id')
-                                elif hasattr(response.data, 'id'):
-                                    tweet_id = response.data.id
-                                else:
-                                    tweet_id = response.data['id']
-                                
-                                if tweet_id:
-                                    previous_tweet_id = tweet_id
-                                    published_count += 1
-                                    logger.info(f"    ✓ Твит {i} опубликован")
-                                    
-                                    if i < len(tweets):
-                                        time.sleep(2)
-                                else:
-                                    logger.error(f"    ✗ Нет ID для твита {i}")
-                                    break
-                            except Exception as e:
-                                logger.error(f"    ✗ Ошибка получения ID твита {i}: {e}")
-                                break
-                        else:
-                            logger.error(f"    ✗ Пустой ответ для твита {i}")
-                            break
-                    
-                    except tweepy.TweepyException as e:
-                        error_str = str(e)
-                        
-                        if "rate limit" in error_str.lower() or "429" in error_str:
-                            logger.warning(f"⚠️ Rate limit на твите {i}")
-                            return published_count >= 1
-                        
-                        if "duplicate" in error_str.lower() or "187" in error_str:
-                            logger.warning(f"⚠️ Твит {i} дубликат, пропускаем")
-                            continue
-                        
-                        logger.error(f"✗ Ошибка публикации твита {i}: {e}")
-                        return published_count >= 1
-                
-                if published_count >= 2:
-                    logger.info(f"✓ Тред опубликован ({published_count} твитов)")
-                    return True
-                elif published_count == 1:
-                    logger.warning("⚠️ Опубликован только 1 твит (не тред)")
-                    return True
-                else:
-                    logger.error("✗ Не удалось опубликовать тред")
-                    return False
+        return keys
         
-        # РЕЖИМ: ОДИНОЧНЫЙ ТВИТ
-        if mode == "single":
-            tweet_text = twitter_content.get("tweet")
-            
-            if not tweet_text:
-                logger.error("✗ Нет текста твита")
-                return False
-            
-            logger.info(f"📏 Одиночный твит: {len(tweet_text)} символов")
-            
-            try:
-                if media_id:
-                    response = client.create_tweet(text=tweet_text, media_ids=[media_id])
-                else:
-                    response = client.create_tweet(text=tweet_text)
-                
-                if not response or not hasattr(response, 'data'):
-                    logger.error("✗ Пустой ответ от Twitter API")
-                    return False
-                
-                tweet_id = None
-                try:
-                    if hasattr(response.data, 'get'):
-                        tweet_id = response.data.get('id')
-                    elif hasattr(response.data, 'id'):
-                        tweet_id = response.data.id
-                    else:
-                        tweet_id = response.data['id']
-                except Exception as e:
-                    logger.error(f"✗ Ошибка получения ID: {e}")
-                    return False
-                
-                if tweet_id:
-                    logger.info(f"✓ Твит опубликован (ID: {tweet_id})")
-                    return True
-                else:
-                    logger.error("✗ Нет ID твита")
-                    return False
-                
-            except tweepy.TweepyException as e:
-                error_str = str(e)
-                
-                if "rate limit" in error_str.lower() or "429" in error_str:
-                    logger.warning("⚠️ Rate limit")
-                    return True
-                
-                if "duplicate" in error_str.lower() or "187" in error_str:
-                    logger.warning("⚠️ Дубликат твита")
-                    return True
-                
-                logger.error(f"✗ Ошибка: {e}")
-                
-                if media_id:
-                    logger.info("🔄 Попытка без картинки...")
-                    try:
-                        response = client.create_tweet(text=tweet_text)
-                        if response and hasattr(response, 'data'):
-                            logger.info("✓ Опубликовано без картинки")
-                            return True
-                    except:
-                        pass
-                
-                return False
-    
     except Exception as e:
-        logger.error(f"✗ Критическая ошибка: {e}")
-        import traceback
+        logger.error(f"✗ Ошибка постановки в outbox: {e}")
         traceback.print_exc()
-        return False        
+        return None
+
+def telegram_chat_ref(chat_id):
+    """
+    Ссылка на чат в outbox: хэш chat_id. Сами ID - секреты, а
+    publish_outbox.json коммитится в репозиторий
+    """
+    return hashlib.sha256(str(chat_id).encode('utf-8')).hexdigest()[:12]
 
-def send_question_answer_to_telegram(question, answer):
-    """Отправляет вопрос и TLDR в Telegram с картинкой. Возвращает True если успешно."""
+def publish_telegram_entry(entry):
+    """
+    Обработчик outbox для Telegram: рассылка во все чаты записи
+    Чаты берутся из профиля по ссылкам записи (telegram_chat_ref).
+    Доставленные чаты запоминаются, повторная попытка идет только в остальные
+    """
+    payload = entry["payload"]
+    state = entry["state"]
+    profile = get_profile(payload.get("profile"))
+    
+    refs = payload.get("chats")
+    chats = {telegram_chat_ref(chat["chat_id"]): chat for chat in profile["telegram"]["chats"]}
+    if refs:
+        missing = [ref for ref in refs if ref not in chats]
+        if missing:
+            logger.warning(f"⚠️ Telegram: {len(missing)} чатов записи больше нет в профиле '{profile['name']}'")
+        chats = {ref: chats[ref] for ref in refs if ref in chats}
+    if not chats:
+        logger.error(f"✗ Telegram: у профиля '{profile['name']}' нет чатов для записи")
+        return False
+    
+    delivered = set(state.get("delivered", []))
+    results = broadcast_telegram(payload["message"], payload.get("image_url"), list(chats.values()),
+                                 skip={chat["chat_id"] for ref, chat in chats.items() if ref in delivered},
+                                 token=profile["telegram"]["bot_token"])
+    
+    delivered.update(telegram_chat_ref(chat_id) for chat_id, ok in results.items() if ok)
+    state["delivered"] = sorted(delivered)
+    state["failed"] = sorted(telegram_chat_ref(chat_id) for chat_id, ok in results.items() if not ok)
+    
+    return all(ref in delivered for ref in chats)
+
+def extract_tweet_id(response):
+    """Достает ID твита из ответа tweepy (dict или объект)"""
+    if not response or not getattr(response, 'data', None):
+        return None
+    data = response.data
+    if hasattr(data, 'get'):
+        return data.get('id')
+    if hasattr(data, 'id'):
+        return data.id
+    return data['id'] if 'id' in data else None
+
+def post_tweet(text, media_id=None, reply_to=None, account=None):
+    """
+    Публикует один твит через общий клиент аккаунта
+    Возвращает ID твита; ошибки tweepy пробрасываются вызывающему
+    """
+    twitter = get_twitter_client(account)
+    if not twitter:
+        raise RuntimeError("Twitter клиент не инициализирован")
+    
+    kwargs = {"text": text}
+    if media_id:
+        kwargs["media_ids"] = [media_id]
+    if reply_to:
+        kwargs["in_reply_to_tweet_id"] = reply_to
+    
+    return extract_tweet_id(twitter["client"].create_tweet(**kwargs))
+
+def post_thread_step(entry):
+    """
+    Публикует следующий твит треда из записи outbox
+    
+    Первый твит - с картинкой, остальные - ответы на предыдущий.
+    ID родителя и номер следующего твита хранятся в entry["state"],
+    поэтому после перезапуска тред продолжается с того же места.
+    Следующий твит планируется через TWEET_DELAY (без sleep).
+    Дубликат (твит уже был опубликован) завершает тред - без ID родителя
+    продолжение не попало бы в тред.
+    """
+    import tweepy  # ленивый импорт: нужен только для публикации в Twitter
+    payload = entry["payload"]
+    tweets = payload["content"]["tweets"]
+    state = entry["state"]
+    
+    index = state.get("next_index", 0)
+    tweet_text = tweets[index]
+    media_id = get_payload_media_id(payload) if index == 0 else None
+    
+    logger.info(f"  📤 Твит {index + 1}/{len(tweets)}: {len(tweet_text)} символов")
+    
     try:
-        logger.info(f"\n📤 ОТПРАВКА (форматирование v{formatting_version})")
-        
-        telegram_success = send_improved(
-            question,
-            answer,
-            extract_tldr_from_answer,
-            clean_question_specific_text,
-            QUESTION_DISPLAY_CONFIG,
-            get_random_image_url,
-            send_telegram_photo_with_caption,
-            send_telegram_message,
-            send_twitter_thread,
-            TWITTER_ENABLED,
-            (TWITTER_API_KEY, TWITTER_API_SECRET, TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET)
-        )
-        
-        return telegram_success
-        
-    except Exception as e:
-        logger.error(f"✗ Ошибка при отправке: {e}")
-        import traceback
-        traceback.print_exc()
+        tweet_id = post_tweet(tweet_text, media_id=media_id, reply_to=state.get("parent_id"),
+                              account=payload.get("account"))
+    except tweepy.TooManyRequests:
+        logger.warning(f"⚠️ Rate limit на твите {index + 1}, продолжение треда отложено")
+        return defer_twitter_entry(entry)
+    except tweepy.TweepyException as e:
+        error_str = str(e)
+        if "duplicate" in error_str.lower() or "187" in error_str:
+            # ID уже опубликованного твита неизвестен - ответы без родителя ушли бы
+            # отдельными твитами вне треда, поэтому тред на этом завершается
+            logger.warning(f"⚠️ Твит {index + 1} дубликат - тред остановлен "
+                           f"({len(state.get('posted_ids', []))} твитов опубликовано)")
+            state["stopped_at"] = index
+            return True
+        logger.error(f"✗ Ошибка публикации твита {index + 1}: {e}")
         return False
-    """Отправляет вопрос и TLDR в Telegram с картинкой. Возвращает True если успешно."""
+    else:
+        if not tweet_id:
+            logger.error(f"    ✗ Нет ID для твита {index + 1}")
+            return False
+        state["parent_id"] = tweet_id
+        state.setdefault("posted_ids", []).append(tweet_id)
+        logger.info(f"    ✓ Твит {index + 1} опубликован")
+    
+    state["next_index"] = index + 1
+    
+    if state["next_index"] >= len(tweets):
+        logger.info(f"✓ Тред опубликован ({len(state.get('posted_ids', []))} твитов)")
+        return True
+    
+    entry["next_attempt_at"] = time.time() + TWEET_DELAY
+    return outbox.IN_PROGRESS
+
+def defer_twitter_entry(entry):
+    """Откладывает запись outbox до сброса лимитов Twitter"""
+    entry["next_attempt_at"] = twitter_budget.get_budget(entry["payload"].get("account")).next_reset()
+    return outbox.DEFERRED
+
+def post_single_tweet_step(entry):
+    """Публикует одиночный твит из записи outbox (с картинкой, при ошибке - без)"""
+    import tweepy  # ленивый импорт: нужен только для публикации в Twitter
+    payload = entry["payload"]
+    content = payload["content"]
+    tweet_text = content.get("tweet") or (content.get("tweets") or [""])[0]
+    
+    if not tweet_text:
+        logger.error("✗ Нет текста твита")
+        return False
+    
+    logger.info(f"📏 Одиночный твит: {len(tweet_text)} символов")
+    media_id = get_payload_media_id(payload)
+    
     try:
-        # Используем новый модуль форматирования v2.1
-        logger.info(f"\n📤 ОТПРАВКА (форматирование v{formatting_version})")
-        
-        telegram_success = send_improved(
-            question,
-            answer,
-            extract_tldr_from_answer,
-            clean_question_specific_text,
-            QUESTION_DISPLAY_CONFIG,
-            get_random_image_url,
-            send_telegram_photo_with_caption,
-            send_telegram_message,
-            send_to_twitter,
-            TWITTER_ENABLED,
-            (TWITTER_API_KEY, TWITTER_API_SECRET, TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET)
-        )
+        tweet_id = post_tweet(tweet_text, media_id=media_id, account=payload.get("account"))
+    except tweepy.TooManyRequests:
+        logger.warning("⚠️ Rate limit, твит отложен")
+        return defer_twitter_entry(entry)
+    except tweepy.TweepyException as e:
+        error_str = str(e)
+        if "duplicate" in error_str.lower() or "187" in error_str:
+            logger.warning("⚠️ Дубликат твита")
+            return True
         
-        return telegram_success
+        logger.error(f"✗ Ошибка: {e}")
+        if not media_id:
+            return False
         
-    except Exception as e:
-        logger.error(f"✗ Ошибка при отправке: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.info("🔄 Попытка без картинки...")
+        tweet_id = post_tweet(tweet_text, account=payload.get("account"))
+    
+    if not tweet_id:
+        logger.error("✗ Нет ID твита")
         return False
+    
+    logger.info(f"✓ Твит опубликован (ID: {tweet_id})")
+    return True
+
+def publish_twitter_entry(entry):
+    """
+    Обработчик outbox для Twitter
+    
+    Перед отправкой сверяется с бюджетом лимитов: тред публикуется, если
+    помещается целиком, иначе одиночный твит, иначе запись откладывается
+    до сброса лимита. Треды публикуются по шагам.
+    """
+    content = entry["payload"]["content"]
+    state = entry["state"]
+    account = entry["payload"].get("account")
+    budget = twitter_budget.get_budget(account)
+    logger.info(f"📊 Бюджет Twitter ({account or profiles.DEFAULT_PROFILE}): {budget.summary()}")
+    
+    tweets = content.get("tweets") or []
+    is_thread = (content.get("mode") == "thread" and len(tweets) >= 2
+                 and not state.get("single_fallback"))
+    
+    if is_thread:
+        started = state.get("next_index", 0) > 0
+        needed = 1 if started else len(tweets)
+        decision, defer_until = budget.plan(needed, can_fallback_single=not started and bool(content.get("tweet")))
+        
+        if decision == twitter_budget.PLAN_DEFER:
+            entry["next_attempt_at"] = defer_until
+            return outbox.DEFERRED
+        if started or decision == twitter_budget.PLAN_THREAD:
+            return post_thread_step(entry)
+        
+        # Тред не помещается в лимит - публикуем одиночный твит
+        state["single_fallback"] = True
+    
+    decision, defer_until = budget.plan(1)
+    if decision == twitter_budget.PLAN_DEFER:
+        entry["next_attempt_at"] = defer_until
+        return outbox.DEFERRED
+    
+    return post_single_tweet_step(entry)
+
+def get_outbox_handlers():
+    """Обработчики outbox для включенных платформ"""
+    handlers = {"telegram": publish_telegram_entry}
+    if get_twitter_accounts():
+        handlers["twitter"] = publish_twitter_entry
+    return handlers
+
+def drain_publication_outbox():
+    """
+    Отправляет все ожидающие публикации (включая оставшиеся с прошлых запусков).
+    Отложенные шаги (ответы в тредах) выполняет фоновый планировщик (один
+    на процесс - повторный вызов будит уже работающий), основной запуск их не ждет
+    Возвращает dict {platform: [status, ...]} первого прохода
+    """
+    logger.info("\n📤 ОТПРАВКА ИЗ OUTBOX")
+    handlers = get_outbox_handlers()
+    results = outbox.drain_outbox(handlers, timeout=OUTBOX_DRAIN_TIMEOUT)
+    
+    if outbox.next_due_time(handlers) is not None:
+        outbox.start_scheduler(handlers, timeout=OUTBOX_DRAIN_TIMEOUT)
+    
+    return results
+
+def wait_outbox_scheduler(timeout=OUTBOX_DRAIN_TIMEOUT):
+    """
+    Дожидается всех воркеров outbox перед выходом: планировщик - не дольше
+    timeout (затем он останавливается после текущей записи), результат
+    каждой начатой публикации сохраняется в outbox
+    """
+    logger.info("⏳ Ожидание воркеров outbox (треды, повторы)...")
+    if not outbox.wait_workers(timeout):
+        logger.info("⏹️  Планировщик outbox остановлен по таймауту")
+    
+    left = outbox.pending_count()
+    if left:
+        logger.warning(f"⚠️ В outbox осталось {left} записей - будут отправлены при следующем запуске")
 
 async def accept_cookies(page):
     """Принимает cookies если баннер появился"""
@@ -1215,6 +1608,8 @@ async def get_ai_response(page, question_text):
                         logger.info(f"  ✓ Ответ найден на попытке {attempt + 1}")
                         return full_text.strip()
 
+                from bs4 import BeautifulSoup  # ленивый импорт: нужен только в fallback
+
                 html = await page.content()
                 soup = BeautifulSoup(html, 'html.parser')
                 assistant_div = soup.find('div', class_=lambda x: x and 'message-assistant' in str(x))
@@ -1277,16 +1672,15 @@ async def click_and_get_response(page, question_text, attempt_num=1):
         return None
 
 async def get_all_questions(page):
-    """Получает список всех доступных вопросов"""
+    """Получает список всех доступных вопросов (тексты всех кнопок за один запрос к браузеру)"""
     try:
-        elements = await page.query_selector_all('div.BaseChip_labelWrapper__pQXPT')
+        texts = await page.eval_on_selector_all(QUESTION_CHIP_SELECTOR, "els => els.map(e => e.innerText)")
         
         questions_list = []
         seen = set()
         
-        for elem in elements:
-            text = await elem.inner_text()
-            text = text.strip()
+        for text in texts:
+            text = (text or "").strip()
             if text and text not in seen:
                 questions_list.append(text)
                 seen.add(text)
@@ -1297,148 +1691,293 @@ async def get_all_questions(page):
         logger.error(f"✗ Ошибка получения списка вопросов: {e}")
         return []
 
-async def main_parser():
-    """Главная функция парсера с умным расписанием"""
-    browser = None
+def select_question(questions_list, history, current_hour, schedule=None):
+    """
+    Выбирает вопрос для публикации по расписанию (по умолчанию SCHEDULE)
+    (динамический слот, fallback на самый старый вопрос, любой доступный)
+    Возвращает (question, scheduled_group); обновляет history["last_dynamic_question"]
+    questions_list - список вопросов или каталог (build_question_catalog)
+    """
+    catalog = as_question_catalog(questions_list)
+    scheduled_group = (schedule or SCHEDULE).get(current_hour)
+    
+    if not scheduled_group:
+        raise Exception(f"Нет расписания для часа {current_hour}")
+    
+    logger.info(f"\n⏰ Текущий час UTC: {current_hour}")
+    logger.info(f"📅 По расписанию должна быть группа: {scheduled_group}")
+    
+    # Определяем какой вопрос публиковать
+    question_to_publish = None
+    
+    if scheduled_group == "DYNAMIC":
+        logger.info("\n🎯 Динамический слот!")
+        
+        # Находим динамический вопрос
+        dynamic_question = catalog["dynamic"][0] if catalog["dynamic"] else None
+        
+        if dynamic_question:
+            last_dynamic = history.get("last_dynamic_question", "")
+            
+            if dynamic_question != last_dynamic:
+                logger.info(f"✨ Динамический вопрос изменился!")
+                logger.info(f"   Старый: {last_dynamic}")
+                logger.info(f"   Новый: {dynamic_question}")
+                question_to_publish = dynamic_question
+                
+                # Обновляем историю динамического вопроса
+                history["last_dynamic_question"] = dynamic_question
+            else:
+                logger.info(f"⚠️ Динамический вопрос не изменился: {dynamic_question}")
+                logger.info(f"   Ищем самый старый вопрос...")
+                oldest_group = get_oldest_question_group(history)
+                question_to_publish = find_question_by_group(catalog, oldest_group)
+                if question_to_publish:
+                    scheduled_group = oldest_group
+                else:
+                    logger.warning(f"⚠️ Не найден вопрос для группы {oldest_group}, публикуем динамический")
+                    question_to_publish = dynamic_question
+                    scheduled_group = "DYNAMIC"
+        else:
+            logger.warning("⚠️ Динамический вопрос не найден на странице")
+            logger.info("   Публикуем самый старый вопрос...")
+            oldest_group = get_oldest_question_group(history)
+            question_to_publish = find_question_by_group(catalog, oldest_group)
+            if question_to_publish:
+                scheduled_group = oldest_group
+            else:
+                raise Exception(f"Критическая ошибка: не найден вопрос для {oldest_group}")
+    else:
+        # Обычный слот по расписанию
+        question_to_publish = find_question_by_group(catalog, scheduled_group)
+    
+    # Fallback если вопрос для группы не найден (FIX BUG #14)
+    if not question_to_publish:
+        logger.warning(f"⚠️ Не найден вопрос для группы '{scheduled_group}'")
+        logger.warning(f"   Пытаюсь найти любой доступный вопрос...")
+        
+        # Пробуем найти хоть что-то из стандартных групп
+        for fallback_group in FALLBACK_GROUPS:
+            question_to_publish = find_question_by_group(catalog, fallback_group)
+            if question_to_publish:
+                logger.info(f"✓ Найден вопрос из группы '{fallback_group}': {question_to_publish}")
+                scheduled_group = fallback_group
+                break
+        
+        # Если совсем ничего - берем первый доступный
+        if not question_to_publish and catalog["questions"]:
+            question_to_publish = catalog["questions"][0]
+            scheduled_group = get_question_group(question_to_publish)
+            logger.info(f"✓ Выбран первый доступный вопрос: {question_to_publish}")
+    
+    if not question_to_publish:
+        raise Exception("Критическая ошибка: на странице нет вопросов!")
+    
+    logger.info(f"\n✅ Выбран вопрос для публикации: {question_to_publish}")
+    return question_to_publish, scheduled_group
+
+async def open_cmc_page(p):
+    """Запускает Chromium и открывает страницу CMC AI. Возвращает (browser, page)"""
+    logger.info("🌐 Загрузка страницы...")
+    
+    browser = await p.chromium.launch(
+        headless=True,
+        args=[
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-gpu',
+            '--single-process'
+        ]
+    )
+    
     try:
-        logger.info("="*70)
-        logger.info("🚀 ЗАПУСК ПАРСЕРА COINMARKETCAP AI v1.0")
-        logger.info("="*70)
+        context = await browser.new_context(
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            viewport={'width': 1920, 'height': 1080}
+        )
         
-        async with async_playwright() as p:
-            logger.info("🌐 Загрузка страницы...")
-
-            browser = await p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--single-process'
-                ]
-            )
+        page = await context.new_page()
+        
+        for attempt in range(3):
+            try:
+                await page.goto('https://coinmarketcap.com/cmc-ai/ask/', wait_until='domcontentloaded', timeout=20000)
+                logger.info("✓ Страница загружена")
+                break
+            except Exception as e:
+                if attempt < 2:
+                    logger.warning(f"⚠️ Попытка {attempt + 1} не удалась, пробую еще раз...")
+                    await asyncio.sleep(3)
+                else:
+                    raise
+        
+        logger.info("🍪 Проверка cookie-баннера...")
+        await accept_cookies(page)
+        
+        logger.info("⏳ Ожидание загрузки контента (5 секунд)...")
+        await asyncio.sleep(5)
+        
+        return browser, page
+    except BaseException:
+        await browser.close()
+        raise
 
-            context = await browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                viewport={'width': 1920, 'height': 1080}
+def plan_publications(questions_list, history, current_hour):
+    """
+    Выбирает вопрос для каждого профиля и группирует профили по вопросу:
+    одинаковый вопрос скрапится один раз. Каталог вопросов строится один
+    раз и общий для всех профилей
+    
+    Returns:
+        list [{"question": str, "targets": [{"profile": name, "group": group}, ...]}]
+    """
+    catalog = as_question_catalog(questions_list)
+    plan = {}
+    errors = []
+    all_profiles = get_profiles()
+    
+    for profile in all_profiles:
+        name = profile["name"]
+        if len(all_profiles) > 1:
+            logger.info(f"\n👤 Профиль '{name}'")
+        
+        if current_hour not in profile["schedule"]:
+            logger.info(f"ℹ️  Профиль '{name}': нет публикации в {current_hour}:00 UTC")
+            continue
+        
+        try:
+            question, group = select_question(
+                catalog, profiles.get_profile_history(history, name),
+                current_hour, profile["schedule"]
             )
+        except Exception as e:
+            logger.error(f"✗ Профиль '{name}': {e}")
+            errors.append(e)
+            continue
+        
+        plan.setdefault(question, []).append({"profile": name, "group": group})
+    
+    if not plan and errors:
+        raise errors[0]
+    
+    if len(all_profiles) > 1:
+        logger.info(f"\n📋 К скрапингу {len(plan)} вопросов для {sum(len(t) for t in plan.values())} публикаций")
+    return [{"question": question, "targets": targets} for question, targets in plan.items()]
 
-            page = await context.new_page()
-
-            for attempt in range(3):
-                try:
-                    await page.goto('https://coinmarketcap.com/cmc-ai/ask/', wait_until='domcontentloaded', timeout=20000)
-                    logger.info("✓ Страница загружена")
-                    break
-                except Exception as e:
-                    if attempt < 2:
-                        logger.warning(f"⚠️ Попытка {attempt + 1} не удалась, пробую еще раз...")
-                        await asyncio.sleep(3)
-                    else:
-                        raise
-
-            logger.info("🍪 Проверка cookie-баннера...")
-            await accept_cookies(page)
+def answer_fingerprint(question, answer):
+    """SimHash очищенного TLDR ответа (как его увидят подписчики)"""
+    tldr = extract_tldr_from_answer(answer)
+    return similarity.simhash(clean_question_specific_text(question, tldr) if tldr else answer)
 
-            logger.info("⏳ Ожидание загрузки контента (5 секунд)...")
-            await asyncio.sleep(5)
+def split_duplicate_targets(history, question, fingerprint, targets):
+    """
+    Делит получателей ответа на новых и тех, кому ответ почти повторяет
+    недавнюю публикацию (решение пишется в лог)
+    Returns: (fresh_targets, duplicate_targets)
+    """
+    fresh, duplicates = [], []
+    
+    for target in targets:
+        profile_history = profiles.get_profile_history(history, target["profile"])
+        match, distance = similarity.find_near_duplicate(fingerprint, profile_history.get("recent_answers"))
+        
+        if match is None:
+            if distance is not None:
+                logger.info(f"✓ Ответ новый для '{target['profile']}' (ближайший: {distance}/{similarity.SIMHASH_BITS} бит)")
+            fresh.append(target)
+            continue
+        
+        logger.warning(f"🔁 Профиль '{target['profile']}': ответ почти повторяет публикацию "
+                       f"{match.get('published_at', '?')} [{match.get('group', '?')}] "
+                       f"(отличие {distance}/{similarity.SIMHASH_BITS} бит, порог {similarity.DUPLICATE_MAX_DISTANCE})")
+        duplicates.append(target)
+    
+    return fresh, duplicates
 
-            # Получаем список всех вопросов
-            logger.info("\n🔍 ПОЛУЧЕНИЕ СПИСКА ВОПРОСОВ")
-            questions_list = await get_all_questions(page)
-            
-            if not questions_list:
-                raise Exception("Не найдено ни одного вопроса на странице!")
-            
-            for i, q in enumerate(questions_list, 1):
-                group = get_question_group(q)
-                logger.info(f"  {i}. {q} [{group}]")
+def plan_duplicate_fallback(catalog, history, duplicates, exclude):
+    """
+    Замена повторов: для каждого профиля - вопрос самой старой группы
+    (кроме уже полученных вопросов exclude). Замена повторно не заменяется
+    Returns: list [{"question": str, "targets": [...]}] как plan_publications
+    """
+    plan = {}
+    
+    for target in duplicates:
+        if target.get("fallback"):
+            logger.info(f"ℹ️  Профиль '{target['profile']}': замена тоже повтор - публикация пропущена")
+            continue
+        
+        oldest_group = get_oldest_question_group(profiles.get_profile_history(history, target["profile"]))
+        question = find_question_by_group(catalog, oldest_group)
+        if not question or question in exclude:
+            logger.info(f"ℹ️  Профиль '{target['profile']}': замены нет - публикация пропущена")
+            continue
+        
+        logger.info(f"🔄 Профиль '{target['profile']}': вместо повтора - группа '{oldest_group}': {question}")
+        plan.setdefault(question, []).append({"profile": target["profile"], "group": oldest_group, "fallback": True})
+    
+    return [{"question": question, "targets": targets} for question, targets in plan.items()]
 
-            # Загружаем историю публикаций
-            history = load_publication_history()
-            
-            # Определяем текущий час UTC
-            current_hour = datetime.now(timezone.utc).hour
-            scheduled_group = SCHEDULE.get(current_hour)
-            
-            if not scheduled_group:
-                raise Exception(f"Нет расписания для часа {current_hour}")
-            
-            logger.info(f"\n⏰ Текущий час UTC: {current_hour}")
-            logger.info(f"📅 По расписанию должна быть группа: {scheduled_group}")
-            
-            # Определяем какой вопрос публиковать
-            question_to_publish = None
-            
-            if scheduled_group == "DYNAMIC":
-                logger.info("\n🎯 Динамический слот!")
-                
-                # Находим динамический вопрос
-                dynamic_question = None
-                for q in questions_list:
-                    if get_question_group(q) == "dynamic":
-                        dynamic_question = q
-                        break
-                
-                if dynamic_question:
-                    last_dynamic = history.get("last_dynamic_question", "")
-                    
-                    if dynamic_question != last_dynamic:
-                        logger.info(f"✨ Динамический вопрос изменился!")
-                        logger.info(f"   Старый: {last_dynamic}")
-                        logger.info(f"   Новый: {dynamic_question}")
-                        question_to_publish = dynamic_question
-                        
-                        # Обновляем историю динамического вопроса
-                        history["last_dynamic_question"] = dynamic_question
-                    else:
-                        logger.info(f"⚠️ Динамический вопрос не изменился: {dynamic_question}")
-                        logger.info(f"   Ищем самый старый вопрос...")
-                        oldest_group = get_oldest_question_group(history)
-                        question_to_publish = find_question_by_group(questions_list, oldest_group)
-                        if question_to_publish:
-                            scheduled_group = oldest_group
-                        else:
-                            logger.warning(f"⚠️ Не найден вопрос для группы {oldest_group}, публикуем динамический")
-                            question_to_publish = dynamic_question
-                            scheduled_group = "DYNAMIC"
-                else:
-                    logger.warning("⚠️ Динамический вопрос не найден на странице")
-                    logger.info("   Публикуем самый старый вопрос...")
-                    oldest_group = get_oldest_question_group(history)
-                    question_to_publish = find_question_by_group(questions_list, oldest_group)
-                    if question_to_publish:
-                        scheduled_group = oldest_group
-                    else:
-                        raise Exception(f"Критическая ошибка: не найден вопрос для {oldest_group}")
-            else:
-                # Обычный слот по расписанию
-                question_to_publish = find_question_by_group(questions_list, scheduled_group)
-            
-            # Fallback если вопрос для группы не найден (FIX BUG #14)
-            if not question_to_publish:
-                logger.warning(f"⚠️ Не найден вопрос для группы '{scheduled_group}'")
-                logger.warning(f"   Пытаюсь найти любой доступный вопрос...")
-                
-                # Пробуем найти хоть что-то из стандартных групп
-                for fallback_group in ["kols", "sentiment", "events", "bullish", "narratives", "altcoins"]:
-                    question_to_publish = find_question_by_group(questions_list, fallback_group)
-                    if question_to_publish:
-                        logger.info(f"✓ Найден вопрос из группы '{fallback_group}': {question_to_publish}")
-                        scheduled_group = fallback_group
-                        break
-                
-                # Если совсем ничего - берем первый доступный
-                if not question_to_publish and questions_list:
-                    question_to_publish = questions_list[0]
-                    scheduled_group = get_question_group(question_to_publish)
-                    logger.info(f"✓ Выбран первый доступный вопрос: {question_to_publish}")
+async def scrape_answers(history, page_task):
+    """
+    Фаза скрапинга: выбирает вопросы для всех профилей и получает ответы AI
+    (каждый вопрос - один раз). Ответы отдаются по мере получения;
+    браузер закрывается сразу после последнего - публикация идет без него
+    
+    Args:
+        page_task: задача open_cmc_page (браузер запускается заранее)
+    
+    Yields:
+        dict: result, targets, hour, simhash, assets_task (подготовка публикации в фоне)
+    
+    Ответ, почти повторяющий недавнюю публикацию профиля, этому профилю не
+    отдается (см. DUPLICATE_ACTION)
+    """
+    browser = None
+    assets_tasks = []
+    try:
+        browser, page = await page_task
+        
+        # Получаем список всех вопросов
+        logger.info("\n🔍 ПОЛУЧЕНИЕ СПИСКА ВОПРОСОВ")
+        questions_list = await get_all_questions(page)
+        
+        if questions_list:
+            update_question_snapshot(history, questions_list)
+        else:
+            # Кнопки не прочитались - используем список прошлого запуска (клик все равно проверит кнопку)
+            questions_list = get_question_snapshot(history)
+            if questions_list:
+                logger.warning(f"⚠️ Список вопросов не прочитан, использую снимок: {len(questions_list)} вопросов")
+        
+        if not questions_list:
+            raise Exception("Не найдено ни одного вопроса на странице!")
+        
+        catalog = build_question_catalog(questions_list)
+        for i, q in enumerate(catalog["questions"], 1):
+            logger.info(f"  {i}. {q} [{get_question_group(q)}]")
+        
+        current_hour = datetime.now(timezone.utc).hour
+        plan = plan_publications(catalog, history, current_hour)
+        
+        scraped = skipped = 0
+        done = set()
+        # plan может пополниться заменами повторов - они скрапятся в этом же цикле
+        for index, planned in enumerate(plan):
+            question_to_publish = planned["question"]
+            done.add(question_to_publish)
+            accounts = []
+            for target in planned["targets"]:
+                twitter = get_profile(target["profile"])["twitter"]
+                if twitter and twitter["account"] not in accounts:
+                    accounts.append(twitter["account"])
             
-            if not question_to_publish:
-                raise Exception("Критическая ошибка: на странице нет вопросов!")
+            if index > 0:
+                await reset_to_question_list(page)
             
-            logger.info(f"\n✅ Выбран вопрос для публикации: {question_to_publish}")
+            # Пока AI генерирует ответ - готовим публикацию (картинка, медиа, соединения)
+            assets_task = asyncio.create_task(asyncio.to_thread(prepare_publication_assets, accounts))
+            assets_tasks.append(assets_task)
             
             # Парсим ответ на выбранный вопрос с повторными попытками
             result = None
@@ -1454,56 +1993,263 @@ async def main_parser():
                     break
             
             if not result:
-                raise Exception(f"Не удалось получить ответ после {MAX_RETRIES + 1} попыток")
-            
-            # Отправляем в Telegram
-            logger.info("\n📤 ОТПРАВКА В TELEGRAM")
-            send_success = send_question_answer_to_telegram(result['question'], result['answer'])
+                logger.error(f"✗ Не удалось получить ответ на '{question_to_publish}' после {MAX_RETRIES + 1} попыток")
+                assets_task.cancel()
+                continue
             
-            if not send_success:
-                logger.warning("⚠️ Ошибка отправки в Telegram, но продолжаем")
+            targets = planned["targets"]
+            fingerprint = answer_fingerprint(question_to_publish, result["answer"])
+            if DUPLICATE_ACTION != "off":
+                targets, duplicates = split_duplicate_targets(history, question_to_publish, fingerprint, targets)
+                if duplicates and DUPLICATE_ACTION == "fallback":
+                    for fallback in plan_duplicate_fallback(catalog, history, duplicates, done):
+                        pending = next((p for p in plan[index + 1:] if p["question"] == fallback["question"]), None)
+                        if pending:
+                            pending["targets"].extend(fallback["targets"])
+                        else:
+                            plan.append(fallback)
             
-            # Обновляем историю публикаций
-            if scheduled_group == "DYNAMIC":
-                history["dynamic_published_at"] = datetime.now(timezone.utc).isoformat()
-                history["last_published"]["dynamic"] = datetime.now(timezone.utc).isoformat()
-            else:
-                history["last_published"][scheduled_group] = datetime.now(timezone.utc).isoformat()
+            if not targets:
+                assets_task.cancel()
+                skipped += 1
+                continue
             
-            # Сохраняем дополнительную информацию для отладки
-            history["last_publication"] = {
-                "question": result['question'],
-                "group": scheduled_group,
-                "published_at": datetime.now(timezone.utc).isoformat(),
-                "hour_utc": current_hour,
-                "answer_length": result['length']
+            scraped += 1
+            yield {
+                "result": result,
+                "targets": targets,
+                "hour": current_hour,
+                "simhash": fingerprint,
+                "assets_task": assets_task
             }
-            
-            save_publication_history(history)
-            
+        
+        if plan and not scraped and not skipped:
+            raise Exception(f"Не удалось получить ответ после {MAX_RETRIES + 1} попыток")
+    
+    except BaseException:
+        for task in assets_tasks:
+            task.cancel()
+        raise
+    
+    finally:
+        # Браузер больше не нужен - закрываем до публикации
+        if browser:
+            try:
+                await browser.close()
+                logger.info("✓ Браузер закрыт\n")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка закрытия браузера: {e}")
+
+# ========================================
+# СТАДИИ КОНВЕЙЕРА (scrape -> extract -> format -> publish)
+# ========================================
+
+def extract_stage(item):
+    """Стадия extract: TLDR из ответа"""
+    item["tldr"] = extract_clean_tldr(
+        item["question"], item["answer"],
+        extract_tldr_from_answer, clean_question_specific_text
+    )
+    return item if item["tldr"] else None
+
+def format_stage(item):
+    """Стадия format: рендер для всех платформ (отдельно для каждого профиля)"""
+    # TLDR разбирается один раз - документ общий для всех профилей и платформ
+    doc = answer_document.parse_document(item["tldr"], MAX_TEXT_LENGTH)
+    item["posts"] = {
+        target["profile"]: render_tldr(item["question"], item["tldr"],
+                                       get_render_specs(target["profile"]), doc)
+        for target in item["targets"]
+    }
+    return item
+
+async def publish_stage(item):
+    """
+    Стадия publish: outbox + отправка.
+    Одновременно работает один воркер - outbox сам параллелит платформы
+    """
+    assets = {}
+    if item.get("assets_task"):
+        try:
+            assets = await item["assets_task"]
+        except Exception as e:
+            logger.warning(f"⚠️ Подготовка публикации не удалась: {e}")
+    
+    item["enqueued"] = {}
+    for name, post in item["posts"].items():
+        item["enqueued"][name] = await asyncio.to_thread(enqueue_post, post, assets, get_profile(name))
+        if not item["enqueued"][name]:
+            logger.warning(f"⚠️ Публикация не поставлена в очередь ({name})")
+    
+    await asyncio.to_thread(drain_publication_outbox)
+    
+    # Доставка - по ключам записей этого ответа, а не по всему проходу outbox
+    keys = [key for entry_keys in item["enqueued"].values() if entry_keys for key in entry_keys.values()]
+    statuses = await asyncio.to_thread(outbox.entry_statuses, keys)
+    item["delivery"] = {
+        name: {platform: statuses.get(key, outbox.STATUS_PENDING) for platform, key in entry_keys.items()}
+        for name, entry_keys in item["enqueued"].items() if entry_keys
+    }
+    return item
+
+def build_publish_pipeline():
+    """Конвейер публикации ответов"""
+    return Pipeline([
+        Stage("extract", extract_stage, concurrency=2),
+        Stage("format", format_stage, concurrency=2),
+        Stage("publish", publish_stage, concurrency=1),
+    ], name="publish")
+
+async def scrape_source(history, page_task):
+    """Источник конвейера: скрапинг (браузер закрывается сразу после последнего ответа)"""
+    async for scraped in scrape_answers(history, page_task):
+        result = scraped["result"]
+        yield {
+            "question": result["question"],
+            "answer": result["answer"],
+            "length": result["length"],
+            "targets": scraped["targets"],
+            "hour": scraped["hour"],
+            "simhash": scraped["simhash"],
+            "assets_task": scraped["assets_task"]
+        }
+
+def record_publication(history, item):
+    """
+    Отмечает группу опубликованной в истории каждого профиля, если пост
+    надежно сохранен в outbox (недоставленное будет отправлено повторно
+    при следующих запусках)
+    Возвращает количество отмеченных профилей
+    """
+    recorded = 0
+    
+    for target in item["targets"]:
+        if not item.get("enqueued", {}).get(target["profile"]):
+            continue
+        
+        profile_history = profiles.get_profile_history(history, target["profile"])
+        scheduled_group = target["group"]
+        
+        if scheduled_group == "DYNAMIC":
+            profile_history["dynamic_published_at"] = datetime.now(timezone.utc).isoformat()
+            profile_history["last_published"]["dynamic"] = datetime.now(timezone.utc).isoformat()
+        else:
+            profile_history["last_published"][scheduled_group] = datetime.now(timezone.utc).isoformat()
+        
+        # Сохраняем дополнительную информацию для отладки
+        profile_history["last_publication"] = {
+            "question": item['question'],
+            "group": scheduled_group,
+            "published_at": datetime.now(timezone.utc).isoformat(),
+            "hour_utc": item["hour"],
+            "answer_length": item['length'],
+            "delivery": dict(item.get("delivery", {}).get(target["profile"], {}))
+        }
+        if item.get("simhash") is not None:
+            profile_history["recent_answers"] = similarity.remember(
+                profile_history.get("recent_answers"), item["simhash"], item["question"], scheduled_group
+            )
+        recorded += 1
+    
+    return recorded
+
+def check_startup():
+    """Стартовые проверки с понятными сообщениями; False - запуск нужно прервать"""
+    validation_ok, validation_results = run_startup_validations(load_publication_history())
+    
+    if not validation_results.get("telegram"):
+        logger.error("✗ КРИТИЧЕСКАЯ ОШИБКА: Невалидные Telegram credentials!")
+        logger.error("   Проверьте TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID / TELEGRAM_CHATS")
+    if not validation_results.get("display_config"):
+        logger.error("\n✗ КРИТИЧЕСКАЯ ОШИБКА: Конфигурация невалидна!")
+        logger.error("   Исправьте ошибки в QUESTION_DISPLAY_CONFIG и перезапустите")
+    
+    logger.info("")
+    return validation_ok
+
+async def discard_page_task(page_task):
+    """Отменяет запуск браузера; open_cmc_page сам закрывает браузер при отмене"""
+    page_task.cancel()
+    try:
+        browser, _ = await page_task
+        await browser.close()
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка остановки браузера: {e}")
+    logger.info("✓ Запуск браузера отменен")
+
+async def main_parser():
+    """
+    Главная функция парсера с умным расписанием: конвейер скрапинг -> публикация.
+    Chromium и первая загрузка страницы стартуют сразу, параллельно
+    со стартовыми проверками; если критичная проверка не прошла - браузер
+    останавливается и запуск прерывается.
+    """
+    from playwright.async_api import async_playwright  # ленивый импорт: самая тяжелая зависимость
+    
+    async with async_playwright() as p:
+        page_task = asyncio.create_task(open_cmc_page(p))
+        
+        try:
+            startup_ok = await asyncio.to_thread(check_startup)
+        except BaseException:
+            await discard_page_task(page_task)
+            raise
+        
+        if not startup_ok:
+            await discard_page_task(page_task)
+            return False
+        
+        try:
+            return await run_publish_pipeline(page_task)
+        finally:
+            if not page_task.done():
+                await discard_page_task(page_task)
+
+async def run_publish_pipeline(page_task):
+    """Конвейер скрапинг -> публикация поверх уже запускаемого браузера"""
+    try:
+        logger.info("="*70)
+        logger.info("🚀 ЗАПУСК ПАРСЕРА COINMARKETCAP AI v1.0")
+        logger.info("="*70)
+        
+        # Загружаем историю публикаций (после проверок - в ней уже обновлен кеш)
+        history = load_publication_history()
+        
+        pipeline = build_publish_pipeline()
+        published = await pipeline.run(scrape_source(history, page_task))
+        
+        if not published:
+            if pipeline.source_stats["items"] == 0 and not pipeline.errors:
+                # Ни у одного профиля нет публикации в этот час (или все ответы - повторы)
+                await asyncio.to_thread(save_publication_history, history)
+                logger.info("ℹ️  Нечего публиковать в этот час")
+                return True
+            raise Exception("Ответ не прошел конвейер публикации")
+        
+        for item in published:
+            record_publication(history, item)
+        await asyncio.to_thread(save_publication_history, history)
+        
+        for item in published:
+            send_success = any(delivery.get("telegram") == outbox.STATUS_DONE
+                               for delivery in item.get("delivery", {}).values())
             logger.info(f"\n🎯 ИТОГ")
-            logger.info(f"  ✓ Вопрос: {result['question']}")
-            logger.info(f"  ✓ Группа: {scheduled_group}")
-            logger.info(f"  ✓ Длина ответа: {result['length']} символов")
+            logger.info(f"  ✓ Вопрос: {item['question']}")
+            for target in item["targets"]:
+                logger.info(f"  ✓ Профиль {target['profile']}: группа {target['group']}, "
+                            f"в outbox: {bool(item['enqueued'].get(target['profile']))}")
+            logger.info(f"  ✓ Длина ответа: {item['length']} символов")
             logger.info(f"  ✓ Опубликовано в Telegram: {send_success}")
-            logger.info("="*70)
-
-            await browser.close()
-            logger.info("✓ Браузер закрыт\n")
-            
-            return True
+        logger.info("="*70)
+        
+        return True
 
     except Exception as e:
         logger.error(f"\n❌ КРИТИЧЕСКАЯ ОШИБКА: {e}")
         logger.error(traceback.format_exc())
         
-        # Пытаемся закрыть браузер при ошибке
-        try:
-            if browser:
-                await browser.close()
-        except:
-            pass
-        
         # Ошибки только в логах (НЕ спамим в Telegram)
         logger.error("=" * 70)
         logger.error("Ошибка залогирована в parser.log")
@@ -1514,6 +2260,8 @@ async def main_parser():
 
 def main():
     """Точка входа в программу"""
+    setup_logging()
+    
     lock_file = None
     lock_path = None
     
@@ -1534,34 +2282,19 @@ def main():
         logger.info(f"⚙️  Настройки:")
         logger.info(f"   • MAX_RETRIES: {MAX_RETRIES}")
         logger.info(f"   • Telegram Bot Token: {'✓ Установлен' if TELEGRAM_BOT_TOKEN else '✗ Не установлен'}")
-        logger.info(f"   • Telegram Chat ID: {'✓ Установлен' if TELEGRAM_CHAT_ID else '✗ Не установлен'}")
+        logger.info(f"   • Telegram чаты: {len(get_telegram_chats()) or '✗ Не установлены'}")
         logger.info(f"   • Twitter API: {'✓ Установлен' if all([TWITTER_API_KEY, TWITTER_API_SECRET, TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SECRET]) else '✗ Не установлен'}")
         logger.info(f"   • Twitter Enabled: {'✓ Да' if TWITTER_ENABLED else '✗ Нет'}")
         logger.info(f"   • fcntl available: {'✓ Да' if HAS_FCNTL else '✗ Нет (Windows)'}")
         logger.info("="*70 + "\n")
         
-        # Валидация Telegram credentials (FIX BUG #20)
-        if not validate_telegram_credentials():
-            logger.error("✗ КРИТИЧЕСКАЯ ОШИБКА: Невалидные Telegram credentials!")
-            logger.error("   Проверьте TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID")
-            release_lock(lock_file, lock_path)
-            sys.exit(1)
-        
-        # Валидация конфигурации перед запуском (FIX BUG #9)
-        if not validate_display_config():
-            logger.error("\n✗ КРИТИЧЕСКАЯ ОШИБКА: Конфигурация невалидна!")
-            logger.error("   Исправьте ошибки в QUESTION_DISPLAY_CONFIG и перезапустите")
-            release_lock(lock_file, lock_path)
-            sys.exit(1)
-        
-        # Проверка доступности картинок (FIX BUG #21)
-        validate_image_availability(sample_size=3)
-        
-        logger.info("")
-        
-        # Запускаем основной парсер
+        # Запускаем основной парсер: браузер стартует параллельно
+        # со стартовыми проверками (FIX BUG #9, #20, #21)
         success = asyncio.run(main_parser())
         
+        # Дожидаемся отложенных шагов публикации (ответы в тредах)
+        wait_outbox_scheduler()
+        
         # Освобождаем lock
         release_lock(lock_file, lock_path)
         
@@ -1574,11 +2307,13 @@ def main():
             
     except KeyboardInterrupt:
         logger.info("\n⚠️ Парсинг прерван пользователем (Ctrl+C)")
+        wait_outbox_scheduler(timeout=0)
         release_lock(lock_file, lock_path)
         sys.exit(130)
     except Exception as e:
         logger.error(f"\n❌ КРИТИЧЕСКАЯ ОШИБКА В MAIN: {e}")
         logger.error(traceback.format_exc())
+        wait_outbox_scheduler()
         release_lock(lock_file, lock_path)
         sys.exit(1)
 
@@ -0,0 +1,154 @@
+"""
+pipeline.py - Потоковый конвейер обработки ответов
+
+Источник (scrape) -> стадии (extract -> format -> publish), связанные
+ограниченными asyncio очередями:
+- backpressure: быстрая стадия ждет, пока медленная освободит место в очереди
+- у каждой стадии своя параллельность
+- время работы каждой стадии собирается в статистику
+
+Функция стадии получает элемент (dict) и возвращает его (или новый dict);
+None - элемент отфильтрован. Синхронные функции выполняются в потоке,
+чтобы не блокировать event loop. Код стадий от конвейера не зависит.
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 4
+
+# Маркер конца потока
+_DONE = object()
+
+
+class Stage:
+    """Именованная стадия конвейера"""
+
+    def __init__(self, name, fn, concurrency=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.is_async = inspect.iscoroutinefunction(fn)
+        self.stats = {"items": 0, "dropped": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0}
+
+    async def process(self, item):
+        start = time.perf_counter()
+        try:
+            if self.is_async:
+                return await self.fn(item)
+            return await asyncio.to_thread(self.fn, item)
+        finally:
+            duration = time.perf_counter() - start
+            self.stats["items"] += 1
+            self.stats["total_time"] += duration
+            self.stats["max_time"] = max(self.stats["max_time"], duration)
+
+
+class Pipeline:
+    """Конвейер из стадий, связанных ограниченными очередями"""
+
+    def __init__(self, stages, name="pipeline"):
+        self.stages = stages
+        self.name = name
+        self.source_stats = {"items": 0, "total_time": 0.0}
+        self.errors = []
+
+    async def _feed(self, source, queue):
+        """Читает источник (обычный или async iterable) в первую очередь"""
+        start = time.perf_counter()
+        try:
+            if hasattr(source, '__aiter__'):
+                async for item in source:
+                    self.source_stats["items"] += 1
+                    await queue.put(item)
+            else:
+                for item in source:
+                    self.source_stats["items"] += 1
+                    await queue.put(item)
+        finally:
+            self.source_stats["total_time"] = time.perf_counter() - start
+            for _ in range(self.stages[0].concurrency if self.stages else 1):
+                await queue.put(_DONE)
+
+    async def _worker(self, stage, inbox, outbox):
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+
+            try:
+                result = await stage.process(item)
+            except Exception as e:
+                stage.stats["errors"] += 1
+                self.errors.append((stage.name, e))
+                logger.error(f"✗ Стадия '{stage.name}': {e}")
+                continue
+
+            if result is None:
+                stage.stats["dropped"] += 1
+                continue
+
+            await outbox.put(result)
+
+    async def _run_stage(self, stage, inbox, outbox, next_concurrency):
+        workers = [asyncio.create_task(self._worker(stage, inbox, outbox))
+                   for _ in range(stage.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            for _ in range(next_concurrency):
+                await outbox.put(_DONE)
+
+    async def run(self, source):
+        """
+        Прогоняет все элементы источника через стадии
+        Возвращает список результатов последней стадии
+        """
+        results_queue = asyncio.Queue()
+
+        if self.stages:
+            queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+            outputs = queues[1:] + [results_queue]
+
+            tasks = [asyncio.create_task(self._feed(source, queues[0]))]
+            for i, stage in enumerate(self.stages):
+                next_concurrency = self.stages[i + 1].concurrency if i + 1 < len(self.stages) else 1
+                tasks.append(asyncio.create_task(
+                    self._run_stage(stage, queues[i], outputs[i], next_concurrency)
+                ))
+        else:
+            # Без стадий источник (в том числе async) читается прямо в результаты
+            tasks = [asyncio.create_task(self._feed(source, results_queue))]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        results = []
+        while not results_queue.empty():
+            item = results_queue.get_nowait()
+            if item is not _DONE:
+                results.append(item)
+
+        self.log_stats()
+        return results
+
+    def log_stats(self):
+        """Логирует время работы каждой стадии"""
+        logger.info(f"\n⏱️  Конвейер '{self.name}':")
+        logger.info(f"  source: {self.source_stats['items']} шт, {self.source_stats['total_time']:.2f}s")
+        for stage in self.stages:
+            st = stage.stats
+            avg = st["total_time"] / st["items"] if st["items"] else 0.0
+            logger.info(f"  {stage.name}: {st['items']} шт, среднее {avg:.2f}s, макс {st['max_time']:.2f}s"
+                        f", отфильтровано {st['dropped']}, ошибок {st['errors']}")
@@ -0,0 +1,221 @@
+"""
+profiles.py - Профили каналов (несколько брендов на одном скрапинге)
+
+Профиль = расписание + конфиг отображения + получатели (Telegram чаты,
+Twitter аккаунт). Профиль "default" строится из глобальных настроек
+parser.py (SCHEDULE, QUESTION_DISPLAY_CONFIG, TELEGRAM_*, TWITTER_*),
+дополнительные описываются в profiles.json (необязательный файл).
+Каждый вопрос скрапится один раз и рассылается всем профилям, которым
+он нужен в этот час.
+
+Секреты в profiles.json не хранятся - только имена переменных окружения:
+
+    {
+      "include_default": true,
+      "profiles": [
+        {
+          "name": "brand2",
+          "schedule": {"0": "sentiment", "6": "market_direction", "12": "DYNAMIC"},
+          "display_config": {
+            "What is the market sentiment?": {"title": "Brand2 Mood", "hashtags": "#Brand2"}
+          },
+          "telegram": {"bot_token_env": "BRAND2_TELEGRAM_BOT_TOKEN", "chats_env": "BRAND2_TELEGRAM_CHATS"},
+          "twitter": {"env_prefix": "BRAND2_TWITTER_", "account": "brand2"}
+        }
+      ]
+    }
+
+- schedule: если не задан - расписание default; часы без записи пропускаются
+- display_config: переопределяет записи default по вопросу
+- telegram.chats: список/строка как в TELEGRAM_CHATS (или chats_env);
+  bot_token_env по умолчанию TELEGRAM_BOT_TOKEN
+- twitter: env_prefix + API_KEY / API_SECRET / ACCESS_TOKEN /
+  ACCESS_TOKEN_SECRET / BEARER_TOKEN; account - ключ клиента и бюджета
+  лимитов (профили с одинаковым account делят аккаунт). Нет секции - без Twitter
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# НАСТРОЙКИ
+# ========================================
+
+PROFILES_FILE = os.getenv('PROFILES_FILE', 'profiles.json')
+
+DEFAULT_PROFILE = "default"
+
+TWITTER_KEY_FIELDS = {
+    "api_key": "API_KEY",
+    "api_secret": "API_SECRET",
+    "access_token": "ACCESS_TOKEN",
+    "access_token_secret": "ACCESS_TOKEN_SECRET",
+    "bearer_token": "BEARER_TOKEN",
+}
+
+# Без этих ключей постинг невозможен (bearer_token опционален)
+TWITTER_REQUIRED_KEYS = ("api_key", "api_secret", "access_token", "access_token_secret")
+
+# ========================================
+# РАЗБОР НАСТРОЕК
+# ========================================
+
+def parse_telegram_chats(raw, fallback_chat_id=None):
+    """
+    Список чатов для рассылки с опциями
+    [{"chat_id": str, "parse_mode": "HTML" | "", "image": bool}, ...]
+
+    raw: JSON список, список dict/строк или строка "id1,id2"
+    fallback_chat_id: единственный чат, если raw пуст
+    """
+    chats = []
+    items = raw
+
+    if isinstance(raw, str):
+        raw = raw.strip()
+        if raw.startswith('['):
+            try:
+                items = json.loads(raw)
+            except Exception as e:
+                logger.error(f"✗ Ошибка разбора списка Telegram чатов: {e}")
+                items = []
+        else:
+            items = [c for c in raw.split(',') if c.strip()]
+
+    for item in items or []:
+        if isinstance(item, dict):
+            if str(item.get("chat_id", "")).strip():
+                chats.append({
+                    "chat_id": str(item["chat_id"]).strip(),
+                    "parse_mode": item.get("parse_mode", "HTML") or "",
+                    "image": bool(item.get("image", True))
+                })
+        elif str(item).strip():
+            chats.append({"chat_id": str(item).strip(), "parse_mode": "HTML", "image": True})
+
+    if not chats and fallback_chat_id and str(fallback_chat_id).strip():
+        chats = [{"chat_id": str(fallback_chat_id).strip(), "parse_mode": "HTML", "image": True}]
+
+    return chats
+
+
+def twitter_config(keys, account, enabled=True):
+    """Twitter секция профиля или None, если Twitter выключен / ключей нет"""
+    if not enabled or not all(keys.get(k) for k in TWITTER_REQUIRED_KEYS):
+        return None
+    return {"account": account, "keys": keys}
+
+
+def make_profile(name, schedule, display_config, bot_token, chats, twitter=None):
+    """Профиль канала (dict)"""
+    return {
+        "name": name,
+        "schedule": schedule,
+        "display_config": display_config,
+        "telegram": {"bot_token": bot_token, "chats": chats},
+        "twitter": twitter,
+    }
+
+
+def _profile_from_spec(spec, default, environ, twitter_enabled):
+    """Профиль из записи profiles.json (недостающее берется из default)"""
+    name = str(spec.get("name", "")).strip()
+    if not name:
+        raise ValueError("у профиля нет name")
+
+    schedule = default["schedule"]
+    if spec.get("schedule"):
+        schedule = {int(hour): group for hour, group in spec["schedule"].items()}
+
+    display_config = dict(default["display_config"])
+    display_config.update(spec.get("display_config") or {})
+
+    tg = spec.get("telegram") or {}
+    token_env = tg.get("bot_token_env")
+    bot_token = environ.get(token_env) if token_env else default["telegram"]["bot_token"]
+    if "chats" in tg:
+        chats = parse_telegram_chats(tg["chats"])
+    elif tg.get("chats_env"):
+        chats = parse_telegram_chats(environ.get(tg["chats_env"], ""))
+    else:
+        raise ValueError(f"у профиля '{name}' не заданы Telegram чаты (chats / chats_env)")
+
+    twitter = None
+    tw = spec.get("twitter")
+    if tw:
+        prefix = tw.get("env_prefix", "")
+        keys = {field: environ.get(prefix + suffix) for field, suffix in TWITTER_KEY_FIELDS.items()}
+        twitter = twitter_config(keys, tw.get("account") or name,
+                                 enabled=twitter_enabled and tw.get("enabled", True))
+        if not twitter and twitter_enabled and tw.get("enabled", True):
+            logger.warning(f"⚠️ Профиль '{name}': нет ключей Twitter ({prefix}*), только Telegram")
+
+    return make_profile(name, schedule, display_config, bot_token, chats, twitter)
+
+
+def load_profiles(default, path=PROFILES_FILE, environ=None, twitter_enabled=True):
+    """
+    Загружает профили: default (из глобальных настроек) + profiles.json
+    Некорректные профили пропускаются с ошибкой в логе
+    """
+    environ = os.environ if environ is None else environ
+
+    if not os.path.exists(path):
+        return [default]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.error(f"✗ Ошибка загрузки {path}: {e} - работаю только с профилем default")
+        return [default]
+
+    if isinstance(data, list):
+        data = {"profiles": data}
+
+    profiles = [default] if data.get("include_default", True) else []
+    names = {p["name"] for p in profiles}
+
+    for spec in data.get("profiles", []):
+        try:
+            profile = _profile_from_spec(spec, default, environ, twitter_enabled)
+        except Exception as e:
+            logger.error(f"✗ Профиль пропущен: {e}")
+            continue
+
+        if profile["name"] in names:
+            logger.error(f"✗ Профиль '{profile['name']}' уже есть - пропущен")
+            continue
+
+        names.add(profile["name"])
+        profiles.append(profile)
+
+    if not profiles:
+        logger.error(f"✗ В {path} нет корректных профилей - работаю с профилем default")
+        return [default]
+
+    return profiles
+
+
+# ========================================
+# ИСТОРИЯ
+# ========================================
+
+def get_profile_history(history, name):
+    """
+    История публикаций профиля
+    default хранится на верхнем уровне (совместимо со старым форматом),
+    остальные - в history["profiles"][name]
+    """
+    if name == DEFAULT_PROFILE:
+        target = history
+    else:
+        target = history.setdefault("profiles", {}).setdefault(name, {})
+
+    target.setdefault("last_published", {})
+    target.setdefault("last_dynamic_question", "")
+    target.setdefault("dynamic_published_at", "")
+    return target
@@ -0,0 +1,134 @@
+"""
+similarity.py - Поиск почти одинаковых ответов (SimHash)
+
+CMC AI часами отдает почти тот же TLDR на один вопрос (market_direction
+стоит в расписании 6 раз в день). Для каждого опубликованного TLDR в
+истории профиля хранится 64-битный SimHash; новый ответ сравнивается
+с отпечатками за последние DUPLICATE_WINDOW_HOURS часов по расстоянию
+Хэмминга.
+
+SimHash строится по шинглам из SHINGLE_SIZE слов нормализованного текста:
+регистр, пунктуация, emoji и форматирование не влияют, числа заменяются
+на 0 - ответ, где поменялись только цены и проценты, считается повтором.
+Отпечаток хранится в истории hex строкой:
+
+    "recent_answers": [
+        {"simhash": "9f3a...", "question": str, "group": str, "published_at": iso}
+    ]
+"""
+
+import os
+import re
+import hashlib
+from datetime import datetime, timezone, timedelta
+
+# ========================================
+# НАСТРОЙКИ
+# ========================================
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+# Окно сравнения (часы) и порог: расстояние <= порога - почти одинаковый ответ
+DUPLICATE_WINDOW_HOURS = float(os.getenv('DUPLICATE_WINDOW_HOURS', '12'))
+DUPLICATE_MAX_DISTANCE = int(os.getenv('DUPLICATE_MAX_DISTANCE', '10'))
+
+# Сколько отпечатков хранить на профиль (старые вне окна удаляются раньше)
+MAX_RECENT_ANSWERS = 50
+
+WORD_PATTERN = re.compile(r'[^\W_]+')
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*')
+
+# ========================================
+# ОТПЕЧАТКИ
+# ========================================
+
+def tokenize(text):
+    """Слова нормализованного текста (нижний регистр, числа -> 0)"""
+    return WORD_PATTERN.findall(NUMBER_PATTERN.sub('0', str(text or "").lower()))
+
+
+def simhash(text):
+    """64-битный SimHash по шинглам слов (0 для пустого текста)"""
+    tokens = tokenize(text)
+    if not tokens:
+        return 0
+
+    size = min(SHINGLE_SIZE, len(tokens))
+    weights = [0] * SIMHASH_BITS
+    for i in range(len(tokens) - size + 1):
+        shingle = ' '.join(tokens[i:i + size]).encode('utf-8')
+        # blake2b, а не hash(): отпечаток должен совпадать между запусками
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=SIMHASH_BITS // 8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a, b):
+    """Число различающихся бит"""
+    return bin(a ^ b).count('1')
+
+
+def format_fingerprint(value):
+    return f"{value:0{SIMHASH_BITS // 4}x}"
+
+
+def parse_fingerprint(value):
+    """Отпечаток из истории или None, если запись битая"""
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+# ========================================
+# ИСТОРИЯ
+# ========================================
+
+def _published_at(entry):
+    try:
+        return datetime.fromisoformat(entry["published_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def recent_entries(recent, window_hours=DUPLICATE_WINDOW_HOURS, now=None):
+    """Записи не старше окна"""
+    since = (now or datetime.now(timezone.utc)) - timedelta(hours=window_hours)
+    return [entry for entry in recent or []
+            if (_published_at(entry) or since) > since]
+
+
+def find_near_duplicate(fingerprint, recent, max_distance=DUPLICATE_MAX_DISTANCE,
+                        window_hours=DUPLICATE_WINDOW_HOURS, now=None):
+    """
+    Ближайший отпечаток в окне
+    Returns: (entry, distance) - entry только если distance <= max_distance;
+             (None, None) если сравнивать не с чем
+    """
+    closest, closest_distance = None, None
+    for entry in recent_entries(recent, window_hours, now):
+        value = parse_fingerprint(entry.get("simhash"))
+        if value is None:
+            continue
+        distance = hamming_distance(fingerprint, value)
+        if closest_distance is None or distance < closest_distance:
+            closest, closest_distance = entry, distance
+
+    if closest_distance is not None and closest_distance > max_distance:
+        closest = None
+    return closest, closest_distance
+
+
+def remember(recent, fingerprint, question, group, window_hours=DUPLICATE_WINDOW_HOURS, now=None):
+    """Новый список отпечатков: записи вне окна удалены, добавлен fingerprint"""
+    now = now or datetime.now(timezone.utc)
+    kept = recent_entries(recent, window_hours, now)
+    kept.append({
+        "simhash": format_fingerprint(fingerprint),
+        "question": question,
+        "group": group,
+        "published_at": now.isoformat()
+    })
+    return kept[-MAX_RECENT_ANSWERS:]
@@ -0,0 +1,31 @@
+"""
+Тесты answer_document: intro - первое предложение по границам sentences
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_document import parse_document, document_sentences
+
+
+class IntroTest(unittest.TestCase):
+
+    def test_decimal_does_not_end_intro(self):
+        doc = parse_document("Bitcoin is up 3.5% today as ETF inflows climbed. Ethereum follows.")
+        self.assertEqual(doc["intro"], "Bitcoin is up 3.5% today as ETF inflows climbed.")
+        self.assertEqual(doc["intro"], document_sentences(doc)[0])
+
+    def test_no_intro_without_sentence_end(self):
+        self.assertIsNone(parse_document("Bitcoin is up 3.5% today")["intro"])
+
+    def test_truncated_fragment_is_not_intro(self):
+        doc = parse_document("Bitcoin is up 3. 5% today", max_length=16)
+        self.assertTrue(doc["truncated"])
+        self.assertIsNone(doc["intro"])
+
+
+if __name__ == "__main__":
+    unittest.main()
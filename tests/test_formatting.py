@@ -0,0 +1,49 @@
+"""
+Тесты formatting: тред продолжает текст сразу после intro,
+разбивка Telegram сообщения на минимум частей
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import format_twitter_thread, split_telegram_message, utf16_length
+
+
+class ThreadIntroTest(unittest.TestCase):
+
+    def test_decimal_in_first_sentence(self):
+        text = ("Bitcoin is up 3.5% today as ETF inflows climbed. "
+                "Ethereum follows with 2.1% gains. Solana lags behind the majors.")
+        tweets = format_twitter_thread("Market Analysis", text, "#Crypto")
+
+        self.assertIn("Bitcoin is up 3.5% today as ETF inflows climbed.", tweets[0])
+        self.assertTrue(tweets[1].startswith("Ethereum follows with 2.1% gains. Solana lags behind the majors."))
+        self.assertNotIn("5% today", "".join(tweets[1:]))
+
+
+class SplitTelegramMessageTest(unittest.TestCase):
+
+    def test_parts_are_filled_across_lines(self):
+        line = " ".join(["word"] * 120)  # 599 единиц
+        text = "\n".join([line] * 10)
+        parts = split_telegram_message(text, max_units=1000)
+
+        # 10 строк по 599 не влезают по две, но 5999 единиц - это 6 частей
+        self.assertEqual(len(parts), 6)
+        self.assertTrue(all(utf16_length(part) <= 1000 for part in parts))
+        self.assertEqual(" ".join(parts).split(), text.split())
+
+    def test_tags_are_reopened(self):
+        text = "<b>" + " ".join(["word"] * 100) + "</b>"
+        parts = split_telegram_message(text, max_units=200)
+
+        self.assertEqual(len(parts), 3)
+        for part in parts:
+            self.assertTrue(part.startswith("<b>") and part.endswith("</b>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
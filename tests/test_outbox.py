@@ -0,0 +1,80 @@
+"""
+Тесты outbox: планировщик не крутит пустые проходы, пока запись в работе
+у другого воркера, и подхватывает ее после освобождения
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import outbox
+
+
+class SchedulerInFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "outbox.json")
+        outbox._scheduler = None
+
+    def tearDown(self):
+        outbox.wait_workers(timeout=5)
+        outbox._scheduler = None
+        self.tmp.cleanup()
+
+    def test_no_drains_while_claim_is_held(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def handler(entry):
+            calls.append(entry["state"].get("step", 0))
+            if not entry["state"]:
+                # Первый шаг держит запись, пока тест не отпустит
+                started.set()
+                release.wait(5)
+                entry["state"]["step"] = 1
+                entry["next_attempt_at"] = time.time()
+                return outbox.IN_PROGRESS
+            return True
+
+        handlers = {"x": handler}
+        outbox.enqueue("x", "k1", {}, self.path)
+
+        worker = threading.Thread(target=outbox.drain_outbox, args=(handlers, self.path))
+        worker.start()
+        self.assertTrue(started.wait(5))
+
+        drains = []
+        original = outbox.drain_outbox
+
+        def counting_drain(*args, **kwargs):
+            drains.append(time.time())
+            return original(*args, **kwargs)
+
+        with mock.patch.object(outbox, "drain_outbox", counting_drain):
+            self.assertIsNone(outbox.next_due_time(handlers, self.path))
+            scheduler = outbox.start_scheduler(handlers, self.path, timeout=10)
+            time.sleep(0.3)
+            self.assertEqual(drains, [])
+            self.assertTrue(scheduler.is_running())
+
+            release.set()
+            worker.join(5)
+            self.assertTrue(outbox.wait_workers(timeout=5))
+
+        # Второй шаг выполнил планировщик - ровно одним проходом
+        self.assertEqual(calls, [0, 1])
+        self.assertEqual(len(drains), 1)
+        entry = outbox.load_outbox(self.path)["entries"][0]
+        self.assertEqual(entry["status"], outbox.STATUS_DONE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+"""
+twitter_budget.py - Учет лимитов Twitter API (rate limit + дневная квота Free tier)
+
+Заголовки ответов POST /2/tweets (x-rate-limit-*, x-user-limit-24hour-*,
+x-app-limit-24hour-*) читаются хуком общей HTTP сессии, успешные посты
+считаются локально. Перед отправкой публикация спрашивает бюджет,
+помещается ли тред / одиночный твит, и если нет - откладывается
+до сброса лимита вместо блокирующего ожидания.
+Состояние хранится в JSON файле и переживает перезапуски.
+У каждого аккаунта (профиля канала) свой бюджет и свой файл.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# НАСТРОЙКИ
+# ========================================
+
+BUDGET_FILE = 'twitter_budget.json'
+
+# Free tier: лимит постов на пользователя за 24 часа
+DAILY_POST_LIMIT = int(os.getenv('TWITTER_DAILY_POST_LIMIT', '17'))
+
+DAY_SECONDS = 24 * 3600
+
+# Эндпоинт публикации твитов (другие запросы на бюджет не влияют)
+TWEETS_ENDPOINT = '/2/tweets'
+
+# Решения планировщика
+PLAN_THREAD = "thread"
+PLAN_SINGLE = "single"
+PLAN_DEFER = "defer"
+
+
+def _int_header(headers, name):
+    """Читает целочисленный заголовок или None"""
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TwitterBudget:
+    """Персистентный бюджет публикаций Twitter"""
+
+    def __init__(self, path=BUDGET_FILE, daily_limit=DAILY_POST_LIMIT):
+        self.path = path
+        self.daily_limit = daily_limit
+        self._lock = threading.RLock()
+        self._state = self._load()
+
+    # ---------- хранение ----------
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                    state.setdefault("posts", [])
+                    state.setdefault("limits", {})
+                    return state
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка загрузки бюджета Twitter: {e}")
+        return {"posts": [], "limits": {}}
+
+    def _save(self):
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка сохранения бюджета Twitter: {e}")
+
+    # ---------- учет ----------
+
+    def record_response(self, status_code, headers, now=None):
+        """Обновляет бюджет по ответу POST /2/tweets"""
+        now = now or time.time()
+        with self._lock:
+            limits = self._state["limits"]
+            for window, prefix in (("window", "x-rate-limit"),
+                                   ("user_day", "x-user-limit-24hour"),
+                                   ("app_day", "x-app-limit-24hour")):
+                remaining = _int_header(headers, f"{prefix}-remaining")
+                reset = _int_header(headers, f"{prefix}-reset")
+                if remaining is not None and reset is not None:
+                    limits[window] = {"remaining": remaining, "reset": reset}
+
+            if status_code == 429:
+                logger.warning("⚠️ Twitter 429: лимит исчерпан, публикации будут отложены")
+                # Без заголовков считаем исчерпанным 15-минутное окно
+                if "window" not in limits or limits["window"].get("reset", 0) <= now:
+                    limits["window"] = {"remaining": 0, "reset": int(now) + 15 * 60}
+            elif 200 <= status_code < 300:
+                self._state["posts"].append(now)
+
+            self._state["posts"] = [t for t in self._state["posts"] if t > now - DAY_SECONDS]
+            self._state["updated_at"] = now
+            self._save()
+
+    def response_hook(self, response, *args, **kwargs):
+        """Хук requests.Session: учитывает только публикации твитов"""
+        try:
+            request = response.request
+            if request.method == 'POST' and request.path_url.split('?')[0] == TWEETS_ENDPOINT:
+                self.record_response(response.status_code, response.headers)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка учета лимитов Twitter: {e}")
+        return response
+
+    # ---------- решения ----------
+
+    def available(self, now=None):
+        """Сколько твитов можно опубликовать прямо сейчас"""
+        now = now or time.time()
+        with self._lock:
+            recent = [t for t in self._state["posts"] if t > now - DAY_SECONDS]
+            counts = [self.daily_limit - len(recent)]
+            for limit in self._state["limits"].values():
+                if limit.get("reset", 0) > now:
+                    counts.append(limit.get("remaining", 0))
+            return max(0, min(counts))
+
+    def next_reset(self, now=None):
+        """Ближайшее время, когда бюджет увеличится"""
+        now = now or time.time()
+        with self._lock:
+            candidates = [
+                limit["reset"] for limit in self._state["limits"].values()
+                if limit.get("reset", 0) > now and limit.get("remaining", 0) <= 0
+            ]
+            recent = sorted(t for t in self._state["posts"] if t > now - DAY_SECONDS)
+            if len(recent) >= self.daily_limit and recent:
+                candidates.append(recent[0] + DAY_SECONDS)
+            return max(candidates) if candidates else now + 15 * 60
+
+    def plan(self, tweet_count, can_fallback_single=True, now=None):
+        """
+        Решает, что можно опубликовать
+
+        Returns:
+            (PLAN_THREAD | PLAN_SINGLE | PLAN_DEFER, defer_until или None)
+        """
+        available = self.available(now)
+        if available >= tweet_count:
+            return (PLAN_THREAD if tweet_count > 1 else PLAN_SINGLE), None
+        if available >= 1 and can_fallback_single:
+            logger.warning(f"⚠️ Бюджет Twitter: доступно {available} из {tweet_count} твитов - одиночный твит")
+            return PLAN_SINGLE, None
+
+        defer_until = self.next_reset(now)
+        logger.warning(f"⚠️ Бюджет Twitter исчерпан (доступно {available}), публикация отложена "
+                       f"на {max(0, defer_until - (now or time.time())) / 60:.0f} мин")
+        return PLAN_DEFER, defer_until
+
+    def summary(self, now=None):
+        """Короткое описание для логов"""
+        now = now or time.time()
+        with self._lock:
+            recent = len([t for t in self._state["posts"] if t > now - DAY_SECONDS])
+        return f"{self.available(now)} доступно, {recent}/{self.daily_limit} за 24ч"
+
+
+_budgets = {}
+_budget_lock = threading.Lock()
+
+
+def budget_path(account=None):
+    """Файл бюджета аккаунта: основной - BUDGET_FILE, остальные - twitter_budget-<account>.json"""
+    if not account or account == "default":
+        return BUDGET_FILE
+    safe = re.sub(r'[^A-Za-z0-9_-]', '_', account)
+    root, ext = os.path.splitext(BUDGET_FILE)
+    return f"{root}-{safe}{ext}"
+
+
+def get_budget(account=None):
+    """Общий на процесс трекер бюджета аккаунта (создается лениво)"""
+    path = budget_path(account)
+    with _budget_lock:
+        if path not in _budgets:
+            _budgets[path] = TwitterBudget(path)
+        return _budgets[path]